@@ -0,0 +1,4 @@
+"""
+性能基准测试工具
+在不访问外部 API 的情况下回放真实问题、压测问答流水线，比较不同版本的吞吐和延迟
+"""
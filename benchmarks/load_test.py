@@ -0,0 +1,425 @@
+"""
+并发压测
+模拟 N 个并发会话（每个会话提问 → 等待回答 → 思考时间 → 再提问）调用行业助手/通用助手流水线，
+按步骤逐级增加并发，报告每一级的延迟-吞吐曲线、错误率和进程 CPU/RSS，并标记饱和点
+（P95 明显劣化、吞吐不再随并发增长或错误率超限的第一级），用于评估单个部署能承载的同时在线用户数
+
+问题按实际检索结果分为意图命中（意图空间直接返回）和知识空间（检索 + 生成）两组，按 --intent-ratio 混合
+
+用法：
+    python -m benchmarks.load_test --steps 1,2,4,8,16 --step-seconds 30 --think-time-ms 3000
+    # 嵌入和LLM走 config.json 中的接口（如 benchmarks.standin_server），同时压测通用助手
+    python -m benchmarks.load_test --backend config --general-ratio 0.2 --json load.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils import setup_project_path
+
+setup_project_path()
+
+from llama_index.core import QueryBundle
+
+from config.load_key import get_config
+from src.feedback import FeedbackStore, local_now
+from src.llm import get_llm_service
+from src.retriever import RAGManager
+from benchmarks.replay import sample_questions
+from benchmarks.pipeline import (
+    add_standin_arguments, copy_chroma_db, create_offline_rag_manager, run_industry_request, run_general_request,
+    cache_counters, cache_hit_rates, summarize, format_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+# 意图空间文件中的问答对格式（与"意图空间"页面的解析规则一致）
+QA_PATTERN = re.compile(r'Q:\s*(.*?)\nA:\s*(.*?)(?=\nQ:|$)', re.DOTALL)
+
+# 资源采样间隔（秒）
+SAMPLE_INTERVAL_SECONDS = 0.5
+
+
+def load_intent_questions(intent_space_dir: str) -> List[str]:
+    """
+    读取意图空间文件中的问题
+
+    Args:
+        intent_space_dir: 意图空间目录（Q:/A: 格式的 .txt 文件）
+
+    Returns:
+        List[str]: 问题列表
+    """
+    questions = []
+    if not os.path.isdir(intent_space_dir):
+        return questions
+    for file_name in sorted(os.listdir(intent_space_dir)):
+        if file_name.endswith(".txt"):
+            with open(os.path.join(intent_space_dir, file_name), "r", encoding="utf-8") as f:
+                questions.extend(question.strip() for question, _ in QA_PATTERN.findall(f.read()))
+    return [question for question in questions if question]
+
+
+def classify_questions(
+    rag_manager: RAGManager, questions: List[str], k_intent: int, intent_threshold: float
+) -> Tuple[List[str], List[str]]:
+    """
+    按意图空间检索结果把问题分为意图命中和知识空间两组
+
+    直接调用嵌入模型和意图检索器，不经过 RAGManager 的查询向量缓存，压测开始时缓存仍为空
+
+    Args:
+        rag_manager: RAG管理器
+        questions: 候选问题（去重后检索）
+        k_intent: 意图空间检索数量
+        intent_threshold: 意图空间相似度阈值
+
+    Returns:
+        Tuple[List[str], List[str]]: (意图命中的问题, 走知识空间的问题)
+    """
+    intent_hits, knowledge_misses = [], []
+    if rag_manager.intent_index is None:
+        return intent_hits, list(dict.fromkeys(questions))
+    retriever = rag_manager.intent_index.as_retriever(similarity_top_k=k_intent)
+    for question in dict.fromkeys(questions):
+        try:
+            embedding = rag_manager.embed_model.get_query_embedding(question)
+            nodes = retriever.retrieve(QueryBundle(query_str=question, embedding=embedding))
+        except Exception as e:
+            logger.warning(f"问题分类失败，跳过: {question[:30]} ({e})")
+            continue
+        score = (nodes[0].score or 0.0) if nodes else 0.0
+        (intent_hits if score >= intent_threshold else knowledge_misses).append(question)
+    return intent_hits, knowledge_misses
+
+
+def _rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（Linux 读取 /proc，其他平台返回峰值 RSS）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 单位为字节，Linux 为 KB
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, ValueError):
+        return None
+
+
+class ProcessSampler:
+    """在后台线程中定期采样进程 RSS，结束时计算这段时间的 CPU 使用率"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._rss: List[int] = []
+        self._started = 0.0
+        self._cpu_started = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = _rss_bytes()
+        if rss is not None:
+            self._rss.append(rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "ProcessSampler":
+        self._started = time.perf_counter()
+        self._cpu_started = sum(os.times()[:2])
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="load-test-sampler")
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        """
+        停止采样
+
+        Returns:
+            dict: cpu_percent（进程 CPU 时间 / 墙钟时间，多核时可超过 100）, rss_mb_max, rss_mb_end
+        """
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        elapsed = time.perf_counter() - self._started
+        cpu = sum(os.times()[:2]) - self._cpu_started
+        return {
+            "cpu_percent": round(cpu / elapsed * 100, 1) if elapsed > 0 else None,
+            "rss_mb_max": round(max(self._rss) / 1024 / 1024, 1) if self._rss else None,
+            "rss_mb_end": round(self._rss[-1] / 1024 / 1024, 1) if self._rss else None,
+        }
+
+
+class QuestionMix:
+    """按比例抽取问题：general_ratio 的请求走通用助手，其余行业助手请求中 intent_ratio 取意图命中问题"""
+
+    def __init__(self, intent_hits: List[str], knowledge_misses: List[str], intent_ratio: float, general_ratio: float):
+        self.intent_hits = intent_hits
+        self.knowledge_misses = knowledge_misses
+        self.intent_ratio = intent_ratio if knowledge_misses else 1.0
+        if not intent_hits:
+            self.intent_ratio = 0.0
+        self.general_ratio = general_ratio
+
+    def pick(self, rng: random.Random) -> Tuple[str, str]:
+        """
+        Returns:
+            Tuple[str, str]: (助手类型 "industry" / "general", 问题)
+        """
+        assistant = "general" if rng.random() < self.general_ratio else "industry"
+        pool = self.intent_hits if rng.random() < self.intent_ratio else self.knowledge_misses
+        return assistant, rng.choice(pool)
+
+
+def run_step(
+    concurrency: int,
+    duration: float,
+    think_time_ms: float,
+    mix: QuestionMix,
+    rag_manager: RAGManager,
+    args: argparse.Namespace,
+    seed: int,
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    以固定并发运行一级压测：每个会话在 duration 秒内循环"提问 → 等待回答 → 思考时间"
+
+    思考时间服从均值为 think_time_ms 的指数分布；截止时间前发出的请求都会等待完成并计入本级结果
+
+    Returns:
+        Tuple[List[dict], float]: (请求结果列表, 本级墙钟时间秒)
+    """
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def session(index: int) -> None:
+        rng = random.Random(seed * 100003 + index)
+        # 错开各会话的第一次请求，避免所有会话同时发起
+        if think_time_ms > 0:
+            time.sleep(min(rng.uniform(0, think_time_ms / 1000.0), max(0.0, deadline - time.perf_counter())))
+        while time.perf_counter() < deadline:
+            assistant, question = mix.pick(rng)
+            if assistant == "general":
+                result = run_general_request(question)
+            else:
+                result = run_industry_request(
+                    rag_manager, question, generate=True, k_intent=args.k_intent,
+                    k_knowledge=args.k_knowledge, intent_threshold=args.intent_threshold,
+                )
+            result["assistant"] = assistant
+            result["session"] = index
+            result["offset_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            with lock:
+                results.append(result)
+            if think_time_ms > 0:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                time.sleep(min(rng.expovariate(1000.0 / think_time_ms), remaining))
+
+    threads = [
+        threading.Thread(target=session, args=(index,), daemon=True, name=f"load-test-session-{index}")
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def saturation_reasons(
+    step: Dict[str, Any],
+    baseline: Dict[str, Any],
+    previous: Optional[Dict[str, Any]],
+    p95_factor: float,
+    min_throughput_gain: float,
+    max_error_rate: float,
+) -> List[str]:
+    """
+    判断某一级是否已饱和
+
+    Args:
+        step: 本级汇总
+        baseline: 第一级汇总（P95 基线）
+        previous: 上一级汇总
+        p95_factor: P95 超过基线的倍数视为劣化
+        min_throughput_gain: 并发增加后吞吐增幅低于该比例视为不再增长
+        max_error_rate: 错误率上限
+
+    Returns:
+        List[str]: 饱和原因，为空表示未饱和
+    """
+    reasons = []
+    p95, baseline_p95 = step["latency_ms"]["p95"], baseline["latency_ms"]["p95"]
+    if p95 is not None and baseline_p95 and step is not baseline and p95 > baseline_p95 * p95_factor:
+        reasons.append(f"P95 {p95:.0f}ms 超过基线 {baseline_p95:.0f}ms 的 {p95_factor:g} 倍")
+    if previous is not None:
+        throughput, previous_throughput = step["throughput_rps"] or 0.0, previous["throughput_rps"] or 0.0
+        if throughput < previous_throughput * (1 + min_throughput_gain):
+            reasons.append(f"吞吐 {throughput:.2f} req/s 相比上一级 {previous_throughput:.2f} req/s "
+                           f"增幅不足 {min_throughput_gain:.0%}")
+    if step["error_rate"] > max_error_rate:
+        reasons.append(f"错误率 {step['error_rate']:.1%} 超过 {max_error_rate:.1%}")
+    return reasons
+
+
+def format_curve(steps: List[Dict[str, Any]], saturated_at: Optional[int]) -> str:
+    """将各级汇总格式化为延迟-吞吐曲线表格，饱和的一级用 ◀ 标记"""
+    header = f"{'并发':>6}{'请求数':>8}{'吞吐req/s':>11}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'错误率':>8}{'意图命中':>9}{'CPU%':>8}{'RSS MB':>9}"
+    lines = [header]
+    for step in steps:
+        latency = step["latency_ms"]
+        cells = [
+            f"{step['concurrency']:>6}",
+            f"{step['requests']:>8}",
+            f"{step['throughput_rps'] or 0:>11.2f}",
+        ] + [f"{latency[key]:>9.0f}" if latency[key] is not None else f"{'-':>9}" for key in ("p50", "p95", "p99")] + [
+            f"{step['error_rate']:>8.1%}",
+            f"{step['intent_hit_rate']:>9.1%}" if step["intent_hit_rate"] is not None else f"{'-':>9}",
+            f"{step['process']['cpu_percent'] or 0:>8.1f}",
+            f"{step['process']['rss_mb_max'] or 0:>9.1f}",
+        ]
+        marker = "  ◀ 饱和" if step["concurrency"] == saturated_at else ""
+        lines.append("".join(cells) + marker)
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    rag_config = get_config().get("rag", {})
+    parser = argparse.ArgumentParser(description="逐级增加并发压测问答流水线，报告延迟-吞吐曲线和饱和点")
+    parser.add_argument("--steps", default="1,2,4,8,16", help="各级并发会话数，逗号分隔")
+    parser.add_argument("--step-seconds", type=float, default=30.0, help="每级持续时间（秒）")
+    parser.add_argument("--think-time-ms", type=float, default=3000.0, help="会话两次提问之间的平均思考时间，0 表示不等待")
+    parser.add_argument("--intent-ratio", type=float, default=0.5, help="行业助手请求中意图命中问题的比例")
+    parser.add_argument("--general-ratio", type=float, default=0.0, help="走通用助手的请求比例（需要可用的LLM提供商）")
+    parser.add_argument("--backend", choices=["standins", "config"], default="standins",
+                        help="standins: 进程内替身嵌入/LLM；config: 使用 config.json 中的接口（可指向 benchmarks.standin_server）")
+    parser.add_argument("--db", default="./data/feedback.db", help="反馈数据库路径（历史问题和已保存的问题向量）")
+    parser.add_argument("--limit", type=int, default=200, help="最多使用的历史问题数，0 表示全部")
+    parser.add_argument("--questions", help="额外的候选问题文件（每行一个问题）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--k-intent", type=int, default=rag_config.get("default_k_intent", 1))
+    parser.add_argument("--k-knowledge", type=int, default=rag_config.get("default_k_knowledge", 3))
+    parser.add_argument("--intent-threshold", type=float, default=rag_config.get("default_intent_threshold", 0.85))
+    parser.add_argument("--p95-factor", type=float, default=2.0, help="P95 超过第一级的倍数视为劣化")
+    parser.add_argument("--min-throughput-gain", type=float, default=0.1, help="吞吐增幅低于该比例视为不再增长")
+    parser.add_argument("--max-error-rate", type=float, default=0.05, help="错误率上限")
+    parser.add_argument("--keep-going", action="store_true", help="达到饱和后继续执行剩余各级（默认停止）")
+    parser.add_argument("--json", dest="json_path", help="将参数、各级汇总和每条请求的结果写入该 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="输出流水线的 INFO 日志")
+    add_standin_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    try:
+        steps = [int(value) for value in args.steps.split(",") if value.strip()]
+    except ValueError:
+        parser.error(f"--steps 格式错误: {args.steps}")
+    if not steps or min(steps) < 1:
+        parser.error("--steps 至少包含一个正整数")
+    if args.general_ratio > 0 and not get_llm_service().is_available():
+        print("通用助手请求需要可用的LLM提供商：在 config.json 中配置 API 密钥，或把 models.*.base_url 指向 benchmarks.standin_server")
+        return 1
+
+    store = FeedbackStore(args.db)
+    candidates = load_intent_questions(rag_config.get("intent_space_dir", "./rag_source/intent_space"))
+    candidates += sample_questions(store, args.limit)
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            candidates += [line.strip() for line in f if line.strip()]
+    if not candidates:
+        print("没有候选问题：意图空间、反馈数据库和 --questions 均为空")
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        if args.backend == "standins":
+            rag_manager = create_offline_rag_manager(args, store, workdir)
+        else:
+            rag_manager = RAGManager(chroma_db_path=copy_chroma_db(args, workdir))
+        if rag_manager.knowledge_index is None:
+            print(f"知识空间索引不可用: {rag_manager.embed_error_msg}")
+            return 1
+
+        intent_hits, knowledge_misses = classify_questions(
+            rag_manager, candidates, args.k_intent, args.intent_threshold
+        )
+        if not intent_hits and not knowledge_misses:
+            print("所有候选问题分类失败，请检查嵌入接口")
+            return 1
+        mix = QuestionMix(intent_hits, knowledge_misses, args.intent_ratio, args.general_ratio)
+        print(f"候选问题: 意图命中 {len(intent_hits)} 个，知识空间 {len(knowledge_misses)} 个；"
+              f"实际意图比例 {mix.intent_ratio:.0%}，通用助手比例 {args.general_ratio:.0%}")
+        if args.intent_ratio > 0 and not intent_hits:
+            print("没有问题命中意图空间（替身哈希向量与索引不在同一向量空间），所有行业助手请求都走知识空间")
+
+        summaries: List[Dict[str, Any]] = []
+        all_results: List[Dict[str, Any]] = []
+        saturated_at: Optional[int] = None
+        for index, concurrency in enumerate(steps):
+            print(f"\n并发 {concurrency}：运行 {args.step_seconds:g}s ...", flush=True)
+            before = cache_counters()
+            sampler = ProcessSampler().start()
+            results, elapsed = run_step(
+                concurrency, args.step_seconds, args.think_time_ms, mix, rag_manager, args, args.seed + index
+            )
+            summary = summarize(results, elapsed)
+            summary["concurrency"] = concurrency
+            summary["process"] = sampler.stop()
+            summary["cache"] = cache_hit_rates(before, cache_counters())
+            summary["saturation_reasons"] = saturation_reasons(
+                summary, summaries[0] if summaries else summary, summaries[-1] if summaries else None,
+                args.p95_factor, args.min_throughput_gain, args.max_error_rate,
+            )
+            summaries.append(summary)
+            for result in results:
+                result["concurrency"] = concurrency
+            all_results.extend(results)
+            print(format_summary(summary))
+            if summary["saturation_reasons"] and saturated_at is None:
+                saturated_at = concurrency
+                print("已饱和: " + "；".join(summary["saturation_reasons"]))
+                if not args.keep_going:
+                    break
+
+    print("\n延迟-吞吐曲线")
+    print(format_curve(summaries, saturated_at))
+    if saturated_at is None:
+        print(f"\n直到并发 {steps[-1]} 仍未饱和，可增加 --steps 继续测试")
+        sustainable = steps[-1]
+    else:
+        saturated_index = steps.index(saturated_at)
+        sustainable = steps[saturated_index - 1] if saturated_index > 0 else None
+        print(f"\n饱和点: 并发 {saturated_at}；最大可持续并发: {sustainable if sustainable is not None else '不足第一级'}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": local_now(),
+                "args": vars(args),
+                "saturation": {"concurrency": saturated_at, "max_sustainable_concurrency": sustainable},
+                "steps": summaries,
+                "results": all_results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
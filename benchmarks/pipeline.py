@@ -0,0 +1,295 @@
+"""
+无界面问答流水线
+用与问答页面相同的助手处理函数执行单次请求（页面占位符换成空实现），并汇总延迟分位数、路径和缓存命中率，
+供离线回放（replay）和并发压测（load_test）共用
+"""
+import os
+import shutil
+import argparse
+from typing import Any, Dict, List, Optional
+
+from src.utils import setup_project_path
+
+setup_project_path()
+
+from config.load_key import get_config
+from src.feedback import FeedbackStore
+from src.llm_metrics import percentile
+from src.retriever import RAGManager, QUERY_EMBEDDING_CACHE, QUERY_ENGINE_CACHE
+from src.industry_assistant import handle_industry_assistant
+from src.general_assistant import handle_general_assistant
+from src.request_timer import (
+    RequestTimer, STAGE_ORDER, STAGE_EMBEDDING, STAGE_INTENT_RETRIEVAL, STAGE_KNOWLEDGE_RETRIEVAL,
+    PATH_INTENT, PATH_KNOWLEDGE,
+)
+from benchmarks.standins import (
+    StandInEmbedding, StandInLLM, load_stored_query_vectors,
+    DEFAULT_EMBEDDING_DIM, DEFAULT_FIRST_TOKEN_MS, DEFAULT_TOKENS_PER_SECOND, DEFAULT_OUTPUT_TOKENS,
+)
+
+# 助手处理函数出错时不抛出异常，而是返回以这些前缀开头的提示文本
+ERROR_RESPONSE_PREFIXES = ("抱歉", "⚠️", "❌")
+
+# 报告中的分位数
+REPORT_PERCENTILES = (50, 90, 95, 99)
+
+
+class HeadlessPlaceholder:
+    """代替 st.empty() 占位符：丢弃渲染内容，只保留最后一次写入的文本"""
+
+    def __init__(self):
+        self.text = ""
+
+    def markdown(self, body: str, *args: Any, **kwargs: Any) -> None:
+        self.text = body
+
+    def empty(self) -> None:
+        self.text = ""
+
+
+def add_standin_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加本地替身和索引相关的命令行参数（replay 与 load_test 共用）"""
+    group = parser.add_argument_group("本地替身")
+    group.add_argument("--chroma-db", default=None, help="Chroma 数据库目录（默认 config.json 的 rag.chroma_db_path），测试时使用其副本")
+    group.add_argument("--embedding-dim", type=int, default=DEFAULT_EMBEDDING_DIM, help="替身向量维度，须与索引一致")
+    group.add_argument("--embedding-latency-ms", type=float, default=0.0, help="替身嵌入接口的模拟延迟")
+    group.add_argument("--no-stored-vectors", action="store_true", help="不使用交互记录中保存的真实问题向量，全部使用哈希向量")
+    group.add_argument("--first-token-ms", type=float, default=DEFAULT_FIRST_TOKEN_MS, help="替身LLM首字延迟")
+    group.add_argument("--tokens-per-second", type=float, default=DEFAULT_TOKENS_PER_SECOND, help="替身LLM输出速度")
+    group.add_argument("--output-tokens", type=int, default=DEFAULT_OUTPUT_TOKENS, help="替身LLM每次输出的token数")
+
+
+def copy_chroma_db(args: argparse.Namespace, workdir: str) -> str:
+    """将 Chroma 数据库（--chroma-db 或 rag.chroma_db_path）复制到 workdir，返回副本路径"""
+    source = args.chroma_db or get_config().get("rag", {}).get("chroma_db_path", "./data/chroma_db")
+    chroma_copy = os.path.join(workdir, "chroma_db")
+    if os.path.isdir(source):
+        shutil.copytree(source, chroma_copy)
+    return chroma_copy
+
+
+def create_offline_rag_manager(args: argparse.Namespace, store: FeedbackStore, workdir: str) -> RAGManager:
+    """
+    用本地替身创建 RAGManager（索引使用 Chroma 数据库的副本，测试不会修改原数据库）
+
+    Args:
+        args: 包含 add_standin_arguments() 参数的命令行参数
+        store: 反馈数据库（读取已保存的问题向量）
+        workdir: 存放 Chroma 副本的临时目录
+
+    Returns:
+        RAGManager: embed_model 为 StandInEmbedding、llm 为 StandInLLM 的管理器
+    """
+    chroma_copy = copy_chroma_db(args, workdir)
+    known_vectors = {} if args.no_stored_vectors else load_stored_query_vectors(store, args.embedding_dim)
+    embed_model = StandInEmbedding(
+        dim=args.embedding_dim, latency_ms=args.embedding_latency_ms, known_vectors=known_vectors
+    )
+    llm = StandInLLM(
+        first_token_ms=args.first_token_ms, tokens_per_second=args.tokens_per_second, output_tokens=args.output_tokens
+    )
+    return RAGManager(chroma_db_path=chroma_copy, embed_model=embed_model, llm=llm)
+
+
+def _result(question: str, timer: RequestTimer, response: str, error: Optional[str], **extra: Any) -> Dict[str, Any]:
+    timings = timer.as_dict()
+    result = {
+        "question": question,
+        "path": timings["path"],
+        "latency_ms": timings["stages"].pop("total"),
+        "stages": timings["stages"],
+        "response_chars": len(response),
+        "error": error,
+    }
+    result.update(extra)
+    return result
+
+
+def run_industry_request(
+    rag_manager: RAGManager,
+    question: str,
+    generate: bool = True,
+    k_intent: int = 1,
+    k_knowledge: int = 3,
+    intent_threshold: float = 0.85,
+) -> Dict[str, Any]:
+    """
+    执行一次行业助手请求
+
+    Args:
+        rag_manager: RAG管理器
+        question: 用户问题
+        generate: True 时走完整的 handle_industry_assistant（含LLM生成）；
+                  False 时只执行查询向量、意图检索和（未命中时的）知识检索
+        k_intent: 意图空间检索数量
+        k_knowledge: 知识空间检索数量
+        intent_threshold: 意图空间相似度阈值
+
+    Returns:
+        dict: question, path, latency_ms, stages（{阶段: 毫秒}）, response_chars, error, intent_hit, intent_score
+    """
+    timer = RequestTimer()
+    if generate:
+        try:
+            response, _, _, intent_hit, intent_score = handle_industry_assistant(
+                rag_manager=rag_manager,
+                prompt=question,
+                message_placeholder=HeadlessPlaceholder(),
+                thinking_placeholder=None,
+                k_intent=k_intent,
+                k_knowledge=k_knowledge,
+                intent_threshold=intent_threshold,
+                show_thinking=False,
+                timer=timer,
+            )
+        except Exception as e:
+            return _result(question, timer, "", f"{type(e).__name__}: {e}", intent_hit=False, intent_score=0.0)
+        error = response[:100] if response.startswith(ERROR_RESPONSE_PREFIXES) else None
+        return _result(question, timer, response, error, intent_hit=intent_hit, intent_score=intent_score)
+
+    # 只检索：步骤与 handle_industry_assistant 相同，但知识空间只检索不生成
+    intent_score = 0.0
+    try:
+        with timer.stage(STAGE_EMBEDDING):
+            query_bundle = rag_manager.get_query_bundle(question)
+        if rag_manager.intent_index is not None:
+            with timer.stage(STAGE_INTENT_RETRIEVAL):
+                nodes = rag_manager.intent_index.as_retriever(similarity_top_k=k_intent).retrieve(query_bundle)
+            if nodes:
+                intent_score = nodes[0].score or 0.0
+        intent_hit = intent_score >= intent_threshold
+        timer.set_path(PATH_INTENT if intent_hit else PATH_KNOWLEDGE)
+        if not intent_hit:
+            # 知识空间步骤会再次取查询向量（命中 RAGManager 的查询向量缓存）
+            with timer.stage(STAGE_EMBEDDING):
+                query_bundle = rag_manager.get_query_bundle(question)
+            query_engine = rag_manager.get_knowledge_query_engine(
+                streaming=True, similarity_top_k=k_knowledge, llm_provider=rag_manager.choose_llm_provider()
+            )
+            with timer.stage(STAGE_KNOWLEDGE_RETRIEVAL):
+                query_engine.retrieve(query_bundle)
+    except Exception as e:
+        return _result(question, timer, "", f"{type(e).__name__}: {e}", intent_hit=False, intent_score=intent_score)
+    return _result(question, timer, "", None, intent_hit=intent_hit, intent_score=intent_score)
+
+
+def run_general_request(question: str) -> Dict[str, Any]:
+    """
+    执行一次通用助手请求（直接调用 config.json 中配置的LLM提供商，压测时可指向 standin_server）
+
+    Args:
+        question: 用户问题
+
+    Returns:
+        dict: question, path, latency_ms, stages（{阶段: 毫秒}）, response_chars, error
+    """
+    timer = RequestTimer()
+    try:
+        response, _, _ = handle_general_assistant(
+            prompt=question,
+            message_placeholder=HeadlessPlaceholder(),
+            thinking_placeholder=None,
+            show_thinking=False,
+            timer=timer,
+        )
+    except Exception as e:
+        return _result(question, timer, "", f"{type(e).__name__}: {e}")
+    error = response[:100] if response.startswith(ERROR_RESPONSE_PREFIXES) else None
+    return _result(question, timer, response, error)
+
+
+def cache_counters() -> Dict[str, Dict[tuple, float]]:
+    """当前的检索缓存计数（与之后的值相减得到本次测试的命中次数）"""
+    return {"query_embedding": QUERY_EMBEDDING_CACHE.values(), "query_engine": QUERY_ENGINE_CACHE.values()}
+
+
+def cache_hit_rates(before: Dict[str, Dict[tuple, float]], after: Dict[str, Dict[tuple, float]]) -> Dict[str, Dict[str, Any]]:
+    """
+    按前后两次 cache_counters() 的差值计算命中率
+
+    Returns:
+        dict: {缓存名称: {"hits", "misses", "hit_rate"}}
+    """
+    rates = {}
+    for cache, counts in after.items():
+        hits = misses = 0.0
+        for key, value in counts.items():
+            delta = value - before.get(cache, {}).get(key, 0.0)
+            # 标签的最后一项为 hit / miss
+            if key[-1] == "hit":
+                hits += delta
+            else:
+                misses += delta
+        total = hits + misses
+        rates[cache] = {"hits": int(hits), "misses": int(misses), "hit_rate": round(hits / total, 4) if total else None}
+    return rates
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """
+    汇总一组请求结果
+
+    Args:
+        results: run_*_request 的返回值列表
+        elapsed: 这组请求的墙钟时间（秒）
+
+    Returns:
+        dict: requests, errors, error_rate, throughput_rps, latency_ms（分位数）, stages_ms（各阶段分位数）,
+              paths（各路径请求数）, intent_hit_rate
+    """
+    ok = [result for result in results if not result["error"]]
+    latencies = [result["latency_ms"] for result in ok]
+    stage_values: Dict[str, List[float]] = {}
+    for result in ok:
+        for stage, ms in result["stages"].items():
+            stage_values.setdefault(stage, []).append(ms)
+    paths: Dict[str, int] = {}
+    for result in results:
+        paths[result["path"] or "unknown"] = paths.get(result["path"] or "unknown", 0) + 1
+    intent_results = [result for result in results if "intent_hit" in result]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {
+            stage: _percentiles(stage_values[stage])
+            for stage in sorted(stage_values, key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER))
+        },
+        "paths": paths,
+        "intent_hit_rate": (
+            round(sum(1 for result in intent_results if result["intent_hit"]) / len(intent_results), 4)
+            if intent_results else None
+        ),
+    }
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    summary = {f"p{p}": percentile(values, p) for p in REPORT_PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 2) if values else None
+    summary["max"] = max(values) if values else None
+    return summary
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """将 summarize() 的结果格式化为文本表格"""
+
+    def row(name: str, stats: Dict[str, Optional[float]]) -> str:
+        cells = [f"{stats[key]:>9.1f}" if stats[key] is not None else f"{'-':>9}"
+                 for key in [f"p{p}" for p in REPORT_PERCENTILES] + ["mean", "max"]]
+        return f"  {name:<22}" + "".join(cells)
+
+    lines = [
+        f"请求数: {summary['requests']}  错误: {summary['errors']} ({summary['error_rate']:.1%})  "
+        f"耗时: {summary['elapsed_seconds']:.1f}s  吞吐: {summary['throughput_rps'] or 0:.2f} req/s",
+        "路径: " + ", ".join(f"{path}={count}" for path, count in sorted(summary["paths"].items())),
+    ]
+    if summary["intent_hit_rate"] is not None:
+        lines.append(f"意图命中率: {summary['intent_hit_rate']:.1%}")
+    lines.append(f"  {'阶段 (ms)':<20}" + "".join(f"{key:>9}" for key in [f"p{p}" for p in REPORT_PERCENTILES] + ["mean", "max"]))
+    lines.append(row("total", summary["latency_ms"]))
+    for stage, stats in summary["stages_ms"].items():
+        lines.append(row(stage, stats))
+    return "\n".join(lines)
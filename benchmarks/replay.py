@@ -0,0 +1,118 @@
+"""
+离线回放基准测试
+从反馈数据库抽取历史问题，用本地替身（嵌入、LLM）和 Chroma 索引副本按指定并发回放，
+报告吞吐、各阶段延迟分位数、意图命中率和检索缓存命中率，用于在真实流量分布上比较不同版本
+
+用法：
+    python -m benchmarks.replay --limit 500 --concurrency 4
+    python -m benchmarks.replay --generate --first-token-ms 300 --json replay.json
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from src.utils import setup_project_path
+
+setup_project_path()
+
+from config.load_key import get_config
+from src.feedback import FeedbackStore, local_now
+from benchmarks.pipeline import (
+    add_standin_arguments, create_offline_rag_manager, run_industry_request,
+    cache_counters, cache_hit_rates, summarize, format_summary,
+)
+
+
+def sample_questions(store: FeedbackStore, limit: int, shuffle: bool = False, seed: int = 0) -> List[str]:
+    """
+    抽取历史问题（保留重复问题，重复比例即真实流量中的缓存命中机会）
+
+    Args:
+        store: 反馈数据库
+        limit: 最多抽取的问题数，0 表示全部
+        shuffle: False 时取最近的 limit 条并按提问时间顺序回放；True 时随机抽取并打乱顺序
+        seed: 随机种子
+
+    Returns:
+        List[str]: 问题列表
+    """
+    questions = [row["question"] for row in reversed(store.get_all_interactions()) if (row["question"] or "").strip()]
+    if shuffle:
+        questions = random.Random(seed).sample(questions, min(limit, len(questions)) if limit else len(questions))
+    elif limit:
+        questions = questions[-limit:]
+    return questions
+
+
+def main(argv=None) -> int:
+    rag_config = get_config().get("rag", {})
+    parser = argparse.ArgumentParser(description="用历史问题离线回放问答流水线")
+    parser.add_argument("--db", default="./data/feedback.db", help="反馈数据库路径")
+    parser.add_argument("--limit", type=int, default=200, help="回放的问题数，0 表示全部")
+    parser.add_argument("--shuffle", action="store_true", help="随机抽取问题（默认按时间顺序取最近的问题）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数")
+    parser.add_argument("--generate", action="store_true", help="执行完整的行业助手流程（含替身LLM生成），默认只检索")
+    parser.add_argument("--k-intent", type=int, default=rag_config.get("default_k_intent", 1))
+    parser.add_argument("--k-knowledge", type=int, default=rag_config.get("default_k_knowledge", 3))
+    parser.add_argument("--intent-threshold", type=float, default=rag_config.get("default_intent_threshold", 0.85))
+    parser.add_argument("--json", dest="json_path", help="将参数、汇总结果和每条请求的结果写入该 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="输出流水线的 INFO 日志")
+    add_standin_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    store = FeedbackStore(args.db)
+    questions = sample_questions(store, args.limit, args.shuffle, args.seed)
+    if not questions:
+        print(f"{args.db} 中没有可回放的问题")
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        rag_manager = create_offline_rag_manager(args, store, workdir)
+        if rag_manager.knowledge_index is None:
+            print(f"知识空间索引不可用: {rag_manager.embed_error_msg}")
+            return 1
+
+        print(f"回放 {len(questions)} 个问题（{len(set(questions))} 个不同问题），并发 {args.concurrency}，"
+              f"{'完整生成' if args.generate else '只检索'}")
+        before = cache_counters()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(
+                lambda question: run_industry_request(
+                    rag_manager, question, generate=args.generate, k_intent=args.k_intent,
+                    k_knowledge=args.k_knowledge, intent_threshold=args.intent_threshold,
+                ),
+                questions,
+            ))
+        elapsed = time.perf_counter() - started
+        summary = summarize(results, elapsed)
+        summary["cache"] = cache_hit_rates(before, cache_counters())
+        summary["embedding_sources"] = rag_manager.embed_model.counts
+
+    print(format_summary(summary))
+    for cache, stats in summary["cache"].items():
+        hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "-"
+        print(f"缓存 {cache}: 命中 {stats['hits']} / 未命中 {stats['misses']}（命中率 {hit_rate}）")
+    sources = summary["embedding_sources"]
+    print(f"查询向量来源: 已保存的真实向量 {sources['stored']}，哈希向量 {sources['hashed']}"
+          f"（哈希向量与索引不在同一向量空间，这部分问题不会命中意图空间）")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": local_now(), "args": vars(args), "summary": summary, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
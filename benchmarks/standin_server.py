@@ -0,0 +1,318 @@
+"""
+本地替身服务器
+在没有网络和 API 密钥的机器上代替 LLM 和嵌入接口，用于端到端压测 RAGManager 和 LLMService：
+- OpenAI 兼容的 /v1/chat/completions：按首字延迟和输出速度流式（SSE）或一次性返回固定文本
+- DashScope 兼容的文本嵌入接口（/api/v1/services/embeddings/text-embedding/text-embedding）
+  和 OpenAI 兼容的 /v1/embeddings：返回按文本哈希生成的确定性向量（有保存的真实问题向量时优先使用）
+两类接口都可配置延迟和按比例注入错误。将 config.json 中提供商的 base_url 指向本服务器即可：
+    models.<提供商>.base_url = "http://127.0.0.1:9200/v1"
+    embedding.base_url = "http://127.0.0.1:9200/api/v1"
+
+用法：
+    python -m benchmarks.standin_server --port 9200 --first-token-ms 400 --tokens-per-second 40
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from src.utils import setup_project_path
+
+setup_project_path()
+
+from src.feedback import FeedbackStore
+from benchmarks.standins import (
+    hash_embedding, standin_tokens, load_stored_query_vectors,
+    DEFAULT_EMBEDDING_DIM, DEFAULT_FIRST_TOKEN_MS, DEFAULT_TOKENS_PER_SECOND, DEFAULT_OUTPUT_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 替身服务器默认参数
+DEFAULT_STANDIN_SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 9200,
+    "first_token_ms": DEFAULT_FIRST_TOKEN_MS,  # 流式响应首个token前的等待时间
+    "tokens_per_second": DEFAULT_TOKENS_PER_SECOND,  # 之后的输出速度
+    "output_tokens": DEFAULT_OUTPUT_TOKENS,  # 每次输出的token数（请求的 max_tokens 更小时取 max_tokens）
+    "chat_error_rate": 0.0,  # chat 请求返回错误的比例
+    "embedding_dim": DEFAULT_EMBEDDING_DIM,
+    "embedding_latency_ms": 50.0,  # 每次嵌入请求的延迟
+    "embedding_error_rate": 0.0,  # 嵌入请求返回错误的比例
+    "error_status": 500,  # 注入错误时的 HTTP 状态码（429 可模拟限流）
+}
+
+DASHSCOPE_EMBEDDING_PATH = "/services/embeddings/text-embedding/text-embedding"
+
+
+class StandInServer:
+    """
+    替身服务器（ThreadingHTTPServer，每个请求一个线程，流式响应在线程内 sleep）
+
+    用法：
+        server = StandInServer({"port": 0}).start()
+        ...  # server.llm_base_url / server.embedding_base_url
+        server.stop()
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, known_vectors: Optional[Dict[str, List[float]]] = None):
+        self.config = dict(DEFAULT_STANDIN_SERVER_CONFIG)
+        self.config.update(config or {})
+        self.known_vectors = known_vectors or {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def llm_base_url(self) -> str:
+        """填入 models.<提供商>.base_url 的地址"""
+        return f"{self.address}/v1"
+
+    @property
+    def embedding_base_url(self) -> str:
+        """填入 embedding.base_url 的地址"""
+        return f"{self.address}/api/v1"
+
+    def count(self, event: str) -> None:
+        with self._lock:
+            self._counts[event] = self._counts.get(event, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        """各接口的请求数和注入的错误数"""
+        with self._lock:
+            return dict(self._counts)
+
+    def start(self) -> "StandInServer":
+        """在后台线程中启动服务器（port 为 0 时自动分配端口）"""
+        self._httpd = ThreadingHTTPServer((self.config["host"], int(self.config["port"])), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True, name="standin-server")
+        self._thread.start()
+        logger.info(f"替身服务器已启动: {self.address}")
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def inject_error(self, kind: str) -> bool:
+        """按配置的比例决定本次请求是否返回错误"""
+        rate = float(self.config[f"{kind}_error_rate"])
+        if rate > 0 and random.random() < rate:
+            self.count(f"{kind}_errors")
+            return True
+        return False
+
+    def embed(self, text: str) -> List[float]:
+        vector = self.known_vectors.get(text)
+        if vector is None or len(vector) != self.config["embedding_dim"]:
+            vector = hash_embedding(text, int(self.config["embedding_dim"]))
+        return vector
+
+
+def _make_handler(server: StandInServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持 keep-alive，与真实接口一样复用连接池
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("", "/health"):
+                self._send_json(200, {"status": "ok", "stats": server.stats()})
+            elif self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "standin-llm", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+
+        def do_POST(self):
+            try:
+                body = self._read_json()
+            except ValueError:
+                self._send_json(400, {"error": {"message": "请求体不是合法的 JSON"}})
+                return
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path.endswith("/chat/completions"):
+                self._chat_completions(body)
+            elif path.endswith(DASHSCOPE_EMBEDDING_PATH):
+                self._dashscope_embeddings(body)
+            elif path.endswith("/embeddings"):
+                self._openai_embeddings(body)
+            else:
+                self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+
+        # --- chat completions ---
+
+        def _chat_completions(self, body: Dict[str, Any]) -> None:
+            server.count("chat_requests")
+            config = server.config
+            if server.inject_error("chat"):
+                self._send_json(config["error_status"], {"error": {
+                    "message": "standin injected error", "type": "server_error", "code": config["error_status"]}})
+                return
+            output_tokens = int(config["output_tokens"])
+            if body.get("max_tokens"):
+                output_tokens = min(output_tokens, int(body["max_tokens"]))
+            tokens = standin_tokens(output_tokens)
+            prompt_tokens = sum(len(str(message.get("content") or "")) for message in body.get("messages", []))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            model = body.get("model") or "standin-llm"
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+            interval = 1.0 / config["tokens_per_second"] if config["tokens_per_second"] > 0 else 0.0
+            time.sleep(config["first_token_ms"] / 1000.0)
+
+            if not body.get("stream"):
+                time.sleep(interval * max(0, len(tokens) - 1))
+                self._send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> Dict[str, Any]:
+                data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                data.update(extra)
+                return data
+
+            try:
+                self._write_event(chunk({"role": "assistant", "content": ""}))
+                for index, token in enumerate(tokens):
+                    if index and interval:
+                        time.sleep(interval)
+                    self._write_event(chunk({"content": token}))
+                final_extra = {"usage": usage} if (body.get("stream_options") or {}).get("include_usage") else {}
+                self._write_event(chunk({}, "stop", **final_extra))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开（如对冲请求被取消）
+                server.count("chat_disconnects")
+                self.close_connection = True
+
+        def _write_event(self, data: Dict[str, Any]) -> None:
+            self._write_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        def _write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        # --- embeddings ---
+
+        def _embedding_texts(self, value: Any) -> List[str]:
+            if isinstance(value, str):
+                return [value]
+            return [str(text) for text in value or []]
+
+        def _dashscope_embeddings(self, body: Dict[str, Any]) -> None:
+            server.count("embedding_requests")
+            config = server.config
+            time.sleep(config["embedding_latency_ms"] / 1000.0)
+            request_id = uuid.uuid4().hex
+            if server.inject_error("embedding"):
+                self._send_json(config["error_status"], {
+                    "code": "Throttling" if config["error_status"] == 429 else "InternalError",
+                    "message": "standin injected error", "request_id": request_id})
+                return
+            texts = self._embedding_texts((body.get("input") or {}).get("texts"))
+            self._send_json(200, {
+                "output": {"embeddings": [
+                    {"text_index": index, "embedding": server.embed(text)} for index, text in enumerate(texts)
+                ]},
+                "usage": {"total_tokens": sum(len(text) for text in texts)},
+                "request_id": request_id,
+            })
+
+        def _openai_embeddings(self, body: Dict[str, Any]) -> None:
+            server.count("embedding_requests")
+            config = server.config
+            time.sleep(config["embedding_latency_ms"] / 1000.0)
+            if server.inject_error("embedding"):
+                self._send_json(config["error_status"], {"error": {
+                    "message": "standin injected error", "type": "server_error", "code": config["error_status"]}})
+                return
+            texts = self._embedding_texts(body.get("input"))
+            tokens = sum(len(text) for text in texts)
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"object": "embedding", "index": index, "embedding": server.embed(text)}
+                         for index, text in enumerate(texts)],
+                "model": body.get("model") or "standin-embedding",
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+    return Handler
+
+
+def main(argv=None) -> int:
+    defaults = DEFAULT_STANDIN_SERVER_CONFIG
+    parser = argparse.ArgumentParser(description="OpenAI / DashScope 兼容的本地替身服务器")
+    parser.add_argument("--host", default=defaults["host"])
+    parser.add_argument("--port", type=int, default=defaults["port"])
+    parser.add_argument("--first-token-ms", type=float, default=defaults["first_token_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=defaults["tokens_per_second"])
+    parser.add_argument("--output-tokens", type=int, default=defaults["output_tokens"])
+    parser.add_argument("--chat-error-rate", type=float, default=defaults["chat_error_rate"])
+    parser.add_argument("--embedding-dim", type=int, default=defaults["embedding_dim"])
+    parser.add_argument("--embedding-latency-ms", type=float, default=defaults["embedding_latency_ms"])
+    parser.add_argument("--embedding-error-rate", type=float, default=defaults["embedding_error_rate"])
+    parser.add_argument("--error-status", type=int, default=defaults["error_status"])
+    parser.add_argument("--db", default=None, help="从该反馈数据库读取已保存的问题向量（默认只使用哈希向量）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    config = {key: value for key, value in vars(args).items() if key != "db"}
+    known_vectors = load_stored_query_vectors(FeedbackStore(args.db), args.embedding_dim) if args.db else {}
+    server = StandInServer(config, known_vectors).start()
+    print(f"替身服务器: {server.address}")
+    print(f"  models.<提供商>.base_url = \"{server.llm_base_url}\"")
+    print(f"  embedding.base_url = \"{server.embedding_base_url}\"")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"请求统计: {server.stats()}")
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
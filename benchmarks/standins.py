@@ -0,0 +1,200 @@
+"""
+本地模型替身
+基准测试中代替 DashScope 嵌入接口和 LLM 接口，使测试可以完全离线运行：
+- StandInEmbedding：优先使用交互记录中保存的真实问题向量（与索引同一向量空间，意图命中率接近线上），
+  没有保存向量的问题按文本哈希生成确定性的单位向量
+- StandInLLM：按配置的首字延迟和输出速度流式输出固定文本，模拟LLM生成耗时
+"""
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from src.utils import setup_project_path
+
+setup_project_path()
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+from src.feedback import FeedbackStore
+
+# 与 DashScope text-embedding-v2 一致的向量维度（必须与 Chroma 中已有索引的维度相同）
+DEFAULT_EMBEDDING_DIM = 1536
+
+# 替身LLM默认参数
+DEFAULT_FIRST_TOKEN_MS = 500.0
+DEFAULT_TOKENS_PER_SECOND = 40.0
+DEFAULT_OUTPUT_TOKENS = 200
+
+# 替身LLM循环输出的文本（每个字符作为一个token）
+STANDIN_ANSWER = "这是本地替身模型生成的回答，仅用于性能测试，不代表真实模型的输出内容。"
+
+
+def hash_embedding(text: str, dim: int = DEFAULT_EMBEDDING_DIM) -> List[float]:
+    """
+    按文本哈希生成确定性的单位向量（同一文本总是得到同一向量）
+
+    Args:
+        text: 输入文本
+        dim: 向量维度
+
+    Returns:
+        List[float]: L2 归一化后的向量
+    """
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def standin_tokens(output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> List[str]:
+    """替身LLM输出的token序列"""
+    return [STANDIN_ANSWER[i % len(STANDIN_ANSWER)] for i in range(output_tokens)]
+
+
+def stream_standin_tokens(
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+    first_token_ms: float = DEFAULT_FIRST_TOKEN_MS,
+    tokens_per_second: float = DEFAULT_TOKENS_PER_SECOND,
+) -> Iterator[str]:
+    """
+    按首字延迟和输出速度逐个产出token（在调用线程中 sleep）
+
+    Args:
+        output_tokens: 输出token数
+        first_token_ms: 首个token前的等待时间（毫秒）
+        tokens_per_second: 之后每秒输出的token数，0 表示不等待
+    """
+    interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+    time.sleep(first_token_ms / 1000.0)
+    for index, token in enumerate(standin_tokens(output_tokens)):
+        if index and interval:
+            time.sleep(interval)
+        yield token
+
+
+def load_stored_query_vectors(store: FeedbackStore, dim: int = DEFAULT_EMBEDDING_DIM) -> Dict[str, List[float]]:
+    """
+    读取交互记录中保存的问题向量
+
+    Args:
+        store: 反馈数据库
+        dim: 只读取该维度的向量
+
+    Returns:
+        Dict[str, List[float]]: 问题文本 -> 向量（同一问题有多条记录时取最新的）
+    """
+    ids, matrix = store.get_interaction_embeddings(dim=dim)
+    if not len(ids):
+        return {}
+    questions = {row["id"]: row["question"] for row in store.get_all_interactions()}
+    vectors = {}
+    for interaction_id, vector in zip(ids.tolist(), matrix):
+        question = questions.get(interaction_id)
+        if question:
+            vectors[question] = vector.tolist()
+    return vectors
+
+
+class StandInEmbedding(BaseEmbedding):
+    """
+    本地嵌入替身
+
+    查询文本有已保存的真实向量时直接返回，否则返回哈希向量；可配置每次调用的模拟延迟
+    """
+
+    dim: int = DEFAULT_EMBEDDING_DIM
+    latency_ms: float = 0.0
+    _known_vectors: Dict[str, List[float]] = PrivateAttr(default_factory=dict)
+    _counts: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        dim: int = DEFAULT_EMBEDDING_DIM,
+        latency_ms: float = 0.0,
+        known_vectors: Optional[Dict[str, List[float]]] = None,
+        **kwargs: Any,
+    ) -> None:
+        kwargs.setdefault("model_name", "standin-embedding")
+        super().__init__(dim=dim, latency_ms=latency_ms, **kwargs)
+        self._known_vectors = dict(known_vectors or {})
+        self._counts = {"stored": 0, "hashed": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StandInEmbedding"
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """已返回的向量数（stored 为已保存的真实向量，hashed 为哈希向量）"""
+        with self._lock:
+            return dict(self._counts)
+
+    def _embed(self, text: str) -> List[float]:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        vector = self._known_vectors.get(text)
+        source = "stored"
+        if vector is None:
+            vector = hash_embedding(text, self.dim)
+            source = "hashed"
+        with self._lock:
+            self._counts[source] += 1
+        return vector
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 批量调用只计一次延迟（与真实接口一次请求多条文本相同）
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        return [hash_embedding(text, self.dim) for text in texts]
+
+
+class StandInLLM(CustomLLM):
+    """本地LLM替身：忽略提示词，按首字延迟和输出速度流式输出固定文本"""
+
+    model: str = "standin-llm"
+    first_token_ms: float = DEFAULT_FIRST_TOKEN_MS
+    tokens_per_second: float = DEFAULT_TOKENS_PER_SECOND
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StandInLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model, num_output=self.output_tokens)
+
+    def _stream(self) -> Iterator[str]:
+        return stream_standin_tokens(self.output_tokens, self.first_token_ms, self.tokens_per_second)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text="".join(self._stream()))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for token in self._stream():
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
@@ -3,10 +3,14 @@
 统一管理API密钥和模型配置
 """
 import os
+import copy
 import json
+import time
 import logging
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Mapping, Callable, List, Set, Tuple
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -14,71 +18,293 @@ logging.basicConfig(level=logging.INFO)
 # 配置文件路径
 CONFIG_FILE = Path(__file__).parent / "config.json"
 
+# 默认配置（配置文件不存在时写入）
+DEFAULT_CONFIG = {
+    "api_keys": {
+        "DEEPSEEK_API_KEY": "",
+        "OPENAI_API_KEY": "",
+        "DASHSCOPE_API_KEY": ""
+    },
+    "models": {
+        "deepseek": {
+            "model_name": "deepseek-chat",
+            "base_url": "https://api.deepseek.com/v1",
+            "api_key_env": "DEEPSEEK_API_KEY",
+            "temperature": 0.1,
+            "max_tokens": 2000
+        },
+        "openai": {
+            "model_name": "gpt-3.5-turbo",
+            "base_url": "https://api.openai.com/v1",
+            "api_key_env": "OPENAI_API_KEY",
+            "temperature": 0.1,
+            "max_tokens": 2000
+        },
+        "qwen": {
+            "model_name": "qwen-plus",
+            "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+            "api_key_env": "DASHSCOPE_API_KEY",
+            "temperature": 0.1,
+            "max_tokens": 2000
+        }
+    },
+    "embedding": {
+        "provider": "dashscope",
+        "model_name": "text-embedding-v2",
+        "api_key_env": "DASHSCOPE_API_KEY",
+        "base_url": ""
+    },
+    "rag": {
+        "knowledge_space_dir": "./rag_source/knowledge_space",
+        "intent_space_dir": "./rag_source/intent_space",
+        "persist_dir_knowledge": "./storage/knowledge_space",
+        "persist_dir_intent": "./storage/intent_space",
+        "default_k_knowledge": 3,
+        "default_k_intent": 1,
+        "default_intent_threshold": 0.85,
+        "context_token_budget": 1500,
+        "context_dedupe": True,
+        "context_min_chunk_tokens": 32,
+        "query_embedding_cache_size": 256
+    },
+    "http": {
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "keepalive_expiry": 30.0,
+        "connect_timeout": 10.0,
+        "read_timeout": 120.0,
+        "max_retries": 2
+    },
+    "routing": {
+        "enabled": True,
+        "window_size": 50,
+        "max_error_rate": 0.5,
+        "min_samples": 4,
+        "cooldown_seconds": 30,
+        "hedge_enabled": False,
+        "hedge_delay_ms": 1500,
+        "error_penalty_ms": 2000
+    },
+    "ui": {
+        "stream_flush_interval_ms": 50,
+        "stream_flush_chars": 200
+    },
+    "feedback": {
+        "write_behind": True,
+        "queue_size": 1000,
+        "batch_size": 100,
+        "flush_interval_ms": 200,
+        "store_embeddings": True,
+        "cluster_questions": True,
+        "cluster_similarity_threshold": 0.85,
+        "embed_general_questions": False
+    },
+    "default_llm": "deepseek",
+    "priority_order": ["deepseek", "openai", "qwen"],
+    "monitoring": {
+        "metrics": {
+            "enabled": False,
+            "host": "127.0.0.1",
+            "port": 9108,
+            "file_path": "",
+            "file_interval_seconds": 15
+        },
+        "profiling": {
+            "enabled": False,
+            "sample_rate": 0.0,
+            "mode": "cprofile",
+            "sampling_interval_ms": 5,
+            "output_dir": "./data/profiles",
+            "max_files": 200,
+            "max_age_hours": 72
+        },
+        "tracing": {
+            "enabled": False,
+            "sample_rate": 0.1,
+            "output_dir": "./data/traces",
+            "batch_size": 50,
+            "flush_interval_seconds": 5,
+            "max_buffer": 1000,
+            "retention_days": 7
+        }
+    }
+}
+
+# 检查配置文件修改时间的最小间隔（秒），间隔内的读取不做任何文件I/O
+CONFIG_CHECK_INTERVAL = 1.0
+
+
+def _freeze(value: Any) -> Any:
+    """递归转换为只读结构：dict -> MappingProxyType，list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """将只读结构还原为可修改的 dict/list"""
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class _ConfigStore:
+    """
+    进程级配置快照
+
+    - 配置文件解析一次后保存为只读快照，读取配置只是一次字典查找
+    - 每隔 CONFIG_CHECK_INTERVAL 秒最多 stat 一次文件，修改时间或大小变化时重新加载
+    - 按顶层配置段维护版本号，并通知订阅者哪些配置段发生了变化
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot: Mapping[str, Any] = MappingProxyType({})
+        self._file_sig: Optional[Tuple[float, int]] = None
+        self._last_check = 0.0
+        self._loaded = False
+        self._version = 0
+        self._section_versions: Dict[str, int] = {}
+        self._subscribers: List[Callable[[Mapping[str, Any], Set[str]], None]] = []
+
+    @staticmethod
+    def _stat() -> Optional[Tuple[float, int]]:
+        try:
+            stat = CONFIG_FILE.stat()
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def get(self) -> Mapping[str, Any]:
+        now = time.monotonic()
+        if self._loaded and now - self._last_check < CONFIG_CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            if self._loaded and now - self._last_check < CONFIG_CHECK_INTERVAL:
+                return self._snapshot
+            self._last_check = now
+            file_sig = self._stat()
+            if not self._loaded or file_sig != self._file_sig:
+                self._reload(file_sig)
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        """强制下次读取时检查配置文件（保存配置后调用）"""
+        with self._lock:
+            self._last_check = 0.0
+
+    def _reload(self, file_sig: Optional[Tuple[float, int]]) -> None:
+        if file_sig is None:
+            # 如果配置文件不存在，创建一个默认配置
+            config = copy.deepcopy(DEFAULT_CONFIG)
+            save_config(config)
+            file_sig = self._stat()
+        else:
+            try:
+                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
+                print(f"加载配置文件失败: {e}")
+                if self._loaded:
+                    # 保留上一份有效快照（如文件正在被写入），下次检查时重试
+                    return
+                config = {}
+
+        new_snapshot = _freeze(config)
+        old_snapshot = self._snapshot
+        changed = {
+            key for key in set(old_snapshot) | set(new_snapshot)
+            if old_snapshot.get(key) != new_snapshot.get(key)
+        }
+        self._snapshot = new_snapshot
+        self._file_sig = file_sig
+        first_load = not self._loaded
+        self._loaded = True
+        if not changed and not first_load:
+            return
+
+        self._version += 1
+        for key in changed:
+            self._section_versions[key] = self._section_versions.get(key, 0) + 1
+        if first_load:
+            return
+        logging.info(f"配置文件已重新加载，变化的配置段: {sorted(changed)}")
+        for callback in list(self._subscribers):
+            try:
+                callback(new_snapshot, changed)
+            except Exception as e:
+                logging.warning(f"配置变更回调执行失败: {e}")
+
+    def version(self, sections: Tuple[str, ...] = ()) -> int:
+        self.get()
+        if not sections:
+            return self._version
+        return sum(self._section_versions.get(section, 0) for section in sections)
+
+    def subscribe(self, callback: Callable[[Mapping[str, Any], Set[str]], None]) -> None:
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Mapping[str, Any], Set[str]], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+
+_config_store = _ConfigStore()
+
+
+def get_config() -> Mapping[str, Any]:
+    """
+    获取只读的配置快照（热路径使用，不做文件I/O）
+    
+    Returns:
+        Mapping: 只读配置，嵌套的字典为只读映射、列表为元组
+    """
+    return _config_store.get()
+
+
 def load_config() -> Dict[str, Any]:
     """
     加载配置文件
     
     Returns:
-        Dict: 配置字典
-    """
-    if not CONFIG_FILE.exists():
-        # 如果配置文件不存在，创建一个默认配置
-        default_config = {
-            "api_keys": {
-                "DEEPSEEK_API_KEY": "",
-                "OPENAI_API_KEY": "",
-                "DASHSCOPE_API_KEY": ""
-            },
-            "models": {
-                "deepseek": {
-                    "model_name": "deepseek-chat",
-                    "base_url": "https://api.deepseek.com/v1",
-                    "api_key_env": "DEEPSEEK_API_KEY",
-                    "temperature": 0.1,
-                    "max_tokens": 2000
-                },
-                "openai": {
-                    "model_name": "gpt-3.5-turbo",
-                    "base_url": "https://api.openai.com/v1",
-                    "api_key_env": "OPENAI_API_KEY",
-                    "temperature": 0.1,
-                    "max_tokens": 2000
-                },
-                "qwen": {
-                    "model_name": "qwen-plus",
-                    "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
-                    "api_key_env": "DASHSCOPE_API_KEY",
-                    "temperature": 0.1,
-                    "max_tokens": 2000
-                }
-            },
-            "embedding": {
-                "provider": "dashscope",
-                "model_name": "text-embedding-v2",
-                "api_key_env": "DASHSCOPE_API_KEY"
-            },
-            "rag": {
-                "knowledge_space_dir": "./rag_source/knowledge_space",
-                "intent_space_dir": "./rag_source/intent_space",
-                "persist_dir_knowledge": "./storage/knowledge_space",
-                "persist_dir_intent": "./storage/intent_space",
-                "default_k_knowledge": 3,
-                "default_k_intent": 1,
-                "default_intent_threshold": 0.85
-            },
-            "default_llm": "deepseek",
-            "priority_order": ["deepseek", "openai", "qwen"]
-        }
-        save_config(default_config)
-        return default_config
+        Dict: 配置字典（快照的可修改副本，修改后需调用 save_config 保存）
+    """
+    return _thaw(_config_store.get())
+
+
+def get_config_version(*sections: str) -> int:
+    """
+    获取配置版本号，配置变化后递增，可用作下游缓存的键
     
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        return config
-    except (FileNotFoundError, json.JSONDecodeError, IOError) as e:
-        print(f"加载配置文件失败: {e}")
-        return {}
+    Args:
+        *sections: 顶层配置段名称（如 "rag", "models"），为空时返回整体版本号
+    
+    Returns:
+        int: 版本号；指定配置段时，只有这些配置段变化才会改变
+    """
+    return _config_store.version(sections)
+
+
+def subscribe_config(callback: Callable[[Mapping[str, Any], Set[str]], None]) -> None:
+    """
+    订阅配置变更
+    
+    Args:
+        callback: 回调函数，参数为 (新配置快照, 发生变化的顶层配置段集合)
+    """
+    _config_store.subscribe(callback)
+
+
+def unsubscribe_config(callback: Callable[[Mapping[str, Any], Set[str]], None]) -> None:
+    """取消订阅配置变更"""
+    _config_store.unsubscribe(callback)
 
 def save_config(config: Dict[str, Any]) -> None:
     """
@@ -89,7 +315,8 @@ def save_config(config: Dict[str, Any]) -> None:
     """
     try:
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+            json.dump(_thaw(config), f, indent=4, ensure_ascii=False)
+        _config_store.invalidate()
     except (IOError, OSError, PermissionError) as e:
         print(f"保存配置文件失败: {e}")
 
@@ -110,7 +337,7 @@ def get_api_key(key_name: str) -> Optional[str]:
         return api_key
     
     # 如果环境变量不存在，从配置文件获取
-    config = load_config()
+    config = get_config()
     api_keys = config.get("api_keys", {})
     api_key = api_keys.get(key_name, "")
     
@@ -131,9 +358,10 @@ def get_model_config(model_name: str) -> Optional[Dict[str, Any]]:
     Returns:
         Dict: 模型配置字典
     """
-    config = load_config()
+    config = get_config()
     models = config.get("models", {})
-    return models.get(model_name)
+    model_config = models.get(model_name)
+    return _thaw(model_config) if model_config is not None else None
 
 def get_available_llm() -> Optional[str]:
     """
@@ -143,7 +371,7 @@ def get_available_llm() -> Optional[str]:
     Returns:
         str: 可用的模型名称，如果都不可用则返回None
     """
-    config = load_config()
+    config = get_config()
     priority_order = config.get("priority_order", ["deepseek", "openai", "qwen"])
     
     for model_name in priority_order:
@@ -160,7 +388,7 @@ def load_key():
     加载API密钥到环境变量
     兼容旧版本的load_key函数
     """
-    config = load_config()
+    config = get_config()
     api_keys = config.get("api_keys", {})
     
     # 将配置中的API密钥设置到环境变量
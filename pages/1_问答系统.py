@@ -10,6 +10,10 @@ setup_project_path()
 
 from src.retriever import RAGManager
 from src.feedback import FeedbackStore
+from src.interaction_logger import get_interaction_logger, get_feedback_config
+from src.request_timer import RequestTimer
+from src.profiling import sample_request_profile
+from src.tracing import start_request_trace
 from src.general_assistant import handle_general_assistant
 from src.industry_assistant import handle_industry_assistant
 from src.evaluation import calculate_metrics, format_metrics_display
@@ -360,7 +364,7 @@ if reset_db:
     with st.spinner("正在重置向量数据库..."):
         try:
             cache_key = get_rag_manager_cache_key()
-            rag_manager = load_rag_manager(_cache_key=cache_key)
+            rag_manager = load_rag_manager(cache_key=cache_key)
             if rag_manager:
                 result = rag_manager.reset_vector_db()
                 st.success(f"✅ {result}")
@@ -386,13 +390,17 @@ if export_chat:
 
 # --- 获取当前使用的LLM提供商 ---
 llm_provider_name = ""
+rag_manager = None
 try:
     if rag_enabled:
         # 行业助手模式
         cache_key = get_rag_manager_cache_key()
-        rag_manager = load_rag_manager(_cache_key=cache_key)
+        rag_manager = load_rag_manager(cache_key=cache_key)
         if rag_manager and hasattr(rag_manager, 'llm_provider') and rag_manager.llm_provider:
             llm_provider_name = rag_manager.llm_provider
+        if rag_manager and hasattr(rag_manager, 'get_query_embedding'):
+            # 通用助手的问题只在 feedback.embed_general_questions 开启时由后台线程用该函数计算向量
+            get_interaction_logger().set_embedder(rag_manager.get_query_embedding)
     else:
         # 通用助手模式
         llm_service = get_llm_service()
@@ -524,19 +532,15 @@ for idx, message in enumerate(st.session_state.messages):
                         # 更新已存在的交互记录的反馈信息
                         interaction_id = st.session_state[feedback_key].get("interaction_id")
                         if interaction_id:
-                            # 更新已存在的记录
-                            sources_payload = {
-                                "tags": tags, 
-                                "source_nodes": []
-                            }
-                            feedback_store.update_interaction_feedback(interaction_id, rating, correction)
+                            # 更新已存在的记录（标签写入结构化标签表）
+                            feedback_store.update_interaction_feedback(interaction_id, rating, correction, tags=tags)
                         else:
                             # 如果没有interaction_id，创建新记录（兼容旧逻辑）
                             sources_payload = {
                                 "tags": tags, 
                                 "source_nodes": []
                             }
-                            feedback_store.add_interaction(user_question, assistant_answer, str(sources_payload), rating, correction)
+                            feedback_store.add_interaction(user_question, assistant_answer, sources_payload, rating, correction)
                         
                         # 标记为已提交
                         st.session_state[feedback_key]["submitted"] = True
@@ -549,7 +553,7 @@ for idx, message in enumerate(st.session_state.messages):
                         if rating >= 4 and len(correction.strip()) > 0:
                             try:
                                 cache_key = get_rag_manager_cache_key()
-                                rag_manager = load_rag_manager(_cache_key=cache_key)
+                                rag_manager = load_rag_manager(cache_key=cache_key)
                                 if rag_manager:
                                     rag_manager.refresh_intent_index()
                                     st.info("🔄 意图索引已更新")
@@ -582,24 +586,34 @@ if prompt := st.chat_input("请在这里输入您的问题..."):
         message_placeholder = st.empty()
         message_placeholder.markdown("正在思考中...")
 
+        # 分阶段计时，随交互记录一起写入，用于反馈空间的延迟分析
+        request_timer = RequestTimer()
+        # 按采样率（或 URL 中的 ?profile=1）剖析本次请求，未采样时为空实现
+        request_profile = sample_request_profile(force=st.query_params.get("profile") == "1")
+        # 按采样率（或 URL 中的 ?trace=1）记录本次请求的本地链路，未采样时为空实现
+        request_trace = start_request_trace(
+            "industry" if rag_enabled else "general", force=st.query_params.get("trace") == "1"
+        )
         try:
             if rag_enabled:
                 # 行业助手模式：参考知识空间、意图空间和反馈空间
                 try:
                     cache_key = get_rag_manager_cache_key()
-                    rag_manager = load_rag_manager(_cache_key=cache_key)
+                    rag_manager = load_rag_manager(cache_key=cache_key)
                     if rag_manager is not None:
                         try:
-                            full_response, src_nodes, sources_str, used_intent_space, intent_score = handle_industry_assistant(
-                                rag_manager=rag_manager,
-                                prompt=prompt,
-                                message_placeholder=message_placeholder,
-                                thinking_placeholder=thinking_placeholder,
-                                k_intent=k_intent,
-                                k_knowledge=k_knowledge,
-                                intent_threshold=intent_threshold,
-                                show_thinking=show_thinking
-                            )
+                            with request_profile, request_trace:
+                                full_response, src_nodes, sources_str, used_intent_space, intent_score = handle_industry_assistant(
+                                    rag_manager=rag_manager,
+                                    prompt=prompt,
+                                    message_placeholder=message_placeholder,
+                                    thinking_placeholder=thinking_placeholder,
+                                    k_intent=k_intent,
+                                    k_knowledge=k_knowledge,
+                                    intent_threshold=intent_threshold,
+                                    show_thinking=show_thinking,
+                                    timer=request_timer
+                                )
                             st.session_state.messages.append({"role": "assistant", "content": full_response})
                         except Exception as e:
                             logging.error(f"行业助手处理失败: {e}", exc_info=True)
@@ -663,25 +677,39 @@ if prompt := st.chat_input("请在这里输入您的问题..."):
                     intent_score = 0.0
             else:
                 # 通用助手模式：直接调用LLM，不使用RAG
-                full_response, src_nodes, sources_str = handle_general_assistant(
-                    prompt=prompt,
-                    message_placeholder=message_placeholder,
-                    thinking_placeholder=thinking_placeholder,
-                    show_thinking=show_thinking
-                )
+                with request_profile, request_trace:
+                    full_response, src_nodes, sources_str = handle_general_assistant(
+                        prompt=prompt,
+                        message_placeholder=message_placeholder,
+                        thinking_placeholder=thinking_placeholder,
+                        show_thinking=show_thinking,
+                        timer=request_timer
+                    )
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
                 used_intent_space = False
                 intent_score = 0.0
             
             # 自动记录问答交互（无反馈），用于统计高频问题
+            # 写入后台队列后立即返回临时ID，不阻塞本次回答的后续渲染；问题聚类也在后台线程中完成
             sources_payload = {
                 "source_nodes": src_nodes and [getattr(n.node, "metadata", {}) for n in src_nodes] or []
             }
-            interaction_id = feedback_store.add_interaction_without_feedback(
+            request_timer.finish()
+            logging.info(f"请求耗时: {request_timer.summary()}")
+            # 行业助手直接复用检索时已计算的查询向量；通用助手没有查询向量，按配置决定是否在后台额外计算
+            query_embedding = None
+            if rag_enabled and rag_manager is not None:
+                query_embedding = rag_manager.get_cached_query_embedding(prompt)
+            interaction_id = get_interaction_logger().log(
                 prompt, 
                 full_response, 
-                str(sources_payload)
+                sources_payload,
+                embedding=query_embedding,
+                timings=request_timer.as_dict(),
+                compute_embedding=not rag_enabled and bool(get_feedback_config()["embed_general_questions"]),
             )
+            request_profile.save(interaction_id)
+            request_trace.finish(interaction_id, **request_timer.as_dict())
             # 将interaction_id存储到session_state，以便后续更新反馈
             current_msg_idx = len(st.session_state.messages) - 1
             feedback_key = f"feedback_{current_msg_idx}"
@@ -831,20 +859,15 @@ if prompt := st.chat_input("请在这里输入您的问题..."):
                         # 更新已存在的交互记录的反馈信息
                         interaction_id = st.session_state[feedback_key].get("interaction_id")
                         if interaction_id:
-                            # 更新已存在的记录
-                            sources_payload = {
-                                "tags": tags, 
-                                "source_nodes": src_nodes and [getattr(n.node, "metadata", {}) for n in src_nodes] or []
-                            }
-                            # 更新sources字段以包含tags
-                            feedback_store.update_interaction_feedback(interaction_id, rating, correction)
+                            # 更新已存在的记录（来源节点已在记录交互时写入，这里只更新标签）
+                            feedback_store.update_interaction_feedback(interaction_id, rating, correction, tags=tags)
                         else:
                             # 如果没有interaction_id，创建新记录（兼容旧逻辑）
                             sources_payload = {
                                 "tags": tags, 
                                 "source_nodes": src_nodes and [getattr(n.node, "metadata", {}) for n in src_nodes] or []
                             }
-                            feedback_store.add_interaction(prompt, full_response, str(sources_payload), rating, correction)
+                            feedback_store.add_interaction(prompt, full_response, sources_payload, rating, correction)
                         
                         # 标记为已提交
                         st.session_state[feedback_key]["submitted"] = True
@@ -244,7 +244,7 @@ def get_loaded_documents(_rag_manager):
 rag_manager = None
 try:
     cache_key = get_rag_manager_cache_key()
-    rag_manager = load_rag_manager(_cache_key=cache_key)
+    rag_manager = load_rag_manager(cache_key=cache_key)
 except Exception as e:
     st.error(f"❌ RAG 管理器加载失败: {e}")
     st.warning("请检查 API 密钥配置和网络连接。")
@@ -6,6 +6,7 @@ import streamlit as st
 import sys
 import os
 import re
+import hashlib
 import pandas as pd
 import time
 from pathlib import Path
@@ -229,14 +230,35 @@ st.info("""
 # 初始化反馈存储
 feedback_store = FeedbackStore()
 
+def get_intent_space_fingerprint() -> str:
+    """根据意图空间文件的名称、大小和修改时间生成指纹，用于判断是否需要重建全文索引"""
+    config = load_config()
+    intent_space_dir = config.get("rag", {}).get("intent_space_dir", "./rag_source/intent_space")
+    if not os.path.exists(intent_space_dir):
+        return ""
+    entries = []
+    for file_name in sorted(os.listdir(intent_space_dir)):
+        if file_name.endswith('.txt'):
+            stat = os.stat(os.path.join(intent_space_dir, file_name))
+            entries.append(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(entries).encode("utf-8")).hexdigest()
+
 # 加载数据 - 使用较短的TTL确保数据实时性
 @st.cache_data(ttl=5)  # 5秒缓存，确保数据相对实时
 def load_cached_intent_space():
-    return load_intent_space()
+    qa_pairs = load_intent_space()
+    # 同步到全文索引（文件未变化时跳过），关键词搜索在数据库中完成
+    feedback_store.sync_intent_qa(qa_pairs, get_intent_space_fingerprint())
+    return qa_pairs
+
+@st.cache_data(ttl=5)
+def search_intent_space(query: str, source_files: tuple) -> List[Dict[str, str]]:
+    return feedback_store.search_intent_qa(query, source_files=list(source_files) or None)
 
 @st.cache_data(ttl=5)  # 5秒缓存
 def load_frequent_questions():
-    return feedback_store.get_frequent_questions(min_count=2, limit=30)
+    # 按问题向量聚类的高频意图（相近问法合并计数），未聚类的历史记录按归一化问题文本分组后合并统计
+    return feedback_store.get_frequent_intents(min_count=2, limit=30)
 
 @st.cache_data(ttl=5)  # 5秒缓存
 def load_high_quality_qa():
@@ -369,22 +391,17 @@ with tab1:
             )
         
         # 筛选数据
-        filtered_qa_pairs = all_qa_pairs
-        
-        # 按文件筛选
-        if selected_files:
-            filtered_qa_pairs = [
-                qa for qa in filtered_qa_pairs
-                if qa['source_file'] in selected_files
-            ]
-        
-        # 按关键词搜索
         if search_query:
-            search_lower = search_query.lower()
+            # 按关键词搜索（全文索引，结果按相关度排序），同时按文件筛选
+            filtered_qa_pairs = search_intent_space(search_query, tuple(selected_files))
+        elif selected_files:
+            # 按文件筛选
             filtered_qa_pairs = [
-                qa for qa in filtered_qa_pairs
-                if search_lower in qa['question'].lower() or search_lower in qa['answer'].lower()
+                qa for qa in all_qa_pairs
+                if qa['source_file'] in selected_files
             ]
+        else:
+            filtered_qa_pairs = all_qa_pairs
         
         # 显示统计信息
         col1, col2, col3, col4 = st.columns(4)
@@ -3,16 +3,19 @@
 显示和管理用户反馈数据
 """
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime
+from datetime import datetime, timedelta
 from src.utils import setup_project_path, format_local_time
 
 # 设置项目路径
 setup_project_path()
 
-from src.feedback import FeedbackStore
+from src.feedback import FeedbackStore, local_now
+from src.request_timer import (
+    STAGE_ORDER, PATH_INTENT, PATH_KNOWLEDGE, PATH_GENERAL, STAGE_EMBEDDING, STAGE_INTENT_RETRIEVAL,
+    STAGE_KNOWLEDGE_RETRIEVAL, STAGE_PROMPT, STAGE_LLM_FIRST_TOKEN, STAGE_LLM_STREAM, STAGE_RENDER, STAGE_TOTAL,
+)
 from 首页 import load_rag_manager, get_rag_manager_cache_key
 
 # --- 页面配置 ---
@@ -87,58 +90,93 @@ st.info("""📋
 # --- 初始化 ---
 feedback_store = FeedbackStore()
 
+# 每页显示的反馈数量
+PAGE_SIZE = 20
+
+# 延迟分析的统计范围（小时，None 表示全部）
+LATENCY_WINDOWS = {"最近24小时": 24, "最近7天": 24 * 7, "全部": None}
+PATH_LABELS = {PATH_INTENT: "意图命中", PATH_KNOWLEDGE: "知识检索", PATH_GENERAL: "通用助手"}
+STAGE_LABELS = {
+    STAGE_EMBEDDING: "查询向量",
+    STAGE_INTENT_RETRIEVAL: "意图检索",
+    STAGE_KNOWLEDGE_RETRIEVAL: "知识检索",
+    STAGE_PROMPT: "提示词组装",
+    STAGE_LLM_FIRST_TOKEN: "LLM首字延迟",
+    STAGE_LLM_STREAM: "LLM流式生成",
+    STAGE_RENDER: "页面渲染",
+    STAGE_TOTAL: "总耗时",
+}
+
 # --- 缓存函数 ---
 @st.cache_data(ttl=300) # 缓存5分钟
-def get_all_feedback_data():
-    """加载所有反馈数据并转换为 DataFrame"""
-    records = feedback_store.get_all_interactions()
-    if not records:
-        return pd.DataFrame()
-    df = pd.DataFrame(records)
-    # 数据清洗和预处理
-    df['rating'] = pd.to_numeric(df['rating'], errors='coerce').fillna(-1).astype(int)
-    df['created_at'] = pd.to_datetime(df['created_at'])
-    df['formatted_time'] = df['created_at'].apply(lambda x: format_local_time(x.isoformat()))
-    return df
+def get_feedback_stats():
+    """加载反馈统计概览（读取汇总表）"""
+    return feedback_store.get_feedback_stats()
+
+@st.cache_data(ttl=300)
+def get_feedback_trend(granularity):
+    """加载按天/按小时汇总的趋势数据"""
+    return feedback_store.get_feedback_trend(granularity, limit=30 if granularity == "day" else 48)
+
+@st.cache_data(ttl=60)
+def get_latency_percentiles(since):
+    """加载各路径、各阶段的耗时分位数"""
+    return feedback_store.get_latency_percentiles(since=since)
+
+@st.cache_data(ttl=300)
+def get_tag_counts():
+    """加载已评价反馈的问题类型标签统计"""
+    return feedback_store.get_tag_counts(rated_only=True)
+
+@st.cache_data(ttl=300)
+def get_feedback_page(search_query, rating_range, selected_tags, cursor):
+    """只加载当前页的反馈数据"""
+    return feedback_store.query_interactions(
+        query=search_query or None,
+        rating_range=rating_range,
+        tags=list(selected_tags) or None,
+        cursor=cursor,
+        limit=PAGE_SIZE,
+    )
+
+@st.cache_data(ttl=300)
+def count_feedback(search_query, rating_range, selected_tags):
+    """统计符合筛选条件的反馈数量"""
+    return feedback_store.count_interactions(
+        query=search_query or None,
+        rating_range=rating_range,
+        tags=list(selected_tags) or None,
+    )
 
 # --- 加载数据 ---
-df_feedback = get_all_feedback_data()
+stats = get_feedback_stats()
 
 # --- 主体内容 ---
-if df_feedback.empty:
+if stats["total"] == 0:
     st.info("📬 当前反馈空间为空，暂无用户反馈。")
 else:
     # --- Sidebar for Stats ---
     with st.sidebar:
         st.header("📊 统计概览")
         
-        total_feedback = len(df_feedback)
-        rated_feedback = df_feedback[df_feedback['rating'] != -1]
-        total_rated = len(rated_feedback)
-        avg_rating = rated_feedback['rating'].mean() if total_rated > 0 else 0
-        helpful_count = len(rated_feedback[rated_feedback['rating'] >= 4])
-        helpful_rate = (helpful_count / total_rated) * 100 if total_rated > 0 else 0
-
-        st.metric("反馈总数", f"{total_feedback} 条")
-        st.metric("已评价数", f"{total_rated} 条")
-        st.metric("平均评分", f"{avg_rating:.2f} ⭐")
-        st.metric("有帮助占比", f"{helpful_rate:.1f}%")
+        st.metric("反馈总数", f"{stats['total']} 条")
+        st.metric("已评价数", f"{stats['rated']} 条")
+        st.metric("平均评分", f"{stats['avg_rating']:.2f} ⭐")
+        st.metric("有帮助占比", f"{stats['helpful_rate']:.1f}%")
 
     # --- Control Panel on Main Page ---
     # st.header("⚙️ 控制面板")
+    tag_counts = get_tag_counts()
     with st.container():
         # Visualizations remain on the main page
         st.markdown("#### 📈 可视化分析")
         viz_col1, viz_col2 = st.columns(2)
         with viz_col1:
             st.markdown("###### 评分分布")
-            if not rated_feedback.empty:
-                # 构建评分统计数据
-                rating_counts = rated_feedback['rating'].value_counts().to_dict()
-                
+            if stats["rated"] > 0:
                 # 创建完整的评分列表（0-5）和对应的计数
                 x_values = [0, 1, 2, 3, 4, 5]
-                y_values = [rating_counts.get(i, 0) for i in x_values]
+                y_values = [stats["rating_histogram"].get(i, 0) for i in x_values]
                 
                 # 使用 graph_objects 创建柱状图
                 fig_bar = go.Figure(data=[
@@ -179,12 +217,14 @@ else:
         
         with viz_col2:
             st.markdown("###### 问题类型分布 (Top 5)")
-            # [Corrected Logic] Use the filtered 'rated_feedback' DataFrame for tag analysis
-            rated_feedback['tags'] = rated_feedback['sources'].apply(lambda x: eval(x).get('tags', []) if isinstance(x, str) and x.startswith('{') else [])
-            all_tags = rated_feedback.explode('tags')['tags'].dropna()
-            tag_counts = all_tags.value_counts().nlargest(5)
-            if not tag_counts.empty:
-                fig_pie = px.pie(tag_counts, names=tag_counts.index, values=tag_counts.values, hole=0.4, color_discrete_sequence=px.colors.qualitative.Pastel)
+            top_tags = tag_counts[:5]
+            if top_tags:
+                fig_pie = px.pie(
+                    names=[tag for tag, _ in top_tags],
+                    values=[count for _, count in top_tags],
+                    hole=0.4,
+                    color_discrete_sequence=px.colors.qualitative.Pastel
+                )
                 fig_pie.update_traces(textinfo='percent+label', textposition='inside')
                 fig_pie.update_layout(
                     showlegend=False, 
@@ -197,6 +237,84 @@ else:
             else:
                 st.caption("暂无问题标签数据")
 
+    # --- 趋势 ---
+    st.markdown("#### 📅 趋势")
+    granularity_label = st.radio("时间粒度", ["按天", "按小时"], horizontal=True, label_visibility="collapsed")
+    trend = get_feedback_trend("day" if granularity_label == "按天" else "hour")
+    if trend:
+        buckets = [point["bucket"] for point in trend]
+        fig_trend = go.Figure()
+        fig_trend.add_trace(go.Bar(
+            x=buckets,
+            y=[point["interactions"] for point in trend],
+            name="问答数",
+            marker_color='rgba(102, 126, 234, 0.6)',
+        ))
+        fig_trend.add_trace(go.Bar(
+            x=buckets,
+            y=[point["rated"] for point in trend],
+            name="已评价",
+            marker_color='rgb(16, 185, 129)',
+        ))
+        fig_trend.add_trace(go.Scatter(
+            x=buckets,
+            y=[point["avg_rating"] for point in trend],
+            name="平均评分",
+            yaxis="y2",
+            mode="lines+markers",
+            line=dict(color='rgb(245, 158, 11)'),
+            connectgaps=True,
+        ))
+        fig_trend.update_layout(
+            barmode="group",
+            xaxis=dict(type="category"),
+            yaxis=dict(title="数量"),
+            yaxis2=dict(title="平均评分", overlaying="y", side="right", range=[0, 5.5]),
+            height=300,
+            margin=dict(t=20, b=40, l=40, r=40),
+            legend=dict(orientation="h", y=1.1),
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)'
+        )
+        st.plotly_chart(fig_trend, use_container_width=True)
+    else:
+        st.caption("暂无趋势数据")
+
+    # --- 延迟分析 ---
+    st.markdown("#### ⏱️ 延迟分析")
+    latency_window = st.radio("统计范围", list(LATENCY_WINDOWS), horizontal=True, label_visibility="collapsed")
+    window_hours = LATENCY_WINDOWS[latency_window]
+    latency_since = None
+    if window_hours is not None:
+        latency_since = (datetime.strptime(local_now(), "%Y-%m-%d %H:%M:%S") - timedelta(hours=window_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    latency_stats = get_latency_percentiles(latency_since)
+    if latency_stats:
+        latency_rows = sorted(
+            latency_stats,
+            key=lambda row: (
+                list(PATH_LABELS).index(row["path"]) if row["path"] in PATH_LABELS else len(PATH_LABELS),
+                STAGE_ORDER.index(row["stage"]) if row["stage"] in STAGE_ORDER else len(STAGE_ORDER),
+            ),
+        )
+        st.dataframe(
+            [
+                {
+                    "路径": PATH_LABELS.get(row["path"], row["path"] or "未知"),
+                    "阶段": STAGE_LABELS.get(row["stage"], row["stage"]),
+                    "次数": row["count"],
+                    "平均 (ms)": row["mean_ms"],
+                    "P50 (ms)": row.get("p50"),
+                    "P95 (ms)": row.get("p95"),
+                    "P99 (ms)": row.get("p99"),
+                }
+                for row in latency_rows
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+    else:
+        st.caption("暂无耗时数据（新的问答记录会自动采集）")
+
     # --- 数据筛选 ---
     st.markdown("---")
     st.markdown("#### 🔍 筛选条件")
@@ -209,37 +327,38 @@ else:
         rating_range = st.slider("评分范围", min_value=-1, max_value=5, value=(-1, 5), help="包含-1表示未评分")
     with filter_col3:
         # 获取所有标签
-        all_tags_list = sorted(list(all_tags.unique()))
+        all_tags_list = sorted(tag for tag, _ in tag_counts)
         selected_tags = st.multiselect("问题类型标签", options=all_tags_list)
 
-    # 应用筛选
-    df_filtered = df_feedback.copy()
-    # 为筛选准备tags列
-    df_filtered['tags'] = df_filtered['sources'].apply(lambda x: eval(x).get('tags', []) if isinstance(x, str) and x.startswith('{') else [])
+    # 筛选条件变化时回到第一页；翻页游标保存在 session_state 中
+    filter_key = (search_query, tuple(rating_range), tuple(selected_tags))
+    if st.session_state.get("feedback_filter_key") != filter_key:
+        st.session_state.feedback_filter_key = filter_key
+        st.session_state.feedback_page_cursors = [None]
+    page_cursors = st.session_state.feedback_page_cursors
+    current_cursor = page_cursors[-1]
     
-    if search_query:
-        df_filtered = df_filtered[
-            df_filtered['question'].str.contains(search_query, case=False, na=False) |
-            df_filtered['answer'].str.contains(search_query, case=False, na=False)
-        ]
-    if rating_range:
-        df_filtered = df_filtered[
-            (df_filtered['rating'] >= rating_range[0]) & (df_filtered['rating'] <= rating_range[1])
-        ]
-    if selected_tags:
-        df_filtered = df_filtered[df_filtered['tags'].apply(lambda x: any(tag in x for tag in selected_tags))]
+    filtered_count = count_feedback(search_query, tuple(rating_range), tuple(selected_tags))
+    page_records, next_cursor = get_feedback_page(
+        search_query, tuple(rating_range), tuple(selected_tags), current_cursor
+    )
+    for record in page_records:
+        record["rating"] = record["rating"] if record["rating"] is not None else -1
+        record["formatted_time"] = format_local_time(record["created_at"])
 
     st.markdown("---")
     
     # --- 反馈列表展示 ---
-    st.markdown(f"#### 📋 反馈列表 ({len(df_filtered)} 条)")
+    st.markdown(f"#### 📋 反馈列表 ({filtered_count} 条)")
     
-    if df_filtered.empty:
+    if not page_records:
         st.info("没有符合条件的反馈数据")
     else:
+        page_number = len(page_cursors)
+        total_pages = max(1, -(-filtered_count // PAGE_SIZE))
         # 整体可折叠的expander
-        with st.expander(f"查看全部 {len(df_filtered)} 条反馈", expanded=True):
-            for idx, row in df_filtered.iterrows():
+        with st.expander(f"第 {page_number}/{total_pages} 页，本页 {len(page_records)} 条反馈", expanded=True):
+            for row in page_records:
                 # 评分显示和颜色
                 if row['rating'] == -1:
                     rating_display = "未评分"
@@ -301,15 +420,24 @@ else:
                             st.warning(row['correction'])
                         
                         # 来源信息
-                        if row['sources'] and str(row['sources']).strip():
-                            try:
-                                sources_dict = eval(row['sources']) if isinstance(row['sources'], str) else row['sources']
-                                if isinstance(sources_dict, dict) and sources_dict.get('docs'):
-                                    st.markdown("**📚 参考来源**")
-                                    for doc_name in sources_dict['docs']:
-                                        st.caption(f"• {doc_name}")
-                            except:
-                                pass
+                        source_files = [src["file_name"] for src in feedback_store.get_interaction_sources(row['id']) if src["file_name"]]
+                        if source_files:
+                            st.markdown("**📚 参考来源**")
+                            for doc_name in dict.fromkeys(source_files):
+                                st.caption(f"• {doc_name}")
                         
                         st.caption(f"ID: {row['id']}")
                         st.markdown("---")
+
+        # --- 翻页 ---
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            if st.button("⬅️ 上一页", disabled=len(page_cursors) <= 1, use_container_width=True):
+                page_cursors.pop()
+                st.rerun()
+        with page_col:
+            st.markdown(f"<div style='text-align: center; color: #6b7280;'>第 {page_number} / {total_pages} 页</div>", unsafe_allow_html=True)
+        with next_col:
+            if st.button("下一页 ➡️", disabled=next_cursor is None, use_container_width=True):
+                page_cursors.append(next_cursor)
+                st.rerun()
@@ -0,0 +1,196 @@
+"""
+链路追踪页面
+查看本地链路追踪记录的请求链路：各类 span 的耗时分布和单个请求的瀑布图
+"""
+import streamlit as st
+import plotly.graph_objects as go
+from src.utils import setup_project_path
+
+# 设置项目路径
+setup_project_path()
+
+from src.tracing import get_tracing_config, load_traces
+from src.llm_metrics import percentile
+
+# --- 页面配置 ---
+st.set_page_config(
+    page_title="链路追踪",
+    page_icon="🧭",
+    layout="wide",
+)
+# 自定义CSS
+st.markdown("""
+<style>
+    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
+
+    .stApp {
+        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
+        font-family: 'Inter', sans-serif;
+    }
+
+    .main .block-container {
+        padding-top: 2rem;
+        padding-bottom: 2rem;
+        max-width: 1600px;
+    }
+
+    /* Sidebar Style */
+    [data-testid="stSidebar"] {
+        background: linear-gradient(180deg, #ffffff 0%, #f8f9fa 100%);
+    }
+
+    /* Data Editor (DataFrame) Style */
+    .stDataFrame {
+        border-radius: 12px;
+        overflow: hidden;
+    }
+
+    /* Metric Style */
+    [data-testid="stMetricValue"] {
+        font-size: 1.5rem;
+        font-weight: 600;
+    }
+
+</style>
+""", unsafe_allow_html=True)
+
+# 页面标题
+st.markdown("""
+<div style='text-align: left; margin-bottom: 2rem;'>
+    <h1 style='margin: 0; color: #2c3e50; font-size: 2.5rem;'>🧭 链路追踪</h1>
+    <p style='margin: 0.5rem 0 0 0; color: #5a6c7d; font-size: 1.1rem;'>查看采样请求的检索、嵌入、LLM和合成耗时</p>
+</div>
+""", unsafe_allow_html=True)
+
+NAME_LABELS = {"全部": None, "行业助手": "industry", "通用助手": "general"}
+SPAN_COLORS = {
+    "query": "rgb(102, 126, 234)",
+    "retrieve": "rgb(56, 189, 248)",
+    "embedding": "rgb(52, 211, 153)",
+    "synthesize": "rgb(251, 191, 36)",
+    "llm": "rgb(244, 114, 182)",
+    "templating": "rgb(148, 163, 184)",
+}
+
+
+@st.cache_data(ttl=30)
+def get_traces(name, min_duration_ms, limit):
+    """加载最近的链路（最新的在前）"""
+    return load_traces(limit=limit, name=name, min_duration_ms=min_duration_ms or None)
+
+
+tracing_config = get_tracing_config()
+if not tracing_config["enabled"]:
+    st.info(
+        "🧭 本地链路追踪未启用。在 config/config.json 的 monitoring.tracing 中设置 \"enabled\": true 后重启应用；"
+        "sample_rate 控制采样比例，问答页面 URL 加 ?trace=1 可强制记录单次请求。"
+    )
+
+with st.sidebar:
+    st.header("🔎 筛选")
+    name_label = st.selectbox("请求类型", list(NAME_LABELS))
+    min_duration_ms = st.number_input("最小耗时 (ms)", min_value=0, value=0, step=500)
+    limit = st.slider("最多加载链路数", min_value=50, max_value=2000, value=200, step=50)
+    if st.button("🔄 刷新"):
+        get_traces.clear()
+
+traces = get_traces(NAME_LABELS[name_label], min_duration_ms, limit)
+
+if not traces:
+    st.info(f"📭 {tracing_config['output_dir']} 中暂无链路记录。")
+else:
+    # --- 概览 ---
+    durations = [trace["duration_ms"] for trace in traces]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("链路数", f"{len(traces)} 条")
+    col2.metric("P50 耗时", f"{percentile(durations, 50):.0f} ms")
+    col3.metric("P95 耗时", f"{percentile(durations, 95):.0f} ms")
+    col4.metric("最大耗时", f"{max(durations):.0f} ms")
+
+    # --- 各类 span 耗时分布 ---
+    st.markdown("#### ⏱️ 各类 span 耗时")
+    span_durations = {}
+    for trace in traces:
+        for span in trace["spans"]:
+            if span.get("duration_ms") is not None:
+                span_durations.setdefault(span["type"], []).append(span["duration_ms"])
+    st.dataframe(
+        [
+            {
+                "类型": span_type,
+                "次数": len(values),
+                "P50 (ms)": round(percentile(values, 50), 1),
+                "P95 (ms)": round(percentile(values, 95), 1),
+                "最大 (ms)": round(max(values), 1),
+            }
+            for span_type, values in sorted(span_durations.items(), key=lambda item: -sum(item[1]))
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    # --- 链路列表 ---
+    st.markdown("#### 📋 最近的链路")
+    st.dataframe(
+        [
+            {
+                "时间": trace["started_at"],
+                "类型": trace["name"],
+                "路径": trace["attributes"].get("path"),
+                "耗时 (ms)": trace["duration_ms"],
+                "span数": len(trace["spans"]),
+                "交互ID": trace.get("interaction_id"),
+                "链路ID": trace["trace_id"],
+            }
+            for trace in traces
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    # --- 单个链路 ---
+    st.markdown("#### 🌊 链路详情")
+    trace_index = st.selectbox(
+        "选择链路",
+        range(len(traces)),
+        format_func=lambda i: f"{traces[i]['started_at']} · {traces[i]['name']} · {traces[i]['duration_ms']:.0f} ms",
+    )
+    trace = traces[trace_index]
+    spans = sorted(trace["spans"], key=lambda span: span["start_ms"])
+    if not spans:
+        st.info("该链路没有记录到 span。")
+    else:
+        # 按父子关系缩进显示 span 名称
+        depths = {}
+        for span in spans:
+            depths[span["span_id"]] = depths.get(span.get("parent_id"), -1) + 1
+        labels = [f"{'  ' * depths[span['span_id']]}{index + 1}. {span['type']}" for index, span in enumerate(spans)]
+        fig = go.Figure(go.Bar(
+            y=labels,
+            x=[span["duration_ms"] or 0 for span in spans],
+            base=[span["start_ms"] for span in spans],
+            orientation="h",
+            marker_color=[SPAN_COLORS.get(span["type"], "rgb(100, 116, 139)") for span in spans],
+            hovertemplate="%{y}<br>开始: %{base:.1f} ms<br>耗时: %{x:.1f} ms<extra></extra>",
+        ))
+        fig.update_layout(
+            xaxis=dict(title="相对请求开始的时间 (ms)", range=[0, max(trace["duration_ms"], 1)]),
+            yaxis=dict(autorange="reversed"),
+            height=max(250, 40 * len(spans) + 100),
+            margin=dict(l=20, r=20, t=20, b=40),
+            plot_bgcolor="rgba(0,0,0,0)",
+            paper_bgcolor="rgba(0,0,0,0)",
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(
+            [
+                dict({"span": label.strip(), "开始 (ms)": span["start_ms"], "耗时 (ms)": span["duration_ms"]},
+                     **{key: str(value) for key, value in span["attributes"].items()})
+                for label, span in zip(labels, spans)
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+    if trace["attributes"].get("stages"):
+        with st.expander("请求分阶段耗时 (ms)"):
+            st.json(trace["attributes"]["stages"])
@@ -1,26 +1,139 @@
 """
 提示词管理模块
+提示词文件只在首次使用和文件修改时间变化时读取，编译后的模板按变体缓存
 """
+import time
+import threading
 from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
 
 PROMPT_DIR = Path(__file__).parent
 
+# 检查提示词文件修改时间的最小间隔（秒），间隔内的请求不做任何文件I/O
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+class PromptRegistry:
+    """
+    提示词注册表
+
+    - 每个提示词文件缓存其内容、修改时间和版本号
+    - 每隔 RELOAD_CHECK_INTERVAL 秒最多 stat 一次文件，修改时间变化时重新加载并递增版本号
+    - get_compiled 按 (提示词, 变体) 缓存编译结果，版本号变化时重新编译
+    """
+
+    def __init__(self, prompt_dir: Path = PROMPT_DIR, check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.prompt_dir = prompt_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # name -> (mtime, content, version)；文件不存在时 content 为 None
+        self._entries: Dict[str, Tuple[Optional[float], Optional[str], int]] = {}
+        self._last_check: Dict[str, float] = {}
+        # (name, variant) -> (version, compiled)
+        self._compiled: Dict[Tuple[str, Hashable], Tuple[int, Any]] = {}
+
+    def _refresh(self, name: str) -> Tuple[Optional[float], Optional[str], int]:
+        """按需检查文件修改时间并重新加载，返回当前缓存条目"""
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now - self._last_check.get(name, 0.0) < self.check_interval:
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and now - self._last_check.get(name, 0.0) < self.check_interval:
+                return entry
+            self._last_check[name] = now
+
+            prompt_file = self.prompt_dir / f"{name}.txt"
+            try:
+                mtime = prompt_file.stat().st_mtime
+            except FileNotFoundError:
+                mtime = None
+
+            if entry is not None and entry[0] == mtime:
+                return entry
+
+            content = None
+            if mtime is not None:
+                with open(prompt_file, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+            version = entry[2] + 1 if entry is not None else 1
+            entry = (mtime, content, version)
+            self._entries[name] = entry
+            return entry
+
+    def get(self, name: str) -> str:
+        """
+        获取提示词内容
+
+        Args:
+            name: 提示词文件名（不含扩展名）
+
+        Returns:
+            str: 提示词内容
+
+        Raises:
+            FileNotFoundError: 提示词文件不存在
+        """
+        content = self._refresh(name)[1]
+        if content is None:
+            raise FileNotFoundError(f"提示词文件不存在: {self.prompt_dir / f'{name}.txt'}")
+        return content
+
+    def get_version(self, name: str) -> int:
+        """获取提示词的版本号（文件每次重新加载后递增），可用于下游缓存的失效判断"""
+        return self._refresh(name)[2]
+
+    def get_compiled(
+        self,
+        name: str,
+        variant: Hashable,
+        builder: Callable[[Optional[str], Hashable], Any],
+    ) -> Any:
+        """
+        获取编译后的提示词模板
+
+        Args:
+            name: 提示词文件名（不含扩展名）
+            variant: 变体标识（如 show_thinking）
+            builder: 编译函数，参数为 (提示词内容, 变体)，文件不存在时内容为None
+
+        Returns:
+            Any: builder 的返回值，在提示词文件变化前一直复用
+        """
+        _, content, version = self._refresh(name)
+        key = (name, variant)
+        cached = self._compiled.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        compiled = builder(content, variant)
+        self._compiled[key] = (version, compiled)
+        return compiled
+
+
+# 全局提示词注册表实例
+_prompt_registry = None
+
+def get_prompt_registry() -> PromptRegistry:
+    """获取提示词注册表实例（单例模式）"""
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = PromptRegistry()
+    return _prompt_registry
+
+
 def load_prompt(prompt_name: str) -> str:
     """
     加载提示词文件
-    
+
     Args:
         prompt_name: 提示词文件名（不含扩展名），如 'general_assistant' 或 'industry_assistant'
-    
+
     Returns:
         str: 提示词内容
     """
-    prompt_file = PROMPT_DIR / f"{prompt_name}.txt"
-    if not prompt_file.exists():
-        raise FileNotFoundError(f"提示词文件不存在: {prompt_file}")
-    
-    with open(prompt_file, 'r', encoding='utf-8') as f:
-        return f.read().strip()
+    return get_prompt_registry().get(prompt_name)
 
 def get_general_assistant_prompt() -> str:
     """获取通用助手提示词"""
@@ -29,4 +142,3 @@ def get_general_assistant_prompt() -> str:
 def get_industry_assistant_prompt() -> str:
     """获取行业助手提示词"""
     return load_prompt("industry_assistant")
-
@@ -0,0 +1,171 @@
+"""
+上下文打包模块
+在检索结果填入行业助手提示词的 {context_str} 之前，按token预算对分块排序、去重和截断，
+控制提示词长度，从而降低首字延迟和调用成本，并避免超出模型上下文窗口
+"""
+import re
+import logging
+import threading
+from typing import List, Optional, Dict, Any
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, MetadataMode
+
+logger = logging.getLogger(__name__)
+
+# 句子切分：中文句末标点、英文句末标点（后接空白）以及换行
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[。！？；!?;])|(?<=[.])\s+|\n+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 每个线程最近一次打包的统计信息（流式请求在同一线程内完成检索）
+_stats_local = threading.local()
+
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    统计文本的token数
+
+    优先使用 tiktoken 的 cl100k_base 编码；tiktoken 不可用时按字符数估算
+
+    Args:
+        text: 文本内容
+
+    Returns:
+        int: token数
+    """
+    global _encoding, _encoding_failed
+    if not text:
+        return 0
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning(f"tiktoken 不可用，按字符数估算token: {e}")
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # 估算：中文约1字1token，英文约4字符1token
+    return max(1, int(len(text) / 1.5))
+
+
+def split_sentences(text: str) -> List[str]:
+    """将文本切分为句子（保留句末标点）"""
+    return [s for s in (part.strip() for part in _SENTENCE_SPLIT_RE.split(text) if part) if s]
+
+
+def get_last_pack_stats() -> Dict[str, Any]:
+    """获取当前线程最近一次上下文打包的统计信息"""
+    return dict(getattr(_stats_local, "stats", {}) or {})
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    基于token预算的上下文打包器（LlamaIndex 节点后处理器）
+
+    处理步骤：
+    1. 按相似度分数从高到低排序分块
+    2. 去除跨分块重复的句子
+    3. 依次放入分块直到达到预算；放不下的分块按句子截断，截断后过短则跳过
+    """
+
+    token_budget: int = Field(default=1500, description="context_str 的token预算，<=0 表示不限制")
+    dedupe: bool = Field(default=True, description="是否去除重复句子")
+    min_chunk_tokens: int = Field(default=32, description="截断后的分块少于该token数时直接丢弃")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        ranked = sorted(nodes, key=lambda n: n.score if n.score is not None else 0.0, reverse=True)
+        tokens_before = sum(count_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in ranked)
+
+        seen_sentences = set()
+        packed: List[NodeWithScore] = []
+        used_tokens = 0
+        dropped_sentences = 0
+        budget = self.token_budget if self.token_budget > 0 else None
+
+        for node_with_score in ranked:
+            node = node_with_score.node
+            text = node.get_content(metadata_mode=MetadataMode.NONE)
+            # 元数据（如文件名）也会进入提示词，计入预算
+            overhead = count_tokens(node.get_content(metadata_mode=MetadataMode.LLM)) - count_tokens(text)
+
+            sentences = split_sentences(text)
+            kept_sentences = []
+            # 本分块保留的句子键，分块确定打包后才并入 seen_sentences，
+            # 被截断或整块丢弃的句子不会导致后面分块中的相同句子被当作重复删除
+            chunk_keys = set()
+            kept_tokens = max(overhead, 0)
+            truncated = False
+            # 删除了重复句子或截断了句子时文本与原文不同，需要复制节点
+            modified = False
+            limit = budget
+            if budget is not None and not packed and overhead >= budget:
+                # 元数据本身已超出预算时，最相关分块的正文仍保留预算长度，避免 context_str 为空
+                limit = budget + overhead
+            for sentence in sentences:
+                key = None
+                if self.dedupe:
+                    key = _WHITESPACE_RE.sub("", sentence).lower()
+                    if key in seen_sentences or key in chunk_keys:
+                        dropped_sentences += 1
+                        modified = True
+                        continue
+                sentence_tokens = count_tokens(sentence)
+                if limit is not None and used_tokens + kept_tokens + sentence_tokens > limit:
+                    truncated = True
+                    modified = True
+                    if not packed and not kept_sentences:
+                        # 单个句子就超出预算时按比例截断，保证至少保留最相关的内容
+                        remaining = limit - used_tokens - kept_tokens
+                        if remaining > 0:
+                            kept_sentences.append(sentence[:int(len(sentence) * remaining / sentence_tokens)])
+                            kept_tokens += remaining
+                    break
+                kept_sentences.append(sentence)
+                kept_tokens += sentence_tokens
+                if key is not None:
+                    chunk_keys.add(key)
+
+            if not kept_sentences or (truncated and packed and kept_tokens < self.min_chunk_tokens):
+                # 截断后过短的分块直接丢弃，剩余预算留给后面更短的分块
+                continue
+
+            if not modified:
+                # 未删减的分块保持原文（保留 Markdown 格式）
+                packed.append(node_with_score)
+            else:
+                # 复制节点后再修改文本，避免影响索引中的原始节点
+                packed_node = node.copy()
+                packed_node.text = "\n".join(kept_sentences)
+                packed.append(NodeWithScore(node=packed_node, score=node_with_score.score))
+            seen_sentences.update(chunk_keys)
+            used_tokens += kept_tokens
+            if budget is not None and used_tokens >= budget:
+                break
+
+        stats = {
+            "nodes_in": len(nodes),
+            "nodes_out": len(packed),
+            "tokens_before": tokens_before,
+            "tokens_after": used_tokens,
+            "tokens_saved": max(tokens_before - used_tokens, 0),
+            "dropped_sentences": dropped_sentences,
+        }
+        _stats_local.stats = stats
+        logger.info(
+            f"上下文打包: {stats['nodes_in']}→{stats['nodes_out']} 个分块, "
+            f"{tokens_before}→{used_tokens} tokens (节省 {stats['tokens_saved']})"
+        )
+        return packed
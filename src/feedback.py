@@ -1,22 +1,704 @@
 import os
+import re
+import ast
+import json
+import time
+import queue
 import sqlite3
+import hashlib
 import logging
+import threading
+import unicodedata
+import numpy as np
 from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Iterator
+from typing import Any, Dict, List, Optional, Iterator, Tuple, Union
 from llama_index.core.schema import Document
+from src.metrics import get_metrics_registry
+
+# SQLite 连接参数
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # 写入不阻塞读取（反馈空间页面在写入时仍可查询）
+    "PRAGMA synchronous=NORMAL",  # WAL 模式下只在检查点时 fsync
+    "PRAGMA cache_size=-20000",  # 页缓存约 20MB
+    "PRAGMA mmap_size=268435456",  # 256MB 内存映射读取
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",  # 遇到写锁时最多等待 5 秒
+)
+SQLITE_CACHED_STATEMENTS = 256  # 每个连接缓存的预编译语句数
+SQLITE_POOL_SIZE = 8  # 每个数据库最多保留的空闲连接数
+
+# 反馈存储指标（Prometheus）
+_metrics = get_metrics_registry()
+INTERACTIONS_WRITTEN = _metrics.counter(
+    "feedback_interactions_written_total", "写入的交互记录数", ("mode",))
+FEEDBACK_RATINGS = _metrics.counter(
+    "feedback_ratings_total", "提交的反馈评分次数", ("rating",))
+WRITE_SECONDS = _metrics.histogram(
+    "feedback_write_seconds", "反馈数据库写事务耗时（秒）", labelnames=("op",))
+
+
+def local_now() -> str:
+    """
+    获取当前本地时间字符串（上海时间 UTC+8）
+    
+    Returns:
+        str: 格式为 YYYY-MM-DD HH:MM:SS 的时间
+    """
+    local_tz = timezone(timedelta(hours=8))  # 上海时间 UTC+8
+    return datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SQLiteConnectionPool:
+    """
+    进程级 SQLite 连接池
+
+    Streamlit 每次重新运行页面都会使用新的线程，按线程持有连接会随线程不断重建，
+    因此改为按数据库路径复用一组持久连接：每次取出的连接同一时刻只被一个线程使用，
+    用完后放回池中，连接上的 PRAGMA 设置和预编译语句缓存在整个进程内保留
+    """
+
+    def __init__(self, db_path: str, pool_size: int = SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """取出一个空闲连接，没有空闲连接时新建"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """归还连接，池已满时关闭"""
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# 按数据库路径共享的连接池，以及已完成表结构检查的数据库
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_initialized_dbs = set()
+_fts_dbs = set()  # 已建立 FTS5 全文索引的数据库
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path: str) -> SQLiteConnectionPool:
+    """获取数据库对应的连接池（同一数据库文件在进程内只有一个连接池）"""
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = SQLiteConnectionPool(db_path)
+                _pools[key] = pool
+    return pool
+
+
+# 问题归一化：去掉结尾的标点和空白（问号、句号、感叹号等）
+_TRAILING_PUNCT_RE = re.compile(r'[\s?？!！。.,，;；~～…]+$')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_question(question: str) -> str:
+    """
+    归一化问题文本，用于统计相同问题
+    
+    依次执行：NFKC 规范化（全角转半角）、转小写、合并连续空白、去掉结尾标点
+    
+    Args:
+        question: 原始问题
+    
+    Returns:
+        str: 归一化后的问题
+    """
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def question_hash(question: str) -> str:
+    """
+    计算归一化问题的哈希（interactions.question_hash）
+    
+    Args:
+        question: 原始问题
+    
+    Returns:
+        str: 16位十六进制哈希
+    """
+    return hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_sources(sources: Optional[str]) -> dict:
+    """
+    解析 sources 字段（历史数据为 str(dict) 格式），只解析字面量，不执行代码
+    
+    Args:
+        sources: sources 字段内容
+    
+    Returns:
+        dict: 解析结果，无法解析时返回空字典
+    """
+    if not sources or not isinstance(sources, str) or not sources.startswith("{"):
+        return {}
+    try:
+        value = ast.literal_eval(sources)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _source_rows(sources: dict) -> List[Tuple[int, Optional[str], str]]:
+    """
+    将来源信息展开为 interaction_sources 表的行
+    
+    Args:
+        sources: 解析后的 sources 字典（source_nodes 为节点元数据列表，历史数据中 docs 为文件名列表）
+    
+    Returns:
+        List[Tuple[int, Optional[str], str]]: (序号, 文件名, 元数据JSON) 列表
+    """
+    entries = list(sources.get("source_nodes") or []) + list(sources.get("docs") or [])
+    rows = []
+    for position, entry in enumerate(entries):
+        metadata = entry if isinstance(entry, dict) else {"file_name": str(entry)}
+        file_name = metadata.get("file_name") or metadata.get("source_file") or metadata.get("source")
+        rows.append((position, file_name, json.dumps(metadata, ensure_ascii=False, default=str)))
+    return rows
+
+
+def _normalize_tags(tags) -> List[str]:
+    """去除空标签和重复标签（保持原顺序）"""
+    return list(dict.fromkeys(str(tag).strip() for tag in tags or [] if str(tag).strip()))
+
+
+def _prepare_sources(sources: Union[str, dict, None]) -> Tuple[str, dict]:
+    """
+    统一来源信息的两种传入形式
+    
+    Args:
+        sources: 来源字典，或历史格式的 str(dict) 字符串
+    
+    Returns:
+        Tuple[str, dict]: (写入 sources 字段的字符串, 解析后的字典)
+    """
+    if isinstance(sources, dict):
+        return str(sources), sources
+    return sources or "", parse_sources(sources)
+
+
+def _write_sources(cur: sqlite3.Cursor, interaction_id: int, sources: dict) -> None:
+    """写入一条交互记录的标签和来源到结构化表（调用方负责事务）"""
+    tags = _normalize_tags(sources.get("tags"))
+    if tags:
+        cur.executemany(
+            "INSERT OR IGNORE INTO interaction_tags (interaction_id, tag) VALUES (?, ?)",
+            [(interaction_id, tag) for tag in tags],
+        )
+    source_rows = _source_rows(sources)
+    if source_rows:
+        cur.executemany(
+            "INSERT OR REPLACE INTO interaction_sources (interaction_id, position, file_name, metadata) VALUES (?, ?, ?, ?)",
+            [(interaction_id, *row) for row in source_rows],
+        )
+
+
+def _migrate_v1(cur: sqlite3.Cursor) -> None:
+    """v1: interactions 基础表结构（rating 允许 NULL，created_at 使用Python本地时间）"""
+    # 检查表是否存在
+    cur.execute("""
+        SELECT name FROM sqlite_master 
+        WHERE type='table' AND name='interactions'
+    """)
+    table_exists = cur.fetchone() is not None
+    
+    if not table_exists:
+        # 创建新表，rating字段允许NULL，created_at不使用DEFAULT（使用Python本地时间）
+        cur.execute(
+            """
+            CREATE TABLE interactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT,
+                rating INTEGER,
+                correction TEXT,
+                created_at DATETIME
+            )
+            """
+        )
+    else:
+        # 表已存在，检查是否需要迁移（rating字段是否为NOT NULL）
+        # 获取表结构信息
+        cur.execute("PRAGMA table_info(interactions)")
+        columns = cur.fetchall()
+        rating_not_null = False
+        for col in columns:
+            if col[1] == 'rating' and col[3] == 1:  # col[3] 是 notnull 标志
+                rating_not_null = True
+                break
+        
+        # 如果rating字段是NOT NULL，需要迁移
+        if rating_not_null:
+            logging.info("检测到rating字段为NOT NULL，开始迁移数据库...")
+            # 创建临时表（不使用DEFAULT CURRENT_TIMESTAMP，使用Python本地时间）
+            cur.execute("""
+                CREATE TABLE interactions_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    sources TEXT,
+                    rating INTEGER,
+                    correction TEXT,
+                    created_at DATETIME
+                )
+            """)
+            
+            # 复制数据（保持rating值不变，包括NULL）
+            cur.execute("""
+                INSERT INTO interactions_new 
+                (id, question, answer, sources, rating, correction, created_at)
+                SELECT id, question, answer, sources, rating, correction, created_at
+                FROM interactions
+            """)
+            
+            # 删除旧表
+            cur.execute("DROP TABLE interactions")
+            
+            # 重命名新表
+            cur.execute("ALTER TABLE interactions_new RENAME TO interactions")
+            
+            logging.info("数据库迁移完成：rating字段现在允许NULL")
+
+
+def _migrate_v2(cur: sqlite3.Cursor) -> None:
+    """v2: 增加归一化问题哈希列，并为评分、时间和问题哈希建立索引"""
+    cur.execute("PRAGMA table_info(interactions)")
+    if "question_hash" not in {col[1] for col in cur.fetchall()}:
+        cur.execute("ALTER TABLE interactions ADD COLUMN question_hash TEXT")
+    
+    # 回填已有记录的问题哈希
+    cur.execute("SELECT id, question FROM interactions WHERE question_hash IS NULL")
+    rows = cur.fetchall()
+    cur.executemany(
+        "UPDATE interactions SET question_hash = ? WHERE id = ?",
+        [(question_hash(question), row_id) for row_id, question in rows],
+    )
+    if rows:
+        logging.info(f"已回填 {len(rows)} 条记录的问题哈希")
+    
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_rating_created ON interactions (rating, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_question_hash ON interactions (question_hash)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_created ON interactions (created_at)")
+
+
+def _migrate_v3(cur: sqlite3.Cursor) -> None:
+    """v3: 意图空间问答对表、键值元数据表，以及问答全文索引（FTS5 trigram，中文无需分词）"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS intent_qa (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            source_file TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_intent_qa_source_file ON intent_qa (source_file)")
+    cur.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+    
+    try:
+        # 外部内容表：只保存索引，原文仍在 interactions / intent_qa 中
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5(
+                question, answer, content='interactions', content_rowid='id', tokenize='trigram'
+            )
+        """)
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS intent_qa_fts USING fts5(
+                question, answer, content='intent_qa', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite 未编译 FTS5 或版本低于 3.34（不支持 trigram）时，搜索退化为 LIKE 扫描
+        logging.warning(f"当前SQLite不支持FTS5 trigram全文索引，关键词搜索将使用LIKE: {e}")
+        return
+    
+    # 触发器保持 interactions_fts 与 interactions 同步
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_ai AFTER INSERT ON interactions BEGIN
+            INSERT INTO interactions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_ad AFTER DELETE ON interactions BEGIN
+            INSERT INTO interactions_fts (interactions_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_fts_au AFTER UPDATE OF question, answer ON interactions BEGIN
+            INSERT INTO interactions_fts (interactions_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+            INSERT INTO interactions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+        END
+    """)
+    cur.execute("INSERT INTO interactions_fts (interactions_fts) VALUES ('rebuild')")
+
+
+def _migrate_v4(cur: sqlite3.Cursor) -> None:
+    """v4: 标签和来源节点改为结构化表存储（替代逐行解析 sources 字符串），并回填历史数据"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS interaction_tags (
+            tag TEXT NOT NULL,
+            interaction_id INTEGER NOT NULL,
+            PRIMARY KEY (tag, interaction_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interaction_tags_interaction ON interaction_tags (interaction_id)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS interaction_sources (
+            interaction_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            file_name TEXT,
+            metadata TEXT,
+            PRIMARY KEY (interaction_id, position)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interaction_sources_file ON interaction_sources (file_name)")
+    # 删除交互记录时同步清理（连接未启用外键约束，用触发器代替 ON DELETE CASCADE）
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_side_ad AFTER DELETE ON interactions BEGIN
+            DELETE FROM interaction_tags WHERE interaction_id = old.id;
+            DELETE FROM interaction_sources WHERE interaction_id = old.id;
+        END
+    """)
+    
+    # 回填：历史 sources 字段为 str(dict)，只在迁移时解析一次
+    cur.execute("SELECT id, sources FROM interactions WHERE sources LIKE '{%'")
+    backfilled = 0
+    for interaction_id, sources in cur.fetchall():
+        parsed = parse_sources(sources)
+        if parsed:
+            _write_sources(cur, interaction_id, parsed)
+            backfilled += 1
+    if backfilled:
+        logging.info(f"已回填 {backfilled} 条记录的标签和来源")
+
+
+# 趋势表中"有帮助"的评分阈值
+HELPFUL_RATING = 4
+
+
+def _rollup_statements(row: str, sign: int) -> str:
+    """
+    生成将一条交互记录计入（sign=1）或移出（sign=-1）汇总表的触发器语句
+    
+    Args:
+        row: 触发器中的行引用（"new" 或 "old"）
+        sign: 1 或 -1
+    """
+    rated = f"{sign} * ({row}.rating IS NOT NULL)"
+    rating_sum = f"{sign} * COALESCE({row}.rating, 0)"
+    helpful = f"{sign} * (COALESCE({row}.rating, -1) >= {HELPFUL_RATING})"
+    return f"""
+        UPDATE feedback_totals
+        SET interactions = interactions + {sign}, rated = rated + {rated}, rating_sum = rating_sum + {rating_sum}
+        WHERE id = 1;
+        INSERT INTO feedback_rating_counts (rating, count)
+        SELECT {row}.rating, {sign} WHERE {row}.rating IS NOT NULL
+        ON CONFLICT (rating) DO UPDATE SET count = count + excluded.count;
+        INSERT INTO feedback_daily (day, interactions, rated, rating_sum, helpful)
+        VALUES (substr({row}.created_at, 1, 10), {sign}, {rated}, {rating_sum}, {helpful})
+        ON CONFLICT (day) DO UPDATE SET
+            interactions = interactions + excluded.interactions, rated = rated + excluded.rated,
+            rating_sum = rating_sum + excluded.rating_sum, helpful = helpful + excluded.helpful;
+        INSERT INTO feedback_hourly (hour, interactions, rated, rating_sum, helpful)
+        VALUES (substr({row}.created_at, 1, 13), {sign}, {rated}, {rating_sum}, {helpful})
+        ON CONFLICT (hour) DO UPDATE SET
+            interactions = interactions + excluded.interactions, rated = rated + excluded.rated,
+            rating_sum = rating_sum + excluded.rating_sum, helpful = helpful + excluded.helpful;
+    """
+
+
+def _rebuild_rollups(cur: sqlite3.Cursor) -> None:
+    """根据明细表重新计算全部汇总表（迁移回填和数据修复时使用）"""
+    for table in ("feedback_totals", "feedback_rating_counts", "feedback_daily", "feedback_hourly", "feedback_tag_counts"):
+        cur.execute(f"DELETE FROM {table}")
+    cur.execute("""
+        INSERT INTO feedback_totals (id, interactions, rated, rating_sum)
+        SELECT 1, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0) FROM interactions
+    """)
+    cur.execute("""
+        INSERT INTO feedback_rating_counts (rating, count)
+        SELECT rating, COUNT(*) FROM interactions WHERE rating IS NOT NULL GROUP BY rating
+    """)
+    for table, key, length in (("feedback_daily", "day", 10), ("feedback_hourly", "hour", 13)):
+        cur.execute(f"""
+            INSERT INTO {table} ({key}, interactions, rated, rating_sum, helpful)
+            SELECT substr(created_at, 1, {length}), COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0),
+                   SUM(COALESCE(rating, -1) >= {HELPFUL_RATING})
+            FROM interactions GROUP BY substr(created_at, 1, {length})
+        """)
+    cur.execute("""
+        INSERT INTO feedback_tag_counts (tag, total, rated)
+        SELECT t.tag, COUNT(*), COUNT(i.rating)
+        FROM interaction_tags t JOIN interactions i ON i.id = t.interaction_id
+        GROUP BY t.tag
+    """)
+
+
+def _migrate_v5(cur: sqlite3.Cursor) -> None:
+    """v5: 反馈统计汇总表（总数、各评分数量、按天/按小时、按标签），由触发器在写入明细的同一事务中维护"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS feedback_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            interactions INTEGER NOT NULL DEFAULT 0,
+            rated INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS feedback_rating_counts (rating INTEGER PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)")
+    for table, key in (("feedback_daily", "day"), ("feedback_hourly", "hour")):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key} TEXT PRIMARY KEY,
+                interactions INTEGER NOT NULL DEFAULT 0,
+                rated INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                helpful INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS feedback_tag_counts (
+            tag TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            rated INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS interactions_rollup_ai AFTER INSERT ON interactions BEGIN
+            {_rollup_statements("new", 1)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS interactions_rollup_ad AFTER DELETE ON interactions BEGIN
+            {_rollup_statements("old", -1)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS interactions_rollup_au AFTER UPDATE OF rating, created_at ON interactions
+        WHEN old.rating IS NOT new.rating OR old.created_at IS NOT new.created_at BEGIN
+            {_rollup_statements("old", -1)}
+            {_rollup_statements("new", 1)}
+            UPDATE feedback_tag_counts
+            SET rated = rated + (new.rating IS NOT NULL) - (old.rating IS NOT NULL)
+            WHERE tag IN (SELECT tag FROM interaction_tags WHERE interaction_id = new.id);
+        END
+    """)
+    # 标签计数：已评价数按所属交互记录当前的评分计算
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interaction_tags_rollup_ai AFTER INSERT ON interaction_tags BEGIN
+            INSERT INTO feedback_tag_counts (tag, total, rated)
+            VALUES (new.tag, 1, (SELECT COUNT(*) FROM interactions WHERE id = new.interaction_id AND rating IS NOT NULL))
+            ON CONFLICT (tag) DO UPDATE SET total = total + 1, rated = rated + excluded.rated;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interaction_tags_rollup_ad AFTER DELETE ON interaction_tags BEGIN
+            UPDATE feedback_tag_counts
+            SET total = total - 1,
+                rated = rated - (SELECT COUNT(*) FROM interactions WHERE id = old.interaction_id AND rating IS NOT NULL)
+            WHERE tag = old.tag;
+            DELETE FROM feedback_tag_counts WHERE tag = old.tag AND total <= 0;
+        END
+    """)
+    # 删除交互记录时，明细行已不存在，需在清理标签前先扣减标签的已评价数
+    cur.execute("DROP TRIGGER IF EXISTS interactions_side_ad")
+    cur.execute("""
+        CREATE TRIGGER interactions_side_ad AFTER DELETE ON interactions BEGIN
+            UPDATE feedback_tag_counts SET rated = rated - 1
+            WHERE old.rating IS NOT NULL AND tag IN (SELECT tag FROM interaction_tags WHERE interaction_id = old.id);
+            DELETE FROM interaction_tags WHERE interaction_id = old.id;
+            DELETE FROM interaction_sources WHERE interaction_id = old.id;
+        END
+    """)
+    _rebuild_rollups(cur)
+
+
+def _migrate_v6(cur: sqlite3.Cursor) -> None:
+    """v6: 问题聚类表（质心、合并次数及各簇的问答/评分汇总），交互记录增加所属簇列"""
+    cur.execute("PRAGMA table_info(interactions)")
+    if "cluster_id" not in {col[1] for col in cur.fetchall()}:
+        cur.execute("ALTER TABLE interactions ADD COLUMN cluster_id INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_cluster ON interactions (cluster_id)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_clusters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dim INTEGER NOT NULL,
+            centroid BLOB NOT NULL,
+            weight INTEGER NOT NULL DEFAULT 0,
+            representative TEXT,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            rated INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            last_question TEXT,
+            last_asked TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_question_clusters_interactions ON question_clusters (interactions)")
+    # 簇的问答数和评分汇总随明细变化维护（质心和合并次数由聚类器写入）
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_cluster_au AFTER UPDATE OF cluster_id ON interactions
+        WHEN old.cluster_id IS NOT new.cluster_id BEGIN
+            UPDATE question_clusters
+            SET interactions = interactions - 1,
+                rated = rated - (old.rating IS NOT NULL),
+                rating_sum = rating_sum - COALESCE(old.rating, 0)
+            WHERE id = old.cluster_id;
+            UPDATE question_clusters
+            SET interactions = interactions + 1,
+                rated = rated + (new.rating IS NOT NULL),
+                rating_sum = rating_sum + COALESCE(new.rating, 0),
+                last_question = CASE WHEN last_asked IS NULL OR new.created_at >= last_asked THEN new.question ELSE last_question END,
+                last_asked = MAX(COALESCE(last_asked, ''), new.created_at)
+            WHERE id = new.cluster_id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_cluster_rating_au AFTER UPDATE OF rating ON interactions
+        WHEN new.cluster_id IS NOT NULL AND old.cluster_id IS new.cluster_id AND old.rating IS NOT new.rating BEGIN
+            UPDATE question_clusters
+            SET rated = rated + (new.rating IS NOT NULL) - (old.rating IS NOT NULL),
+                rating_sum = rating_sum + COALESCE(new.rating, 0) - COALESCE(old.rating, 0)
+            WHERE id = new.cluster_id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_cluster_ad AFTER DELETE ON interactions
+        WHEN old.cluster_id IS NOT NULL BEGIN
+            UPDATE question_clusters
+            SET interactions = interactions - 1,
+                rated = rated - (old.rating IS NOT NULL),
+                rating_sum = rating_sum - COALESCE(old.rating, 0)
+            WHERE id = old.cluster_id;
+        END
+    """)
+
+
+def _migrate_v7(cur: sqlite3.Cursor) -> None:
+    """v7: 保存每条交互的问题向量（float16 紧凑存储），离线分析无需重新调用嵌入接口"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS interaction_embeddings (
+            interaction_id INTEGER PRIMARY KEY,
+            model TEXT,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interaction_embeddings_model_dim ON interaction_embeddings (model, dim)")
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_embedding_ad AFTER DELETE ON interactions BEGIN
+            DELETE FROM interaction_embeddings WHERE interaction_id = old.id;
+        END
+    """)
+
+
+def _migrate_v8(cur: sqlite3.Cursor) -> None:
+    """v8: 每条交互的分阶段耗时（毫秒），按路径和阶段统计延迟分位数"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS interaction_timings (
+            interaction_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            path TEXT,
+            duration_ms REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (interaction_id, stage)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interaction_timings_created ON interaction_timings (created_at)")
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS interactions_timing_ad AFTER DELETE ON interactions BEGIN
+            DELETE FROM interaction_timings WHERE interaction_id = old.id;
+        END
+    """)
+
+
+def _has_fts(cur: sqlite3.Cursor) -> bool:
+    """数据库中是否已建立全文索引"""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='interactions_fts'")
+    return cur.fetchone() is not None
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """
+    将用户输入的关键词转换为 FTS5 查询（各关键词之间为 AND，关键词按短语匹配）
+    
+    Returns:
+        str: FTS5 查询串；存在少于3个字符的关键词（trigram 无法匹配）时返回None
+    """
+    terms = (query or "").split()
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    """转义 LIKE 通配符"""
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+# 表结构迁移：(版本号, 说明, 迁移函数)，版本号保存在 PRAGMA user_version 中
+# 新增迁移时在末尾追加，不要修改已发布的迁移
+MIGRATIONS = [
+    (1, "interactions 基础表", _migrate_v1),
+    (2, "问题哈希列与查询索引", _migrate_v2),
+    (3, "意图空间问答对表与全文索引", _migrate_v3),
+    (4, "标签与来源结构化表", _migrate_v4),
+    (5, "反馈统计汇总表", _migrate_v5),
+    (6, "问题聚类表", _migrate_v6),
+    (7, "交互问题向量表", _migrate_v7),
+    (8, "交互分阶段耗时表", _migrate_v8),
+]
 
 
 class FeedbackStore:
     def __init__(self, db_path: str = "./data/feedback.db"):
         self.db_path = db_path
         os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
-        self._init_db()
+        self._pool = get_connection_pool(self.db_path)
+        # 表结构检查在每个进程中只执行一次（页面每次重新运行都会创建 FeedbackStore）
+        key = os.path.abspath(self.db_path)
+        if key not in _initialized_dbs:
+            with _pools_lock:
+                if key not in _initialized_dbs:
+                    self._init_db()
+                    _initialized_dbs.add(key)
     
     @contextmanager
     def _get_db_connection(self) -> Iterator[sqlite3.Connection]:
         """
-        数据库连接上下文管理器
+        数据库连接上下文管理器（从连接池取出持久连接，退出时提交并归还）
         
         Yields:
             sqlite3.Connection: 数据库连接对象
@@ -26,7 +708,7 @@ class FeedbackStore:
                 cur = conn.cursor()
                 cur.execute(...)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._pool.acquire()
         try:
             yield conn
             conn.commit()
@@ -34,90 +716,45 @@ class FeedbackStore:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            self._pool.release(conn)
 
     def _init_db(self) -> None:
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        # 检查表是否存在
-        cur.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='interactions'
-        """)
-        table_exists = cur.fetchone() is not None
+        """
+        按版本号执行表结构迁移
         
-        if not table_exists:
-            # 创建新表，rating字段允许NULL，created_at不使用DEFAULT（使用Python本地时间）
-            cur.execute(
-                """
-                CREATE TABLE interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    sources TEXT,
-                    rating INTEGER,
-                    correction TEXT,
-                    created_at DATETIME
-                )
-                """
-            )
-        else:
-            # 表已存在，检查是否需要迁移（rating字段是否为NOT NULL）
-            # 获取表结构信息
-            cur.execute("PRAGMA table_info(interactions)")
-            columns = cur.fetchall()
-            rating_not_null = False
-            for col in columns:
-                if col[1] == 'rating' and col[3] == 1:  # col[3] 是 notnull 标志
-                    rating_not_null = True
-                    break
-            
-            # 如果rating字段是NOT NULL，需要迁移
-            if rating_not_null:
-                logging.info("检测到rating字段为NOT NULL，开始迁移数据库...")
+        当前版本记录在 PRAGMA user_version 中，依次执行所有更高版本的迁移，
+        每个迁移在独立事务中完成，失败时回滚并保持原版本
+        """
+        conn = self._pool.acquire()
+        try:
+            current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for version, description, migrate in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                logging.info(f"反馈数据库迁移到 v{version}: {description}")
                 try:
-                    # 创建临时表（不使用DEFAULT CURRENT_TIMESTAMP，使用Python本地时间）
-                    cur.execute("""
-                        CREATE TABLE interactions_new (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            question TEXT NOT NULL,
-                            answer TEXT NOT NULL,
-                            sources TEXT,
-                            rating INTEGER,
-                            correction TEXT,
-                            created_at DATETIME
-                        )
-                    """)
-                    
-                    # 复制数据（保持rating值不变，包括NULL）
-                    cur.execute("""
-                        INSERT INTO interactions_new 
-                        (id, question, answer, sources, rating, correction, created_at)
-                        SELECT id, question, answer, sources, rating, correction, created_at
-                        FROM interactions
-                    """)
-                    
-                    # 删除旧表
-                    cur.execute("DROP TABLE interactions")
-                    
-                    # 重命名新表
-                    cur.execute("ALTER TABLE interactions_new RENAME TO interactions")
-                    
-                    logging.info("数据库迁移完成：rating字段现在允许NULL")
+                    cur = conn.cursor()
+                    # 显式开启事务，使建表/改表语句也能随失败一起回滚
+                    cur.execute("BEGIN")
+                    migrate(cur)
+                    # PRAGMA 不支持参数绑定，version 为代码中的常量
+                    cur.execute(f"PRAGMA user_version = {int(version)}")
+                    conn.commit()
                 except Exception as e:
-                    logging.error(f"数据库迁移失败: {e}")
+                    logging.error(f"数据库迁移到 v{version} 失败: {e}")
                     conn.rollback()
                     raise
-        
-        conn.commit()
-        conn.close()
+                current_version = version
+            if _has_fts(conn.cursor()):
+                _fts_dbs.add(os.path.abspath(self.db_path))
+        finally:
+            self._pool.release(conn)
 
     def add_interaction(
         self,
         question: str,
         answer: str,
-        sources: Optional[str],
+        sources: Union[str, dict, None],
         rating: Optional[int] = None,
         correction: Optional[str] = None,
     ) -> int:
@@ -127,30 +764,71 @@ class FeedbackStore:
         Args:
             question: 用户问题
             answer: 助手回答
-            sources: 来源信息
+            sources: 来源信息（字典，或 str(dict) 字符串），其中的 tags 和 source_nodes 同时写入结构化表
             rating: 评分（None表示无反馈）
             correction: 改进建议
         
         Returns:
             int: 插入的记录ID
         """
-        # 使用本地时间（上海时间 UTC+8）
-        # 确保时间格式一致：YYYY-MM-DD HH:MM:SS
-        local_tz = timezone(timedelta(hours=8))  # 上海时间 UTC+8
-        local_time = datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
+        local_time = local_now()
+        sources_text, parsed_sources = _prepare_sources(sources)
+        start = time.monotonic()
         with self._get_db_connection() as conn:
             cur = conn.cursor()
             cur.execute(
-                "INSERT INTO interactions (question, answer, sources, rating, correction, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (question, answer, sources or "", rating, correction or "", local_time),
+                "INSERT INTO interactions (question, answer, sources, rating, correction, created_at, question_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (question, answer, sources_text, rating, correction or "", local_time, question_hash(question)),
             )
-            return cur.lastrowid
+            interaction_id = cur.lastrowid
+            _write_sources(cur, interaction_id, parsed_sources)
+        WRITE_SECONDS.labels("add").observe(time.monotonic() - start)
+        INTERACTIONS_WRITTEN.labels("single").inc()
+        if rating is not None:
+            FEEDBACK_RATINGS.labels(rating).inc()
+        return interaction_id
+    
+    def add_interactions_batch(self, records: List[dict]) -> List[int]:
+        """
+        在一个事务中批量添加无反馈的问答交互记录（写后日志队列使用）
+        
+        Args:
+            records: 记录列表，每项包含 question, answer, sources（字典或字符串）, created_at，
+                以及可选的 timings（RequestTimer.as_dict() 的结果）
+        
+        Returns:
+            List[int]: 与 records 顺序一致的记录ID列表
+        """
+        ids = []
+        start = time.monotonic()
+        with self._get_db_connection() as conn:
+            cur = conn.cursor()
+            for record in records:
+                sources_text, parsed_sources = _prepare_sources(record.get("sources"))
+                created_at = record.get("created_at") or local_now()
+                cur.execute(
+                    "INSERT INTO interactions (question, answer, sources, rating, correction, created_at, question_hash) VALUES (?, ?, ?, NULL, '', ?, ?)",
+                    (record["question"], record["answer"], sources_text, created_at, question_hash(record["question"])),
+                )
+                interaction_id = cur.lastrowid
+                _write_sources(cur, interaction_id, parsed_sources)
+                timings = record.get("timings")
+                if timings and timings.get("stages"):
+                    cur.executemany(
+                        "INSERT OR REPLACE INTO interaction_timings (interaction_id, stage, path, duration_ms, created_at) VALUES (?, ?, ?, ?, ?)",
+                        [(interaction_id, stage, timings.get("path"), float(ms), created_at)
+                         for stage, ms in timings["stages"].items()],
+                    )
+                ids.append(interaction_id)
+        WRITE_SECONDS.labels("batch").observe(time.monotonic() - start)
+        INTERACTIONS_WRITTEN.labels("batch").inc(len(ids))
+        return ids
     
     def add_interaction_without_feedback(
         self,
         question: str,
         answer: str,
-        sources: Optional[str] = None,
+        sources: Union[str, dict, None] = None,
     ) -> int:
         """
         添加无反馈的问答交互记录（用于统计高频问题）
@@ -170,26 +848,52 @@ class FeedbackStore:
         interaction_id: int,
         rating: int,
         correction: Optional[str] = None,
+        tags: Optional[List[str]] = None,
     ) -> bool:
         """
         更新交互记录的反馈信息
         
         Args:
-            interaction_id: 交互记录ID
+            interaction_id: 交互记录ID（写后日志队列返回的临时ID为负数，会先解析为实际ID）
             rating: 评分
             correction: 改进建议
+            tags: 问题类型标签（None 表示不修改），会替换已有标签并同步到 sources 字段
         
         Returns:
             bool: 是否更新成功
         """
+        if interaction_id is not None and interaction_id < 0:
+            from src.interaction_logger import resolve_interaction_id
+            resolved_id = resolve_interaction_id(interaction_id)
+            if resolved_id is None:
+                logging.error(f"更新反馈失败: 临时交互ID {interaction_id} 未能写入数据库")
+                return False
+            interaction_id = resolved_id
         try:
+            start = time.monotonic()
             with self._get_db_connection() as conn:
                 cur = conn.cursor()
                 cur.execute(
                     "UPDATE interactions SET rating = ?, correction = ? WHERE id = ?",
                     (rating, correction or "", interaction_id),
                 )
-                return cur.rowcount > 0
+                if cur.rowcount == 0:
+                    return False
+                if tags is not None:
+                    tags = _normalize_tags(tags)
+                    cur.execute("DELETE FROM interaction_tags WHERE interaction_id = ?", (interaction_id,))
+                    cur.executemany(
+                        "INSERT INTO interaction_tags (interaction_id, tag) VALUES (?, ?)",
+                        [(interaction_id, tag) for tag in tags],
+                    )
+                    # sources 字段保留完整的来源字典（详情展示和导出仍使用）
+                    row = cur.execute("SELECT sources FROM interactions WHERE id = ?", (interaction_id,)).fetchone()
+                    sources = parse_sources(row[0]) if row else {}
+                    sources["tags"] = tags
+                    cur.execute("UPDATE interactions SET sources = ? WHERE id = ?", (str(sources), interaction_id))
+            WRITE_SECONDS.labels("update").observe(time.monotonic() - start)
+            FEEDBACK_RATINGS.labels(rating).inc()
+            return True
         except Exception as e:
             logging.error(f"更新反馈失败: {e}")
             return False
@@ -344,7 +1048,8 @@ class FeedbackStore:
     def get_frequent_questions(self, min_count: int = 2, limit: int = 20) -> List[dict]:
         """
         获取高频问题（相同或相似问题出现次数多的）
-        统计所有问答交互，包括没有反馈的
+        统计所有问答交互，包括没有反馈的；按归一化问题哈希分组（忽略大小写、全半角、空白和结尾标点的差异），
+        展示每组最近一次的原始问题
         
         Args:
             min_count: 最少出现次数
@@ -357,6 +1062,7 @@ class FeedbackStore:
             cur = conn.cursor()
             
             # 统计每个问题出现的次数、平均评分和反馈数量
+            # SQLite 中与 MAX() 同时查询的裸列取自最大值所在的行，即最近一次提问的原文
             cur.execute("""
                 SELECT 
                     question,
@@ -365,7 +1071,7 @@ class FeedbackStore:
                     COUNT(rating) as feedback_count,
                     MAX(created_at) as last_asked
                 FROM interactions
-                GROUP BY question
+                GROUP BY question_hash
                 HAVING COUNT(*) >= ?
                 ORDER BY count DESC, avg_rating DESC
                 LIMIT ?
@@ -385,6 +1091,261 @@ class FeedbackStore:
         
         return frequent_questions
     
+    def load_question_clusters(self) -> List[Tuple[int, int, bytes, int]]:
+        """
+        加载全部问题簇的质心（聚类器启动时使用）
+        
+        Returns:
+            List[Tuple[int, int, bytes, int]]: (簇ID, 向量维度, 质心（float32 字节）, 合并次数) 列表
+        """
+        with self._get_db_connection() as conn:
+            return conn.execute("SELECT id, dim, centroid, weight FROM question_clusters ORDER BY id").fetchall()
+    
+    def save_cluster_assignments(
+        self,
+        new_clusters: List[Tuple[int, int, bytes, int, str]],
+        updated_clusters: List[Tuple[int, bytes, int]],
+        assignments: List[Tuple[int, int]],
+    ) -> Dict[int, int]:
+        """
+        在一个事务中写入一批聚类结果
+        
+        Args:
+            new_clusters: 新建簇列表 (临时簇ID（负数）, 向量维度, 质心, 合并次数, 代表问题)
+            updated_clusters: 质心有变化的已有簇 (簇ID, 质心, 合并次数)
+            assignments: 交互记录所属簇 (交互ID, 簇ID（可为临时簇ID）)
+        
+        Returns:
+            Dict[int, int]: 临时簇ID -> 实际簇ID
+        """
+        cluster_ids: Dict[int, int] = {}
+        with self._get_db_connection() as conn:
+            cur = conn.cursor()
+            for provisional_id, dim, centroid, weight, representative in new_clusters:
+                cur.execute(
+                    "INSERT INTO question_clusters (dim, centroid, weight, representative) VALUES (?, ?, ?, ?)",
+                    (dim, centroid, weight, representative),
+                )
+                cluster_ids[provisional_id] = cur.lastrowid
+            cur.executemany(
+                "UPDATE question_clusters SET centroid = ?, weight = ? WHERE id = ?",
+                [(centroid, weight, cluster_id) for cluster_id, centroid, weight in updated_clusters],
+            )
+            cur.executemany(
+                "UPDATE interactions SET cluster_id = ? WHERE id = ?",
+                [(cluster_ids.get(cluster_id, cluster_id), interaction_id) for interaction_id, cluster_id in assignments],
+            )
+        return cluster_ids
+    
+    def save_interaction_embeddings(self, items: List[Tuple[int, List[float]]], model: Optional[str] = None) -> int:
+        """
+        批量保存交互记录的问题向量（转换为 float16 存储）
+        
+        Args:
+            items: (交互ID, 问题向量) 列表
+            model: 嵌入模型名称（更换模型后向量不可混用）
+        
+        Returns:
+            int: 保存的向量数量
+        """
+        rows = []
+        for interaction_id, embedding in items:
+            vector = np.asarray(embedding, dtype=np.float16)
+            rows.append((interaction_id, model, int(vector.shape[0]), vector.tobytes()))
+        if not rows:
+            return 0
+        with self._get_db_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO interaction_embeddings (interaction_id, model, dim, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+    
+    def get_interaction_embeddings(
+        self,
+        model: Optional[str] = None,
+        dim: Optional[int] = None,
+        interaction_ids: Optional[List[int]] = None,
+        dtype=np.float32,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量读取问题向量为 NumPy 矩阵（一次读取全部 BLOB 后整体解码，不逐行转换）
+        
+        Args:
+            model: 嵌入模型名称，None 表示不筛选
+            dim: 向量维度，None 表示使用最近一条向量的维度（不同维度无法放入同一矩阵）
+            interaction_ids: 只读取这些交互记录，None 表示全部
+            dtype: 返回矩阵的数据类型（np.float16 可省去转换和一半内存）
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (交互ID数组 int64[n], 向量矩阵 [n, dim])，按交互ID升序
+        """
+        clauses, params = [], []
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        if interaction_ids is not None:
+            clauses.append("interaction_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps([int(i) for i in interaction_ids]))
+        with self._get_db_connection() as conn:
+            if dim is None:
+                where = " AND ".join(clauses) or "1"
+                row = conn.execute(
+                    f"SELECT dim FROM interaction_embeddings WHERE {where} ORDER BY interaction_id DESC LIMIT 1", params
+                ).fetchone()
+                if row is None:
+                    return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=dtype)
+                dim = row[0]
+            clauses.append("dim = ?")
+            params.append(dim)
+            rows = conn.execute(
+                f"SELECT interaction_id, vector FROM interaction_embeddings WHERE {' AND '.join(clauses)} ORDER BY interaction_id",
+                params,
+            ).fetchall()
+        
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float16).reshape(len(rows), dim)
+        return ids, matrix.astype(dtype, copy=False)
+    
+    def get_latency_percentiles(
+        self,
+        since: Optional[str] = None,
+        percentiles: Tuple[int, ...] = (50, 95, 99),
+    ) -> List[dict]:
+        """
+        按请求路径和阶段统计耗时分位数（最近秩法，排序和取秩都在数据库中完成，每个路径/阶段只返回一行）
+        
+        Args:
+            since: 只统计该时间（YYYY-MM-DD HH:MM:SS）之后的交互，None 表示全部
+            percentiles: 需要计算的分位数（0-100 的整数）
+        
+        Returns:
+            List[dict]: 每项包含 path, stage, count, mean_ms，以及 p50/p95/p99 等分位数（毫秒）
+        """
+        where, params = "1", []
+        if since:
+            where = "created_at >= ?"
+            params.append(since)
+        percentiles = tuple(int(p) for p in percentiles)
+        # 各分位数对应的秩 = ceil(p/100 * n)，至少为 1
+        target_rank = "MAX(1, (? * n + 99) / 100)"
+        columns = "".join(
+            f", MAX(CASE WHEN rank = {target_rank} THEN duration_ms END)" for _ in percentiles
+        )
+        rank_filter = " OR ".join(f"rank = {target_rank}" for _ in percentiles) or "0"
+        with self._get_db_connection() as conn:
+            rows = conn.execute(f"""
+                WITH ranked AS (
+                    SELECT path, stage, duration_ms,
+                           ROW_NUMBER() OVER (PARTITION BY path, stage ORDER BY duration_ms) AS rank,
+                           COUNT(*) OVER (PARTITION BY path, stage) AS n,
+                           AVG(duration_ms) OVER (PARTITION BY path, stage) AS mean_ms
+                    FROM interaction_timings
+                    WHERE {where}
+                )
+                SELECT path, stage, MAX(n), MAX(mean_ms){columns}
+                FROM ranked
+                WHERE {rank_filter}
+                GROUP BY path, stage
+                ORDER BY COALESCE(path, ''), stage
+            """, params + list(percentiles) * 2).fetchall()
+        
+        results = []
+        for row in rows:
+            entry = {"path": row[0], "stage": row[1], "count": row[2], "mean_ms": round(row[3], 2)}
+            for p, value in zip(percentiles, row[4:]):
+                entry[f"p{p}"] = round(value, 2) if value is not None else None
+            results.append(entry)
+        return results
+    
+    def get_frequent_intents(self, min_count: int = 2, limit: int = 20) -> List[dict]:
+        """
+        获取高频意图（按问题向量聚类，语义相近的不同问法计为同一意图）
+        
+        聚类之前的历史记录和未能计算向量的记录没有所属簇，按归一化问题哈希分组后一并统计：
+        与某个簇中已聚类记录问题相同的分组并入该簇，其余分组单独列出
+        
+        Args:
+            min_count: 最少出现次数
+            limit: 返回数量限制
+        
+        Returns:
+            List[dict]: 高频意图列表，字段与 get_frequent_questions 一致，另含 cluster_id（未聚类的分组为 None）
+                        和 representative（首个问法）
+        """
+        with self._get_db_connection() as conn:
+            # SQLite 中与 MAX() 同时查询的裸列取自最大值所在的行，即最近一次提问的原文
+            groups = conn.execute("""
+                WITH unclustered AS (
+                    SELECT question_hash, question, COUNT(*) AS n, COUNT(rating) AS rated,
+                           COALESCE(SUM(rating), 0) AS rating_sum, MAX(created_at) AS last_asked
+                    FROM interactions
+                    WHERE cluster_id IS NULL
+                    GROUP BY question_hash
+                ),
+                hash_clusters AS (
+                    -- 同一问题出现在多个簇中时取记录最多的簇
+                    SELECT question_hash, cluster_id FROM (
+                        SELECT question_hash, cluster_id,
+                               ROW_NUMBER() OVER (PARTITION BY question_hash ORDER BY COUNT(*) DESC, cluster_id) AS rn
+                        FROM interactions
+                        WHERE cluster_id IS NOT NULL AND question_hash IN (SELECT question_hash FROM unclustered)
+                        GROUP BY question_hash, cluster_id
+                    )
+                    WHERE rn = 1
+                )
+                SELECT u.question, u.n, u.rated, u.rating_sum, u.last_asked, h.cluster_id
+                FROM unclustered u LEFT JOIN hash_clusters h ON h.question_hash = u.question_hash
+            """).fetchall()
+            merged_ids = sorted({row[5] for row in groups if row[5] is not None})
+            clusters = conn.execute("""
+                SELECT id, representative, last_question, interactions, rated, rating_sum, last_asked
+                FROM question_clusters
+                WHERE interactions >= ? OR id IN (SELECT value FROM json_each(?))
+            """, (min_count, json.dumps(merged_ids))).fetchall()
+        
+        entries: Dict[Any, dict] = {
+            row[0]: {
+                "cluster_id": row[0],
+                "representative": row[1],
+                "question": row[2] or row[1],
+                "count": row[3],
+                "rated": row[4],
+                "rating_sum": row[5],
+                "last_asked": row[6],
+            }
+            for row in clusters
+        }
+        for index, (question, count, rated, rating_sum, last_asked, cluster_id) in enumerate(groups):
+            entry = entries.get(cluster_id) if cluster_id is not None else None
+            if entry is None:
+                entries[("question", index)] = {
+                    "cluster_id": None,
+                    "representative": question,
+                    "question": question,
+                    "count": count,
+                    "rated": rated,
+                    "rating_sum": rating_sum,
+                    "last_asked": last_asked,
+                }
+                continue
+            entry["count"] += count
+            entry["rated"] += rated
+            entry["rating_sum"] += rating_sum
+            if last_asked and (entry["last_asked"] is None or last_asked > entry["last_asked"]):
+                entry["question"] = question
+                entry["last_asked"] = last_asked
+        
+        frequent = [entry for entry in entries.values() if entry["count"] >= min_count]
+        frequent.sort(key=lambda entry: (entry["count"], entry["rating_sum"] / max(entry["rated"], 1)), reverse=True)
+        results = []
+        for entry in frequent[:limit]:
+            rated, rating_sum = entry.pop("rated"), entry.pop("rating_sum")
+            entry["avg_rating"] = round(rating_sum / rated, 2) if rated else None
+            entry["feedback_count"] = rated
+            results.append(entry)
+        return results
+    
     def get_high_quality_qa_pairs(self, min_rating: int = 4, limit: int = 50) -> List[dict]:
         """
         获取优质问答对（评分高或有改进建议的）
@@ -436,3 +1397,370 @@ class FeedbackStore:
         
         return qa_pairs
 
+    
+    def _keyword_filter(self, query: str, fts_table: str, alias: str) -> Tuple[str, str, list, str]:
+        """
+        构造关键词搜索的 SQL 片段
+        
+        Args:
+            query: 关键词（空格分隔多个关键词，需全部匹配）
+            fts_table: 全文索引表名
+            alias: 原文表别名
+        
+        Returns:
+            Tuple[str, str, list, str]: (JOIN 子句, WHERE 条件, 参数, 排序子句)
+        """
+        fts_query = _fts_query(query)
+        if fts_query is not None and os.path.abspath(self.db_path) in _fts_dbs:
+            join = f"JOIN {fts_table} ON {fts_table}.rowid = {alias}.id"
+            return join, f"{fts_table} MATCH ?", [fts_query], f"bm25({fts_table}), "
+        
+        # 关键词少于3个字符（trigram 无法匹配）或未建立全文索引时使用 LIKE
+        clauses, params = [], []
+        for term in (query or "").split():
+            pattern = _like_pattern(term)
+            clauses.append(f"({alias}.question LIKE ? ESCAPE '\\' OR {alias}.answer LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        return "", " AND ".join(clauses) or "1", params, ""
+    
+    def search(
+        self,
+        query: str,
+        rating_range: Optional[Tuple[int, int]] = None,
+        limit: Optional[int] = 20,
+        offset: int = 0,
+    ) -> List[dict]:
+        """
+        按关键词搜索交互记录（问题和回答），结果按相关度（BM25）排序
+        
+        Args:
+            query: 关键词，多个关键词用空格分隔，需全部匹配
+            rating_range: 评分范围 (最小, 最大)，-1 表示未评分
+            limit: 每页数量，None 表示不限制
+            offset: 偏移量（用于分页）
+        
+        Returns:
+            List[dict]: 交互记录列表，字段同 get_all_feedback
+        """
+        join, where, params, order = self._keyword_filter(query, "interactions_fts", "i")
+        sql = f"""
+            SELECT i.id, i.question, i.answer, i.sources, i.rating, i.correction, i.created_at
+            FROM interactions i {join}
+            WHERE {where}
+        """
+        if rating_range is not None:
+            sql += " AND COALESCE(i.rating, -1) BETWEEN ? AND ?"
+            params.extend(rating_range)
+        sql += f" ORDER BY {order}i.created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        
+        with self._get_db_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        return [
+            {
+                "id": row[0],
+                "question": row[1],
+                "answer": row[2],
+                "sources": row[3],
+                "rating": row[4],
+                "correction": row[5],
+                "created_at": row[6]
+            }
+            for row in rows
+        ]
+    
+    def count_search(self, query: str, rating_range: Optional[Tuple[int, int]] = None) -> int:
+        """
+        统计关键词搜索的匹配数量
+        
+        Args:
+            query: 关键词
+            rating_range: 评分范围 (最小, 最大)，-1 表示未评分
+        
+        Returns:
+            int: 匹配的记录数
+        """
+        join, where, params, _ = self._keyword_filter(query, "interactions_fts", "i")
+        sql = f"SELECT COUNT(*) FROM interactions i {join} WHERE {where}"
+        if rating_range is not None:
+            sql += " AND COALESCE(i.rating, -1) BETWEEN ? AND ?"
+            params.extend(rating_range)
+        with self._get_db_connection() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+    
+    def sync_intent_qa(self, qa_pairs: List[dict], fingerprint: str) -> bool:
+        """
+        将意图空间文件中解析出的问答对写入 intent_qa 表并重建全文索引
+        
+        Args:
+            qa_pairs: 问答对列表，每项包含 question, answer, source_file
+            fingerprint: 意图空间文件的指纹（如文件名、大小和修改时间的哈希），未变化时跳过
+        
+        Returns:
+            bool: 是否重新写入
+        """
+        with self._get_db_connection() as conn:
+            row = conn.execute("SELECT value FROM store_meta WHERE key = 'intent_qa_fingerprint'").fetchone()
+            if row is not None and row[0] == fingerprint:
+                return False
+            conn.execute("DELETE FROM intent_qa")
+            conn.executemany(
+                "INSERT INTO intent_qa (question, answer, source_file) VALUES (?, ?, ?)",
+                [(qa["question"], qa["answer"], qa.get("source_file")) for qa in qa_pairs],
+            )
+            if os.path.abspath(self.db_path) in _fts_dbs:
+                conn.execute("INSERT INTO intent_qa_fts (intent_qa_fts) VALUES ('rebuild')")
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('intent_qa_fingerprint', ?)",
+                (fingerprint,),
+            )
+        logging.info(f"意图空间问答对已同步到全文索引: {len(qa_pairs)} 条")
+        return True
+    
+    def search_intent_qa(
+        self,
+        query: str,
+        source_files: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[dict]:
+        """
+        按关键词搜索意图空间问答对（需先调用 sync_intent_qa），结果按相关度排序
+        
+        Args:
+            query: 关键词，多个关键词用空格分隔，需全部匹配
+            source_files: 只搜索这些文件中的问答对，None 表示全部
+            limit: 返回数量限制，None 表示不限制
+            offset: 偏移量
+        
+        Returns:
+            List[dict]: 问答对列表，每项包含 question, answer, source_file
+        """
+        join, where, params, order = self._keyword_filter(query, "intent_qa_fts", "q")
+        sql = f"SELECT q.question, q.answer, q.source_file FROM intent_qa q {join} WHERE {where}"
+        if source_files:
+            sql += f" AND q.source_file IN ({','.join('?' * len(source_files))})"
+            params.extend(source_files)
+        sql += f" ORDER BY {order}q.id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        
+        with self._get_db_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [{"question": row[0], "answer": row[1], "source_file": row[2]} for row in rows]
+    
+    def _interaction_filter(
+        self,
+        query: Optional[str] = None,
+        rating_range: Optional[Tuple[int, int]] = None,
+        tags: Optional[List[str]] = None,
+    ) -> Tuple[str, str, list]:
+        """
+        构造交互记录筛选条件（关键词、评分范围、标签）
+        
+        Returns:
+            Tuple[str, str, list]: (JOIN 子句, WHERE 条件, 参数)
+        """
+        join, clauses, params = "", [], []
+        if query and query.strip():
+            join, keyword_where, keyword_params, _ = self._keyword_filter(query, "interactions_fts", "i")
+            clauses.append(keyword_where)
+            params.extend(keyword_params)
+        if rating_range is not None:
+            low, high = rating_range
+            if low <= -1:
+                # 包含未评分（-1）
+                clauses.append("(i.rating IS NULL OR i.rating <= ?)")
+                params.append(high)
+            else:
+                clauses.append("i.rating BETWEEN ? AND ?")
+                params.extend([low, high])
+        if tags:
+            # 匹配任一标签（interaction_tags 主键 (tag, interaction_id) 即为索引）
+            placeholders = ", ".join("?" for _ in tags)
+            clauses.append(f"i.id IN (SELECT interaction_id FROM interaction_tags WHERE tag IN ({placeholders}))")
+            params.extend(tags)
+        return join, " AND ".join(clauses) or "1", params
+    
+    def query_interactions(
+        self,
+        query: Optional[str] = None,
+        rating_range: Optional[Tuple[int, int]] = None,
+        tags: Optional[List[str]] = None,
+        cursor: Optional[Tuple[str, int]] = None,
+        limit: int = 20,
+    ) -> Tuple[List[dict], Optional[Tuple[str, int]]]:
+        """
+        按时间倒序分页查询交互记录（键集分页，翻页代价与页码无关）
+        
+        Args:
+            query: 关键词（全文索引匹配），None 表示不筛选
+            rating_range: 评分范围 (最小, 最大)，-1 表示未评分
+            tags: 问题类型标签，匹配任一标签
+            cursor: 上一页返回的游标 (created_at, id)，None 表示第一页
+            limit: 每页数量
+        
+        Returns:
+            Tuple[List[dict], Optional[Tuple[str, int]]]: (本页记录（含 tags 标签列表）, 下一页游标)，没有下一页时游标为None
+        """
+        join, where, params = self._interaction_filter(query, rating_range, tags)
+        if cursor is not None:
+            where += " AND (i.created_at < ? OR (i.created_at = ? AND i.id < ?))"
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        sql = f"""
+            SELECT i.id, i.question, i.answer, i.sources, i.rating, i.correction, i.created_at,
+                   (SELECT json_group_array(t.tag) FROM interaction_tags t WHERE t.interaction_id = i.id)
+            FROM interactions i {join}
+            WHERE {where}
+            ORDER BY i.created_at DESC, i.id DESC
+            LIMIT ?
+        """
+        # 多取一条用于判断是否还有下一页
+        params.append(limit + 1)
+        
+        with self._get_db_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        records = [
+            {
+                "id": row[0],
+                "question": row[1],
+                "answer": row[2],
+                "sources": row[3],
+                "rating": row[4],
+                "correction": row[5],
+                "created_at": row[6],
+                "tags": json.loads(row[7]) if row[7] else []
+            }
+            for row in rows
+        ]
+        next_cursor = (rows[-1][6], rows[-1][0]) if has_more and rows else None
+        return records, next_cursor
+    
+    def count_interactions(
+        self,
+        query: Optional[str] = None,
+        rating_range: Optional[Tuple[int, int]] = None,
+        tags: Optional[List[str]] = None,
+    ) -> int:
+        """
+        统计符合筛选条件的交互记录数
+        
+        Args:
+            query: 关键词（全文索引匹配），None 表示不筛选
+            rating_range: 评分范围 (最小, 最大)，-1 表示未评分
+            tags: 问题类型标签，匹配任一标签
+        
+        Returns:
+            int: 记录数
+        """
+        join, where, params = self._interaction_filter(query, rating_range, tags)
+        with self._get_db_connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM interactions i {join} WHERE {where}", params).fetchone()[0]
+    
+    def get_feedback_stats(self, helpful_threshold: int = HELPFUL_RATING) -> dict:
+        """
+        获取反馈统计概览（只读取汇总表，不扫描明细）
+        
+        Args:
+            helpful_threshold: 评分不低于该值视为"有帮助"
+        
+        Returns:
+            dict: 包含 total（总数）, rated（已评价数）, avg_rating（平均评分）,
+                  helpful（有帮助数）, helpful_rate（有帮助占比，百分比）, rating_histogram（评分0-5的数量）
+        """
+        with self._get_db_connection() as conn:
+            totals = conn.execute("SELECT interactions, rated, rating_sum FROM feedback_totals WHERE id = 1").fetchone()
+            histogram_rows = conn.execute("SELECT rating, count FROM feedback_rating_counts WHERE count > 0").fetchall()
+        
+        total, rated, rating_sum = totals or (0, 0, 0)
+        rating_histogram = {rating: 0 for rating in range(6)}
+        rating_histogram.update(dict(histogram_rows))
+        helpful = sum(count for rating, count in rating_histogram.items() if rating >= helpful_threshold)
+        return {
+            "total": total,
+            "rated": rated,
+            "avg_rating": rating_sum / rated if rated else 0.0,
+            "helpful": helpful,
+            "helpful_rate": helpful / rated * 100 if rated else 0.0,
+            "rating_histogram": rating_histogram,
+        }
+    
+    def get_feedback_trend(self, granularity: str = "day", limit: int = 30) -> List[dict]:
+        """
+        获取按天或按小时汇总的交互与评价趋势（读取汇总表）
+        
+        Args:
+            granularity: "day" 或 "hour"
+            limit: 返回最近的桶数量
+        
+        Returns:
+            List[dict]: 按时间升序的列表，每项包含 bucket, interactions, rated, avg_rating, helpful_rate
+        """
+        if granularity not in ("day", "hour"):
+            raise ValueError(f"不支持的时间粒度: {granularity}")
+        table = "feedback_daily" if granularity == "day" else "feedback_hourly"
+        with self._get_db_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {granularity}, interactions, rated, rating_sum, helpful FROM {table} "
+                f"WHERE interactions > 0 ORDER BY {granularity} DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "bucket": bucket,
+                "interactions": interactions,
+                "rated": rated,
+                "avg_rating": rating_sum / rated if rated else None,
+                "helpful_rate": helpful / rated * 100 if rated else None,
+            }
+            for bucket, interactions, rated, rating_sum, helpful in reversed(rows)
+        ]
+    
+    def get_tag_counts(self, rated_only: bool = True, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        统计问题类型标签的数量（读取标签汇总表）
+        
+        Args:
+            rated_only: 是否只统计已评价的记录
+            limit: 返回数量限制（按数量从多到少），None 表示全部
+        
+        Returns:
+            List[Tuple[str, int]]: (标签, 数量) 列表
+        """
+        column = "rated" if rated_only else "total"
+        sql = f"SELECT tag, {column} FROM feedback_tag_counts WHERE {column} > 0 ORDER BY {column} DESC, tag"
+        params = []
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._get_db_connection() as conn:
+            return [(tag, count) for tag, count in conn.execute(sql, params).fetchall()]
+    
+    def rebuild_rollups(self) -> None:
+        """根据明细数据重新计算统计汇总表（手动修改数据库后使用）"""
+        with self._get_db_connection() as conn:
+            _rebuild_rollups(conn.cursor())
+    
+    def get_interaction_sources(self, interaction_id: int) -> List[dict]:
+        """
+        获取一条交互记录引用的来源节点
+        
+        Args:
+            interaction_id: 交互记录ID
+        
+        Returns:
+            List[dict]: 来源列表，每项包含 file_name 和 metadata（节点元数据）
+        """
+        with self._get_db_connection() as conn:
+            rows = conn.execute(
+                "SELECT file_name, metadata FROM interaction_sources WHERE interaction_id = ? ORDER BY position",
+                (interaction_id,),
+            ).fetchall()
+        return [{"file_name": file_name, "metadata": json.loads(metadata) if metadata else {}} for file_name, metadata in rows]
@@ -3,9 +3,14 @@
 处理不使用RAG的通用问答逻辑
 """
 import streamlit as st
+import time
 import logging
 from typing import Tuple, Optional
 from src.llm import get_llm_service
+from src.stream_renderer import StreamRenderer
+from src.request_timer import (
+    RequestTimer, PATH_GENERAL, STAGE_PROMPT, STAGE_LLM_FIRST_TOKEN, STAGE_LLM_STREAM, STAGE_RENDER,
+)
 from prompt import get_general_assistant_prompt
 
 logger = logging.getLogger(__name__)
@@ -15,7 +20,8 @@ def handle_general_assistant(
     prompt: str,
     message_placeholder,
     thinking_placeholder: Optional[st.delta_generator.DeltaGenerator],
-    show_thinking: bool = False
+    show_thinking: bool = False,
+    timer: Optional[RequestTimer] = None
 ) -> Tuple[str, list, str]:
     """
     处理通用助手模式的问答
@@ -25,6 +31,7 @@ def handle_general_assistant(
         message_placeholder: Streamlit占位符，用于显示回答
         thinking_placeholder: Streamlit占位符，用于显示思考过程（可选）
         show_thinking: 是否显示思考过程
+        timer: 请求计时器（可选），记录各阶段耗时
     
     Returns:
         Tuple[str, list, str]: (full_response, src_nodes, sources_str)
@@ -33,6 +40,8 @@ def handle_general_assistant(
             - sources_str: 来源字符串（通用助手为空字符串）
     """
     llm_service = get_llm_service()
+    timer = timer if timer is not None else RequestTimer()
+    timer.set_path(PATH_GENERAL)
     
     if not llm_service.is_available():
         error_msg = "❌ 未找到可用的 API 密钥。请在 config/config.json 中配置 DEEPSEEK_API_KEY、OPENAI_API_KEY 或 DASHSCOPE_API_KEY。"
@@ -42,6 +51,7 @@ def handle_general_assistant(
         return full_response, [], ""
     
     # 获取通用助手提示词
+    prompt_start = time.monotonic()
     try:
         system_prompt = get_general_assistant_prompt()
         # 将系统提示词添加到用户提示词前
@@ -49,37 +59,43 @@ def handle_general_assistant(
     except Exception as e:
         logger.warning(f"获取通用助手提示词失败: {e}，使用原始提示词")
         enhanced_prompt = prompt
+    timer.add(STAGE_PROMPT, time.monotonic() - prompt_start)
     
     # 使用LLM服务进行流式调用
     full_response = ""
     thinking_content_final = ""
     
     try:
-        # 流式调用
+        # 流式调用：内容先进入缓冲区，按固定帧率刷新到页面
+        message_renderer = StreamRenderer(message_placeholder)
+        thinking_renderer = StreamRenderer(thinking_placeholder, prefix="💭 **思考过程：**\n\n")
         stream_success = False
+        stream_start = time.monotonic()
+        first_token_at = None
         for chunk in llm_service.stream_chat(enhanced_prompt, show_thinking=show_thinking):
+            if first_token_at is None and chunk["type"] in ("thinking", "content"):
+                first_token_at = time.monotonic()
             if chunk["type"] == "error":
                 st.error(chunk["content"])
                 full_response = "抱歉，生成回答时出现错误。"
                 break
             elif chunk["type"] == "thinking":
-                # 显示思考过程
-                if thinking_placeholder:
-                    thinking_placeholder.markdown(f"💭 **思考过程：**\n\n{chunk['content']}▌")
-                thinking_content_final = chunk["content"]
+                # 显示思考过程（增量片段）
+                thinking_renderer.append(chunk["content"])
             elif chunk["type"] == "content":
-                # 显示回答内容
-                if chunk.get("thinking"):
-                    # 如果有思考过程，分离显示
-                    if thinking_placeholder:
-                        thinking_placeholder.markdown(f"💭 **思考过程：**\n\n{chunk['thinking']}▌")
-                    thinking_content_final = chunk["thinking"]
-                message_placeholder.markdown(chunk["content"] + "▌")
-                full_response = chunk["content"]
+                # 显示回答内容（增量片段）
+                message_renderer.append(chunk["content"])
             elif chunk["type"] == "done":
                 # 完成，最终处理
                 full_response = chunk["content"]
                 thinking_content_final = chunk.get("thinking", "")
+                llm_metrics = chunk.get("metrics") or {}
+                if llm_metrics:
+                    logger.info(
+                        f"LLM生成指标: provider={llm_metrics.get('provider')}, model={llm_metrics.get('model')}, "
+                        f"ttft={llm_metrics.get('ttft_ms')}ms, tokens={llm_metrics.get('output_tokens')}, "
+                        f"speed={llm_metrics.get('tokens_per_second')} tok/s"
+                    )
                 
                 # 清除流式输出时的thinking_placeholder
                 if thinking_placeholder:
@@ -87,7 +103,7 @@ def handle_general_assistant(
                     thinking_placeholder = None
                 
                 # 显示最终回答
-                message_placeholder.markdown(full_response)
+                message_renderer.finish(full_response)
                 
                 # 在回答完成后，使用expander显示思考过程（默认折叠）
                 if show_thinking and thinking_content_final:
@@ -96,6 +112,14 @@ def handle_general_assistant(
                 stream_success = True
                 break
         
+        # 流式循环的耗时 = 首字延迟 + 生成 + 渲染，渲染时间由渲染器单独累计
+        stream_elapsed = time.monotonic() - stream_start
+        render_seconds = message_renderer.render_seconds + thinking_renderer.render_seconds
+        first_token_seconds = (first_token_at or stream_start + stream_elapsed) - stream_start
+        timer.add(STAGE_LLM_FIRST_TOKEN, first_token_seconds)
+        timer.add(STAGE_LLM_STREAM, max(stream_elapsed - first_token_seconds - render_seconds, 0.0))
+        timer.add(STAGE_RENDER, render_seconds)
+        
         # 如果流式调用失败，尝试非流式作为回退
         if not stream_success and not full_response:
             result = llm_service.chat(enhanced_prompt, show_thinking=show_thinking)
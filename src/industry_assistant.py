@@ -3,41 +3,38 @@
 处理使用RAG的行业问答逻辑，包括意图空间和知识空间查询
 """
 import streamlit as st
+import time
 import logging
-import inspect
-from typing import Tuple, Optional, Any
+from typing import Tuple, Optional, Any, Iterator, List
 from src.retriever import RAGManager
+from src.llm_router import get_llm_router
+from src.context_packer import get_last_pack_stats
+from src.stream_renderer import StreamRenderer
+from src.llm_metrics import StreamMetrics
+from src.metrics import get_metrics_registry
+from src.thinking_parser import ThinkingParser, separate_thinking_and_answer
+from src.request_timer import (
+    RequestTimer, PATH_INTENT, PATH_KNOWLEDGE, STAGE_EMBEDDING, STAGE_INTENT_RETRIEVAL,
+    STAGE_KNOWLEDGE_RETRIEVAL, STAGE_PROMPT, STAGE_LLM_FIRST_TOKEN, STAGE_LLM_STREAM, STAGE_RENDER,
+)
+from llama_index.core.schema import QueryBundle
 
 logger = logging.getLogger(__name__)
 
-
-def _separate_thinking_and_answer(
-    content: str,
-    message_placeholder,
-    thinking_placeholder: Optional[st.delta_generator.DeltaGenerator],
-    show_thinking: bool
-) -> Tuple[str, str]:
-    """
-    分离思考过程和回答内容
-    
-    Returns:
-        Tuple[str, str]: (answer_part, thinking_part)
-    """
-    if show_thinking and "**回答：**" in content:
-        parts = content.split("**回答：**", 1)
-        if len(parts) == 2:
-            thinking_part = parts[0].replace("**思考过程：**", "").strip()
-            answer_part = parts[1].strip()
-            return answer_part, thinking_part
-    
-    return content, ""
+# 意图空间命中率指标（Prometheus）
+INTENT_LOOKUPS = get_metrics_registry().counter(
+    "rag_intent_lookups_total", "意图空间查询次数（hit 为直接返回意图答案）", ("result",))
+INTENT_SCORE = get_metrics_registry().histogram(
+    "rag_intent_score", "意图空间最高相似度分布",
+    buckets=(0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0))
 
 
 def _handle_streaming_response(
     response_stream: Any,
     message_placeholder,
     thinking_placeholder: Optional[st.delta_generator.DeltaGenerator],
-    show_thinking: bool
+    show_thinking: bool,
+    timer: Optional[RequestTimer] = None
 ) -> Tuple[str, str]:
     """
     处理流式响应
@@ -49,39 +46,39 @@ def _handle_streaming_response(
     thinking_content_final = ""
     
     if hasattr(response_stream, 'response_gen'):
-        # 流式响应
-        for token in response_stream.response_gen:
-            full_response += token
-            
-            # 如果启用了思考过程，在流式输出时分离显示
-            if show_thinking and "**思考过程：**" in full_response:
-                if "**回答：**" in full_response:
-                    # 已经包含回答部分，分离显示
-                    answer_part, thinking_part = _separate_thinking_and_answer(
-                        full_response, message_placeholder, thinking_placeholder, show_thinking
-                    )
-                    if thinking_placeholder and thinking_part:
-                        thinking_placeholder.markdown(f"💭 **思考过程：**\n\n{thinking_part}▌")
-                    message_placeholder.markdown(answer_part + "▌")
-                else:
-                    # 还在思考阶段
-                    thinking_part = full_response.replace("**思考过程：**", "").strip()
-                    if thinking_placeholder:
-                        thinking_placeholder.markdown(f"💭 **思考过程：**\n\n{thinking_part}▌")
-            else:
-                # 没有思考过程标记，直接显示
-                message_placeholder.markdown(full_response + "▌")
-        
-        # 最终处理：分离思考过程和回答
-        if show_thinking and "**回答：**" in full_response:
-            answer_part, thinking_part = _separate_thinking_and_answer(
-                full_response, message_placeholder, thinking_placeholder, show_thinking
-            )
-            message_placeholder.markdown(answer_part)
-            full_response = answer_part
-            thinking_content_final = thinking_part
+        # 流式响应：token 先进入缓冲区，按固定帧率刷新到页面
+        message_renderer = StreamRenderer(message_placeholder)
+        thinking_renderer = None
+        stream_start = time.monotonic()
+        first_token_state = {}
+        response_gen = _time_first_token(response_stream.response_gen, first_token_state)
+        if show_thinking:
+            # 启用思考过程时逐token增量解析，思考过程和回答分别渲染
+            thinking_renderer = StreamRenderer(thinking_placeholder, prefix="💭 **思考过程：**\n\n")
+            parser = ThinkingParser()
+            for token in response_gen:
+                for kind, text in parser.feed(token):
+                    if kind == "thinking":
+                        thinking_renderer.append(text)
+                    else:
+                        message_renderer.append(text)
+            thinking_content_final, full_response = parser.finish()
         else:
-            message_placeholder.markdown(full_response)
+            for token in response_gen:
+                message_renderer.append(token)
+            full_response = message_renderer.text
+        stream_elapsed = time.monotonic() - stream_start
+        
+        # 最终处理：显示完整回答
+        message_renderer.finish(full_response)
+        
+        if timer is not None:
+            # 流式循环的耗时 = 首字延迟 + 生成 + 渲染，渲染时间由渲染器单独累计
+            render_seconds = message_renderer.render_seconds + (thinking_renderer.render_seconds if thinking_renderer else 0.0)
+            first_token_seconds = first_token_state.get("first_token", stream_elapsed) - stream_start
+            timer.add(STAGE_LLM_FIRST_TOKEN, first_token_seconds)
+            timer.add(STAGE_LLM_STREAM, max(stream_elapsed - first_token_seconds - render_seconds, 0.0))
+            timer.add(STAGE_RENDER, render_seconds)
         
         # 清除流式输出时的thinking_placeholder，避免与expander重复
         if thinking_placeholder:
@@ -97,25 +94,102 @@ def _handle_streaming_response(
             full_response = str(response_stream)
         
         # 处理思考过程和回答的分离
-        if show_thinking and "**回答：**" in full_response:
-            answer_part, thinking_part = _separate_thinking_and_answer(
-                full_response, message_placeholder, thinking_placeholder, show_thinking
-            )
-            message_placeholder.markdown(answer_part)
-            full_response = answer_part
-            thinking_content_final = thinking_part
-        else:
-            message_placeholder.markdown(full_response)
+        if show_thinking:
+            thinking_content_final, full_response = separate_thinking_and_answer(full_response)
+        message_placeholder.markdown(full_response)
     
     return full_response, thinking_content_final
 
 
+def _time_first_token(response_gen: Iterator[str], state: dict) -> Iterator[str]:
+    """包装流式token生成器，在 state["first_token"] 中记录首个非空token到达的时间"""
+    for token in response_gen:
+        if token and "first_token" not in state:
+            state["first_token"] = time.monotonic()
+        yield token
+
+
+def _track_provider_stream(
+    response_gen: Iterator[str],
+    llm_provider: Optional[str],
+    model_name: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    包装流式token生成器，记录首字延迟、token间隔和输出速度，并将首字延迟和错误上报给LLM路由器
+    
+    LlamaIndex 的流式生成器是惰性的，首次迭代时才发起LLM请求，
+    因此从此处开始计时即为LLM的首字延迟（不含检索耗时）
+    """
+    router = get_llm_router()
+    metrics = StreamMetrics(llm_provider, model_name)
+    output_parts = []
+    try:
+        for token in response_gen:
+            if token and metrics.first_token_at is None and llm_provider:
+                router.record_success(llm_provider, time.monotonic() - metrics.started)
+            metrics.on_token(token)
+            output_parts.append(token)
+            yield token
+    except Exception:
+        metrics.finish("".join(output_parts), error=True)
+        if llm_provider:
+            router.record_error(llm_provider)
+        raise
+    result = metrics.finish("".join(output_parts))
+    logger.info(
+        f"LLM生成指标: provider={result['provider']}, model={result['model']}, ttft={result['ttft_ms']}ms, "
+        f"tokens={result['output_tokens']}, speed={result['tokens_per_second']} tok/s"
+    )
+
+
+def _failover_knowledge_stream(
+    rag_manager: RAGManager,
+    llm_providers: List[str],
+    response_gen: Iterator[str],
+    query_input: QueryBundle,
+    retrieved_nodes: list,
+    k_knowledge: int,
+    show_thinking: bool,
+) -> Iterator[str]:
+    """
+    知识空间回答的流式生成器，带提供商故障切换
+    
+    response_gen 为 llm_providers[0] 的流式生成器；当前提供商在产生首个token之前失败时，
+    用同一批检索结果向下一个提供商重新生成（与通用助手的 LLMRouter.stream_chat 一致），
+    已输出token之后的错误直接抛出
+    """
+    pending = list(llm_providers)
+    while True:
+        llm_provider = pending.pop(0)
+        got_token = False
+        try:
+            if response_gen is None:
+                query_engine = rag_manager.get_knowledge_query_engine(
+                    streaming=True,
+                    similarity_top_k=k_knowledge,
+                    show_thinking=show_thinking,
+                    llm_provider=llm_provider
+                )
+                response_gen = query_engine.synthesize(query_input, retrieved_nodes).response_gen
+            llm = rag_manager.get_llm(llm_provider)
+            for token in _track_provider_stream(response_gen, llm_provider, getattr(llm, "model", None)):
+                got_token = got_token or bool(token)
+                yield token
+            return
+        except Exception as e:
+            if got_token or not pending:
+                raise
+            logger.warning(f"{llm_provider} 请求失败，切换到 {pending[0]}: {e}")
+            response_gen = None
+
+
 def _query_intent_space(
     rag_manager: RAGManager,
     prompt: str,
     k_intent: int,
     intent_threshold: float,
-    show_thinking: bool
+    show_thinking: bool,
+    timer: Optional[RequestTimer] = None
 ) -> Tuple[str, float, list]:
     """
     查询意图空间
@@ -139,7 +213,12 @@ def _query_intent_space(
         # 使用检索器直接检索，而不是使用查询引擎（避免调用 LLM）
         # 这样可以获取原始文档和相似度分数
         retriever = rag_manager.intent_index.as_retriever(similarity_top_k=k_intent)
-        intent_src_nodes = retriever.retrieve(prompt)
+        # 查询向量由 RAGManager 缓存，知识空间检索时复用
+        timer = timer if timer is not None else RequestTimer()
+        with timer.stage(STAGE_EMBEDDING):
+            query_input = rag_manager.get_query_bundle(prompt)
+        with timer.stage(STAGE_INTENT_RETRIEVAL):
+            intent_src_nodes = retriever.retrieve(query_input)
         
         if intent_src_nodes:
             # 获取相似度分数最高的节点
@@ -181,7 +260,8 @@ def _query_knowledge_space(
     k_knowledge: int,
     message_placeholder,
     thinking_placeholder: Optional[st.delta_generator.DeltaGenerator],
-    show_thinking: bool
+    show_thinking: bool,
+    timer: Optional[RequestTimer] = None
 ) -> Tuple[str, str, list]:
     """
     查询知识空间
@@ -194,27 +274,31 @@ def _query_knowledge_space(
     src_nodes = []
     
     try:
-        # 检查方法是否支持 show_thinking 参数
-        sig = inspect.signature(rag_manager.get_knowledge_query_engine)
-        if 'show_thinking' in sig.parameters:
-            query_engine = rag_manager.get_knowledge_query_engine(
-                streaming=True, 
-                similarity_top_k=k_knowledge, 
-                show_thinking=show_thinking
-            )
-        else:
-            # 旧版本不支持 show_thinking 参数，使用默认调用
-            logger.warning("RAGManager 版本较旧，不支持 show_thinking 参数，使用默认调用")
-            query_engine = rag_manager.get_knowledge_query_engine(
-                streaming=True, 
-                similarity_top_k=k_knowledge
-            )
-            # 清除缓存以重新加载新版本
-            st.cache_resource.clear()
+        # 按路由器排序的提供商依次尝试，首选为当前最快的健康提供商
+        llm_providers = rag_manager.rank_llm_providers()
+        query_engine = rag_manager.get_knowledge_query_engine(
+            streaming=True, 
+            similarity_top_k=k_knowledge, 
+            show_thinking=show_thinking,
+            llm_provider=llm_providers[0]
+        )
         
-        response_stream = query_engine.query(prompt)
+        timer = timer if timer is not None else RequestTimer()
+        with timer.stage(STAGE_EMBEDDING):
+            query_input = rag_manager.get_query_bundle(prompt)
+        # 检索和提示词组装分开执行以便分别计时（与 query() 内部步骤相同）；
+        # 流式生成器是惰性的，synthesize 只组装提示词，首次迭代时才请求LLM
+        with timer.stage(STAGE_KNOWLEDGE_RETRIEVAL):
+            retrieved_nodes = query_engine.retrieve(query_input)
+        with timer.stage(STAGE_PROMPT):
+            response_stream = query_engine.synthesize(query_input, retrieved_nodes)
+        if hasattr(response_stream, 'response_gen'):
+            response_stream.response_gen = _failover_knowledge_stream(
+                rag_manager, llm_providers, response_stream.response_gen,
+                query_input, retrieved_nodes, k_knowledge, show_thinking,
+            )
         full_response, thinking_content_final = _handle_streaming_response(
-            response_stream, message_placeholder, thinking_placeholder, show_thinking
+            response_stream, message_placeholder, thinking_placeholder, show_thinking, timer
         )
         
         # 在回答完成后，使用expander显示思考过程（默认折叠）
@@ -224,6 +308,10 @@ def _query_knowledge_space(
         
         src_nodes = getattr(response_stream, "source_nodes", [])
         
+        pack_stats = get_last_pack_stats()
+        if pack_stats:
+            logger.info(f"上下文打包节省 {pack_stats['tokens_saved']} tokens: {pack_stats['tokens_before']} → {pack_stats['tokens_after']}")
+        
     except RuntimeError as e:
         # RAG未启用或嵌入不可用的错误
         error_msg = str(e)
@@ -307,7 +395,8 @@ def handle_industry_assistant(
     k_intent: int = 1,
     k_knowledge: int = 3,
     intent_threshold: float = 0.85,
-    show_thinking: bool = False
+    show_thinking: bool = False,
+    timer: Optional[RequestTimer] = None
 ) -> Tuple[str, list, str, bool, float]:
     """
     处理行业助手模式的问答
@@ -321,6 +410,7 @@ def handle_industry_assistant(
         k_knowledge: 知识空间检索数量
         intent_threshold: 意图空间相似度阈值
         show_thinking: 是否显示思考过程
+        timer: 请求计时器（可选），记录各阶段耗时和请求路径
     
     Returns:
         Tuple[str, list, str, bool, float]: (full_response, src_nodes, sources_str, used_intent_space, intent_score)
@@ -363,11 +453,12 @@ def handle_industry_assistant(
         return full_response, [], "", False, 0.0
     
     logger.info(f"开始处理行业助手查询: prompt={prompt[:50]}...")
+    timer = timer if timer is not None else RequestTimer()
     
     # 第一步：查询意图空间
     try:
         intent_text, intent_score, intent_src_nodes = _query_intent_space(
-            rag_manager, prompt, k_intent, intent_threshold, show_thinking
+            rag_manager, prompt, k_intent, intent_threshold, show_thinking, timer
         )
         logger.info(f"意图空间查询完成: score={intent_score:.4f}, threshold={intent_threshold}, has_text={len(intent_text) > 0}")
         
@@ -385,21 +476,19 @@ def handle_industry_assistant(
     
     # 如果意图空间相似度足够高，直接返回意图空间的答案
     use_intent = (intent_score >= intent_threshold) and (len(intent_text.strip()) > 0)
+    INTENT_LOOKUPS.labels("hit" if use_intent else "miss").inc()
+    INTENT_SCORE.observe(intent_score)
     
+    timer.set_path(PATH_INTENT if use_intent else PATH_KNOWLEDGE)
     if use_intent:
         # 使用意图空间的答案（快速响应）
         full_response = intent_text
         thinking_content_final = ""
         
         # 如果启用了思考过程，分离思考过程和回答
-        if show_thinking and "**回答：**" in full_response:
-            answer_part, thinking_part = _separate_thinking_and_answer(
-                full_response, message_placeholder, thinking_placeholder, show_thinking
-            )
-            message_placeholder.markdown(answer_part)
-            full_response = answer_part
-            thinking_content_final = thinking_part
-        else:
+        if show_thinking:
+            thinking_content_final, full_response = separate_thinking_and_answer(full_response)
+        with timer.stage(STAGE_RENDER):
             message_placeholder.markdown(full_response)
         
         # 清除流式输出时的thinking_placeholder，避免与expander重复
@@ -419,7 +508,7 @@ def handle_industry_assistant(
         try:
             full_response, thinking_content_final, src_nodes = _query_knowledge_space(
                 rag_manager, prompt, k_knowledge, message_placeholder, 
-                thinking_placeholder, show_thinking
+                thinking_placeholder, show_thinking, timer
             )
             logger.info(f"知识空间查询完成: response_length={len(full_response)}, src_nodes_count={len(src_nodes)}")
         except Exception as e:
@@ -0,0 +1,314 @@
+"""
+交互日志写后队列模块
+问答页面每次回答后都要记录一条交互，同步写 SQLite 会在写锁竞争时拖慢用户请求。
+这里先把记录放入内存队列并立即返回临时ID（负数），由后台线程批量在一个事务中写入，
+之后用临时ID提交反馈时再解析为数据库中的实际ID；写入后在同一后台线程中保存问题向量并分配问题簇。
+问题向量优先使用检索时已计算的向量；未携带向量的记录（如通用助手的问题）只在显式要求时由后台线程计算，
+不会在请求线程中调用嵌入接口
+"""
+import atexit
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from config.load_key import get_config
+from src.feedback import FeedbackStore, local_now
+from src.metrics import get_metrics_registry
+from src.question_clusters import QuestionClusterer, DEFAULT_CLUSTER_SIMILARITY_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# 写后队列默认参数（可在 config.json 的 "feedback" 中覆盖）
+DEFAULT_FEEDBACK_CONFIG = {
+    "write_behind": True,  # 是否异步写入交互记录
+    "queue_size": 1000,  # 队列容量，队列满时改为同步写入
+    "batch_size": 100,  # 每个事务最多写入的记录数
+    "flush_interval_ms": 200,  # 后台线程攒批的最长等待时间
+    "store_embeddings": True,  # 是否保存每条交互的问题向量（float16，供离线分析复用）
+    "cluster_questions": True,  # 是否按问题向量在线聚类（高频意图统计）
+    "cluster_similarity_threshold": DEFAULT_CLUSTER_SIMILARITY_THRESHOLD,  # 并入已有簇的最低余弦相似度
+    "embed_general_questions": False,  # 是否为通用助手的问题额外调用嵌入接口计算向量（会产生嵌入调用费用）
+}
+
+# 保留的临时ID映射数量（足够覆盖页面上仍可能提交反馈的回答）
+MAX_RESOLVED_IDS = 10000
+
+
+def get_feedback_config() -> Dict[str, Any]:
+    """获取写后队列配置（默认值与 config.json 合并）"""
+    feedback_config = dict(DEFAULT_FEEDBACK_CONFIG)
+    feedback_config.update(get_config().get("feedback", {}) or {})
+    return feedback_config
+
+
+class InteractionLogger:
+    """
+    交互记录写后队列
+
+    - log() 将记录放入有界队列并返回临时ID；队列已满或未启用时同步写入并返回实际ID
+    - 后台线程按 batch_size 攒批，在一个事务中写入，并记录临时ID到实际ID的映射
+    - resolve() 将临时ID解析为实际ID，记录尚未写入时会等待队列刷新
+    - 写入后保存问题向量并分配问题簇；记录未携带向量且 log(compute_embedding=True) 时，
+      由后台线程使用 set_embedder() 注册的函数计算（同步写入时跳过，不阻塞请求线程）
+    - 进程退出时自动刷新队列
+    """
+
+    def __init__(self, store: FeedbackStore, config: Optional[Dict[str, Any]] = None):
+        config = config or get_feedback_config()
+        self.store = store
+        self.enabled = bool(config["write_behind"])
+        self.batch_size = max(1, int(config["batch_size"]))
+        self.flush_interval = config["flush_interval_ms"] / 1000.0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=int(config["queue_size"]))
+        self._lock = threading.Lock()
+        self._flushed_cond = threading.Condition(self._lock)
+        self._next_provisional_id = -1
+        # 临时ID -> 实际ID（写入失败时为None）
+        self._resolved: "OrderedDict[int, Optional[int]]" = OrderedDict()
+        # 已从映射中淘汰的临时ID的下界：记录按入队顺序写入和淘汰，大于等于该值的临时ID都已过期
+        self._evicted_through = 0
+        self._counters = {"queued": 0, "flushed": 0, "failed": 0, "sync_writes": 0, "batches": 0,
+                          "embeddings": 0, "clustered": 0}
+        self.store_embeddings = bool(config.get("store_embeddings"))
+        self.clusterer: Optional[QuestionClusterer] = None
+        if config.get("cluster_questions"):
+            self.clusterer = QuestionClusterer(store, float(config["cluster_similarity_threshold"]))
+        self._embedder: Optional[Callable[[str], Optional[Sequence[float]]]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # 队列计数器已在 stats() 中维护，抓取指标时直接读取
+        metrics = get_metrics_registry()
+        metrics.register_callback(
+            "feedback_logger_records_total", "counter", "交互日志队列处理的记录数",
+            lambda: {(event,): value for event, value in self.stats().items() if event != "pending"},
+            ("event",),
+        )
+        metrics.register_callback(
+            "feedback_logger_queue_depth", "gauge", "交互日志队列当前积压的记录数",
+            lambda: {(): self._queue.qsize()},
+        )
+        metrics.register_callback(
+            "feedback_logger_queue_capacity", "gauge", "交互日志队列容量",
+            lambda: {(): self._queue.maxsize},
+        )
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name="interaction-logger")
+                    self._thread.start()
+
+    def set_embedder(self, embedder: Optional[Callable[[str], Optional[Sequence[float]]]]) -> None:
+        """
+        注册问题向量计算函数（如 RAGManager.get_query_embedding），用于为 compute_embedding=True 且未携带向量的记录聚类
+
+        Args:
+            embedder: 参数为问题文本、返回向量（失败时返回None）的函数，None 表示取消
+        """
+        self._embedder = embedder
+
+    def log(
+        self,
+        question: str,
+        answer: str,
+        sources: Union[str, dict, None] = None,
+        embedding: Optional[Sequence[float]] = None,
+        timings: Optional[Dict[str, Any]] = None,
+        compute_embedding: bool = False,
+    ) -> int:
+        """
+        记录一条无反馈的问答交互
+
+        Args:
+            question: 用户问题
+            answer: 助手回答
+            sources: 来源信息（字典或 str(dict) 字符串）
+            embedding: 问题向量（检索时已计算的），None 表示没有向量
+            timings: 分阶段耗时（RequestTimer.as_dict() 的结果）
+            compute_embedding: embedding 为 None 时是否在后台线程中额外调用嵌入接口计算（同步写入时忽略）
+
+        Returns:
+            int: 临时ID（负数，异步写入）或实际ID（同步写入）
+        """
+        record = {"question": question, "answer": answer, "sources": sources, "created_at": local_now(),
+                  "embedding": embedding, "timings": timings, "compute_embedding": compute_embedding}
+        if self.enabled and not self._closed:
+            with self._lock:
+                provisional_id = self._next_provisional_id
+                self._next_provisional_id -= 1
+            record["provisional_id"] = provisional_id
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                logger.warning("交互日志队列已满，改为同步写入")
+            else:
+                self._ensure_thread()
+                with self._lock:
+                    self._counters["queued"] += 1
+                return provisional_id
+
+        interaction_id = self.store.add_interactions_batch([record])[0]
+        with self._lock:
+            self._counters["sync_writes"] += 1
+        # 同步写入发生在请求线程中，不额外调用嵌入接口
+        self._process_embeddings([record], [interaction_id], allow_embedder=False)
+        return interaction_id
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # 在 flush_interval 内继续攒批，最多 batch_size 条
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            ids: List[Optional[int]] = self.store.add_interactions_batch(batch)
+            failed = False
+        except Exception as e:
+            logger.error(f"批量写入交互记录失败（{len(batch)} 条）: {e}", exc_info=True)
+            ids = [None] * len(batch)
+            failed = True
+        with self._lock:
+            for record, interaction_id in zip(batch, ids):
+                self._resolved[record["provisional_id"]] = interaction_id
+            while len(self._resolved) > MAX_RESOLVED_IDS:
+                evicted_id, _ = self._resolved.popitem(last=False)
+                self._evicted_through = min(self._evicted_through, evicted_id)
+            self._counters["failed" if failed else "flushed"] += len(batch)
+            self._counters["batches"] += 1
+            self._flushed_cond.notify_all()
+        if not failed:
+            self._process_embeddings(batch, ids)
+        for _ in batch:
+            self._queue.task_done()
+
+    def _process_embeddings(
+        self, records: List[Dict[str, Any]], ids: List[Optional[int]], allow_embedder: bool = True
+    ) -> None:
+        """
+        保存已写入记录的问题向量并分配问题簇（失败只记录日志，不影响交互记录本身）
+
+        Args:
+            records: 交互记录
+            ids: 对应的实际ID（写入失败为None）
+            allow_embedder: 是否允许为 compute_embedding 的记录调用嵌入函数（仅后台线程）
+        """
+        if self.clusterer is None and not self.store_embeddings:
+            return
+        items = []
+        for record, interaction_id in zip(records, ids):
+            embedding = record.get("embedding")
+            if embedding is None and allow_embedder and record.get("compute_embedding") and self._embedder is not None:
+                try:
+                    embedding = self._embedder(record["question"])
+                except Exception as e:
+                    logger.warning(f"计算问题向量失败: {e}")
+            if interaction_id is not None and embedding is not None:
+                items.append((interaction_id, record["question"], embedding))
+        if not items:
+            return
+        if self.store_embeddings:
+            try:
+                model = (get_config().get("embedding", {}) or {}).get("model_name")
+                saved = self.store.save_interaction_embeddings(
+                    [(interaction_id, embedding) for interaction_id, _, embedding in items], model=model
+                )
+                with self._lock:
+                    self._counters["embeddings"] += saved
+            except Exception as e:
+                logger.error(f"保存问题向量失败（{len(items)} 条）: {e}", exc_info=True)
+        if self.clusterer is not None:
+            try:
+                self.clusterer.assign(items)
+            except Exception as e:
+                logger.error(f"问题聚类失败（{len(items)} 条）: {e}", exc_info=True)
+                return
+            with self._lock:
+                self._counters["clustered"] += len(items)
+
+    def resolve(self, provisional_id: int, timeout: float = 5.0) -> Optional[int]:
+        """
+        将临时ID解析为实际ID
+
+        Args:
+            provisional_id: log() 返回的ID（正数直接返回）
+            timeout: 记录尚未写入时的最长等待时间（秒）
+
+        Returns:
+            int: 实际ID，写入失败、超时或映射已过期时返回None
+        """
+        if provisional_id >= 0:
+            return provisional_id
+        with self._lock:
+            if provisional_id in self._resolved:
+                return self._resolved[provisional_id]
+            if provisional_id < self._next_provisional_id:
+                return None  # 不是本进程分配的ID
+            if provisional_id >= self._evicted_through:
+                return None  # 已写入但映射已被淘汰，无需等待
+            self._flushed_cond.wait_for(
+                lambda: provisional_id in self._resolved or provisional_id >= self._evicted_through,
+                timeout=timeout,
+            )
+            return self._resolved.get(provisional_id)
+
+    def flush(self) -> None:
+        """阻塞直到队列中的记录全部写入"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """停止接收异步记录并刷新队列（进程退出时调用）"""
+        self._closed = True
+        if self._thread is None:
+            return
+        pending = self._queue.qsize()
+        if pending:
+            logger.info(f"进程退出前刷新交互日志队列: {pending} 条")
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """获取队列计数器（已入队、已写入、写入失败、同步写入、批次数、已保存向量、已聚类、当前积压）"""
+        with self._lock:
+            result = dict(self._counters)
+        result["pending"] = self._queue.qsize()
+        return result
+
+
+# 全局交互日志实例
+_interaction_logger = None
+_interaction_logger_lock = threading.Lock()
+
+def get_interaction_logger() -> InteractionLogger:
+    """获取交互日志写后队列实例（单例模式）"""
+    global _interaction_logger
+    if _interaction_logger is None:
+        with _interaction_logger_lock:
+            if _interaction_logger is None:
+                _interaction_logger = InteractionLogger(FeedbackStore())
+                atexit.register(_interaction_logger.close)
+    return _interaction_logger
+
+
+def resolve_interaction_id(interaction_id: int, timeout: float = 5.0) -> Optional[int]:
+    """
+    将交互ID解析为数据库中的实际ID（FeedbackStore 更新反馈时使用）
+
+    Args:
+        interaction_id: 交互ID，负数为写后队列分配的临时ID
+        timeout: 记录尚未写入时的最长等待时间（秒）
+
+    Returns:
+        int: 实际ID，无法解析时返回None
+    """
+    if interaction_id >= 0:
+        return interaction_id
+    return get_interaction_logger().resolve(interaction_id, timeout=timeout)
@@ -7,14 +7,17 @@ import sys
 import logging
 from pathlib import Path
 from typing import Optional, Generator, Tuple, Dict, Any
-from openai import OpenAI
 
 # 添加项目根目录到路径
 project_root = Path(__file__).resolve().parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from config.load_key import get_api_key, get_model_config, get_available_llm
+from src.providers import get_provider_registry
+from src.llm_router import get_llm_router
+from src.thinking_parser import ThinkingParser, separate_thinking_and_answer
+from src.llm_metrics import StreamMetrics, LLM_REQUESTS
+from src.tracing import current_trace
 try:
     from prompt import get_general_assistant_prompt
 except ImportError:
@@ -24,6 +27,26 @@ except ImportError:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def _add_llm_span(trace, start_ms: float, result: Dict[str, Any], prompt_chars: int, error: Optional[Exception] = None) -> None:
+    """将一次流式调用的指标记录为本地链路中的 llm span（未采样时不做任何事）"""
+    if trace is None:
+        return
+    attributes = {
+        "provider": result.get("provider"),
+        "model": result.get("model"),
+        "prompt_chars": prompt_chars,
+        "output_tokens": result.get("output_tokens"),
+        "ttft_ms": result.get("ttft_ms"),
+        "tokens_per_second": result.get("tokens_per_second"),
+    }
+    if error is not None:
+        attributes["error"] = f"{type(error).__name__}: {error}"[:200]
+    trace.add_span("llm", start_ms, trace.offset_ms() - start_ms, attributes)
+
+
+# 思考过程输出要求（追加在用户问题之后）
+THINKING_INSTRUCTION = "\n\n## 回答要求\n在回答之前，请先展示你的思考过程，包括：\n1. 理解问题的关键点\n2. 分析问题的思路\n3. 组织答案的逻辑\n\n请按以下格式输出：\n\n**思考过程：**\n[你的思考过程]\n\n**回答：**\n[你的最终回答]"
+
 class LLMService:
     """LLM服务类，负责大模型的调用"""
     
@@ -35,41 +58,21 @@ class LLMService:
         self._init_client()
     
     def _init_client(self) -> None:
-        """初始化LLM客户端，按优先级选择可用的API"""
-        # 按优先级获取API密钥
-        deepseek_api_key = get_api_key("DEEPSEEK_API_KEY")
-        openai_api_key = get_api_key("OPENAI_API_KEY")
-        dashscope_api_key = get_api_key("DASHSCOPE_API_KEY")
-        
-        if deepseek_api_key:
-            # 使用 DeepSeek API
-            self.client = OpenAI(
-                api_key=deepseek_api_key,
-                base_url="https://api.deepseek.com/v1"
-            )
-            self.model_name = "deepseek-chat"
-            self.provider = "deepseek"
-            logging.info("使用 DeepSeek API")
-        elif openai_api_key:
-            # 使用 OpenAI API
-            self.client = OpenAI(api_key=openai_api_key)
-            self.model_name = "gpt-3.5-turbo"
-            self.provider = "openai"
-            logging.info("使用 OpenAI API")
-        elif dashscope_api_key:
-            # 使用 DashScope (Qwen) API
-            self.client = OpenAI(
-                api_key=dashscope_api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-            )
-            self.model_name = "qwen-plus"
-            self.provider = "qwen"
-            logging.info("使用 DashScope (Qwen) API")
-        else:
+        """初始化LLM客户端，按配置的优先级从提供商注册表选择可用的API"""
+        registry = get_provider_registry()
+        spec = registry.get_default_provider()
+        if spec is None:
             logging.warning("未找到可用的 API 密钥")
             self.client = None
             self.model_name = None
             self.provider = None
+            return
+        
+        # 客户端复用注册表中按 base_url 共享的HTTP连接池
+        self.client = registry.get_openai_client(spec.name)
+        self.model_name = spec.model_name
+        self.provider = spec.name
+        logging.info(f"使用 {spec.name} API ({spec.model_name})")
     
     def is_available(self) -> bool:
         """检查LLM服务是否可用"""
@@ -86,7 +89,7 @@ class LLMService:
         Returns:
             Tuple[str, str]: (system_prompt, user_prompt)
         """
-        # 加载通用助手提示词作为系统消息
+        # 加载通用助手提示词作为系统消息（提示词注册表缓存，文件修改后自动重新加载）
         if get_general_assistant_prompt is not None:
             try:
                 system_prompt = get_general_assistant_prompt()
@@ -98,32 +101,12 @@ class LLMService:
         
         # 如果启用思考过程，在提示词中添加要求
         if show_thinking:
-            thinking_instruction = "\n\n## 回答要求\n在回答之前，请先展示你的思考过程，包括：\n1. 理解问题的关键点\n2. 分析问题的思路\n3. 组织答案的逻辑\n\n请按以下格式输出：\n\n**思考过程：**\n[你的思考过程]\n\n**回答：**\n[你的最终回答]"
-            user_prompt_with_thinking = user_prompt + thinking_instruction
+            user_prompt_with_thinking = user_prompt + THINKING_INSTRUCTION
         else:
             user_prompt_with_thinking = user_prompt
         
         return system_prompt, user_prompt_with_thinking
     
-    def _separate_thinking_and_answer(self, full_response: str) -> Tuple[str, str]:
-        """
-        分离思考过程和回答
-        
-        Args:
-            full_response: 完整的响应内容
-        
-        Returns:
-            Tuple[str, str]: (thinking_part, answer_part)
-        """
-        if "**回答：**" in full_response:
-            parts = full_response.split("**回答：**", 1)
-            if len(parts) == 2:
-                thinking_part = parts[0].replace("**思考过程：**", "").strip()
-                answer_part = parts[1].strip()
-                return thinking_part, answer_part
-        
-        return "", full_response
-    
     def stream_chat(
         self, 
         user_prompt: str, 
@@ -139,9 +122,9 @@ class LLMService:
         Yields:
             Dict[str, Any]: 包含以下键的字典
                 - "type": "thinking" 或 "content" 或 "done"
-                - "content": 内容（token或完整内容）
-                - "thinking": 思考过程（如果有）
-                - "answer": 最终回答（done时）
+                - "content": thinking/content 时为本次新增的片段，done 时为完整回答
+                - "thinking": 完整的思考过程（done时）
+                - "metrics": 首字延迟、token间隔、输出速度等生成指标（done/error时）
         """
         if not self.is_available():
             yield {
@@ -152,92 +135,99 @@ class LLMService:
         
         system_prompt, user_prompt_final = self._prepare_prompt(user_prompt, show_thinking)
         
-        full_response = ""
-        thinking_content = ""
-        is_thinking_phase = True
+        parser = ThinkingParser() if show_thinking else None
+        answer_parts = []
+        thinking_parts = []
+        output_parts = []  # 全部输出（含思考内容），用于统计输出token数
+        
+        provider = self.provider
+        metrics = StreamMetrics(provider, self.model_name)
+        # 通用助手不经过LlamaIndex，LLM调用在本地链路中单独记录为一个span
+        trace = current_trace()
+        span_start_ms = trace.offset_ms() if trace is not None else 0.0
         
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model_name,
+            # 经路由器选择当前最快的健康提供商（必要时对冲/切换）
+            stream = get_llm_router().stream_chat(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt_final}
-                ],
-                stream=True
+                ]
             )
             
-            for chunk in stream:
+            for provider, chunk in stream:
+                if provider != metrics.provider:
+                    # 路由器切换了提供商，指标记到实际产生输出的提供商
+                    metrics.provider = provider
+                    spec = get_provider_registry().get_provider(provider)
+                    metrics.model = spec.model_name if spec is not None else None
+                if not chunk.choices:
+                    continue
                 delta = getattr(chunk.choices[0], "delta", None)
                 if delta is None:
                     continue
                 
                 # 检查是否有思考内容（支持思考模型的reasoning_content）
-                if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                    thinking_content += delta.reasoning_content
+                reasoning = getattr(delta, "reasoning_content", None)
+                if reasoning:
+                    metrics.on_token(reasoning)
+                    output_parts.append(reasoning)
+                    thinking_parts.append(reasoning)
                     yield {
                         "type": "thinking",
-                        "content": thinking_content,
+                        "content": reasoning,
                         "is_streaming": True
                     }
-                    is_thinking_phase = True
                 
                 # 处理正常内容
                 token = getattr(delta, "content", None) or ""
-                if token:
-                    full_response += token
-                    
-                    # 如果启用了思考过程，检查是否包含思考标记
-                    if show_thinking and "**思考过程：**" in full_response:
-                        if "**回答：**" in full_response:
-                            # 已经包含回答部分，分离显示
-                            thinking_part, answer_part = self._separate_thinking_and_answer(full_response)
-                            yield {
-                                "type": "content",
-                                "content": answer_part,
-                                "thinking": thinking_part,
-                                "is_streaming": True
-                            }
-                        else:
-                            # 还在思考阶段
-                            thinking_part = full_response.replace("**思考过程：**", "").strip()
-                            yield {
-                                "type": "thinking",
-                                "content": thinking_part,
-                                "is_streaming": True
-                            }
-                    else:
-                        # 没有思考过程标记，直接显示
-                        yield {
-                            "type": "content",
-                            "content": full_response,
-                            "is_streaming": True
-                        }
+                if not token:
+                    continue
+                metrics.on_token(token)
+                output_parts.append(token)
+                if parser is None:
+                    answer_parts.append(token)
+                    yield {
+                        "type": "content",
+                        "content": token,
+                        "is_streaming": True
+                    }
+                    continue
+                # 启用思考过程时，增量解析思考过程/回答标记
+                for kind, text in parser.feed(token):
+                    yield {
+                        "type": "thinking" if kind == "thinking" else "content",
+                        "content": text,
+                        "is_streaming": True
+                    }
             
             # 最终处理：分离思考过程和回答
-            thinking_part_final = ""
-            answer_part_final = ""
-            
-            if show_thinking and "**回答：**" in full_response:
-                thinking_part_final, answer_part_final = self._separate_thinking_and_answer(full_response)
-            elif thinking_content:
-                # 如果有来自reasoning_content的思考内容
-                thinking_part_final = thinking_content
-                answer_part_final = full_response
-            else:
-                answer_part_final = full_response
+            thinking_part_final = "".join(thinking_parts)
+            answer_part_final = "".join(answer_parts)
+            if parser is not None:
+                parsed_thinking, answer_part_final = parser.finish()
+                # 没有回答标记时保留来自reasoning_content的思考内容
+                thinking_part_final = parsed_thinking or thinking_part_final
             
+            result = metrics.finish("".join(output_parts))
+            _add_llm_span(trace, span_start_ms, result, len(system_prompt) + len(user_prompt_final))
             yield {
                 "type": "done",
                 "content": answer_part_final,
                 "thinking": thinking_part_final,
+                "provider": provider,
+                "metrics": result,
                 "is_streaming": False
             }
             
         except Exception as e:
             logging.error(f"流式调用LLM失败: {e}")
+            result = metrics.finish("".join(output_parts), error=True)
+            _add_llm_span(trace, span_start_ms, result, len(system_prompt) + len(user_prompt_final), error=e)
             yield {
                 "type": "error",
-                "content": f"流式输出错误: {e}"
+                "content": f"流式输出错误: {e}",
+                "metrics": result
             }
     
     def chat(
@@ -267,22 +257,32 @@ class LLMService:
         
         system_prompt, user_prompt_final = self._prepare_prompt(user_prompt, show_thinking)
         
+        # 非流式调用同样使用路由器选择的首选提供商
+        router = get_llm_router()
+        provider = router.choose() or self.provider
+        registry = get_provider_registry()
+        spec = registry.get_provider(provider)
+        client = registry.get_openai_client(provider) if spec else self.client
+        model_name = spec.model_name if spec else self.model_name
+        
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model_name,
+            resp = client.chat.completions.create(
+                model=model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt_final}
                 ]
             )
             full_response = resp.choices[0].message.content
+            router.record_success(provider)
+            LLM_REQUESTS.labels(provider, model_name, "chat", "ok").inc()
             
             # 处理思考过程和回答的分离
             thinking_part = ""
             answer_part = ""
             
-            if show_thinking and "**回答：**" in full_response:
-                thinking_part, answer_part = self._separate_thinking_and_answer(full_response)
+            if show_thinking:
+                thinking_part, answer_part = separate_thinking_and_answer(full_response)
             else:
                 answer_part = full_response
             
@@ -293,6 +293,8 @@ class LLMService:
             }
             
         except Exception as e:
+            router.record_error(provider)
+            LLM_REQUESTS.labels(provider, model_name, "chat", "error").inc()
             logging.error(f"调用LLM失败: {e}")
             return {
                 "success": False,
@@ -0,0 +1,267 @@
+"""
+LLM 流式生成指标模块
+记录每次流式调用的首字延迟（TTFT）、token 间隔、总生成时间和输出速度（tokens/秒），
+按 (提供商, 模型) 维护进程内的滚动直方图，供容量规划和提供商选择使用
+"""
+import math
+import time
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from src.metrics import get_metrics_registry, LLM_LATENCY_BUCKETS
+
+# 直方图桶上界（固定桶，超过最后一个桶的计入 +Inf）
+TTFT_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+TOKEN_GAP_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 40, 60, 80, 120, 200)
+TOTAL_BUCKETS_MS = (1000, 2000, 5000, 10000, 20000, 40000, 80000)
+
+# 滚动窗口大小（每个直方图保留的最近样本数）
+ROLLING_WINDOW = 500
+
+# Prometheus 指标（累计值，与上面的滚动窗口统计并行维护）
+_metrics = get_metrics_registry()
+LLM_REQUESTS = _metrics.counter(
+    "llm_requests_total", "LLM调用次数", ("provider", "model", "mode", "status"))
+LLM_OUTPUT_TOKENS = _metrics.counter(
+    "llm_output_tokens_total", "LLM输出token数", ("provider", "model"))
+LLM_TTFT_SECONDS = _metrics.histogram(
+    "llm_time_to_first_token_seconds", "LLM流式调用首字延迟（秒）", LLM_LATENCY_BUCKETS, ("provider", "model"))
+LLM_DURATION_SECONDS = _metrics.histogram(
+    "llm_stream_duration_seconds", "LLM流式调用总耗时（秒）", LLM_LATENCY_BUCKETS, ("provider", "model"))
+LLM_TOKENS_PER_SECOND = _metrics.histogram(
+    "llm_tokens_per_second", "LLM流式调用输出速度（tokens/秒）", TOKENS_PER_SECOND_BUCKETS, ("provider", "model"))
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """
+    最近秩法分位数（链路追踪页面和基准测试共用）
+
+    Args:
+        values: 样本（无需排序）
+        p: 分位数（0-100）
+
+    Returns:
+        Optional[float]: 升序第 ceil(p * n / 100) 个样本，没有样本时返回None
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(p * len(values) / 100))
+    return values[min(rank, len(values)) - 1]
+
+
+class RollingHistogram:
+    """
+    固定桶的滚动直方图
+
+    - 只保留最近 window 个样本，桶计数随样本进出窗口增减，observe() 为 O(桶数)
+    - 分位数只在 snapshot() 时对窗口排序计算
+    """
+
+    def __init__(self, buckets: Sequence[float], window: int = ROLLING_WINDOW):
+        self.buckets = tuple(buckets)
+        self._values: Deque[float] = deque()
+        self._window = window
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.total_count = 0  # 累计样本数（不受窗口限制）
+        self.total_sum = 0.0
+
+    def _bucket_index(self, value: float) -> int:
+        for index, upper in enumerate(self.buckets):
+            if value <= upper:
+                return index
+        return len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """记录一个样本"""
+        self._values.append(value)
+        self._counts[self._bucket_index(value)] += 1
+        if len(self._values) > self._window:
+            self._counts[self._bucket_index(self._values.popleft())] -= 1
+        self.total_count += 1
+        self.total_sum += value
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Returns:
+            dict: count（窗口内样本数）, mean, p50, p95, p99, buckets（{上界: 窗口内计数}，"+Inf" 为溢出桶）
+        """
+        values = sorted(self._values)
+        buckets = {upper: count for upper, count in zip(self.buckets, self._counts)}
+        buckets["+Inf"] = self._counts[-1]
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "buckets": buckets,
+        }
+
+
+class StreamMetrics:
+    """
+    单次流式调用的计时器
+
+    用法：
+        metrics = StreamMetrics(provider, model)
+        for token in stream:
+            metrics.on_token(token)
+        result = metrics.finish(full_text)
+    """
+
+    def __init__(self, provider: Optional[str], model: Optional[str]):
+        self.provider = provider
+        self.model = model
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.gaps: List[float] = []
+        self.chunks = 0
+        self.result: Optional[Dict[str, object]] = None
+
+    def on_token(self, token: str) -> None:
+        """记录一个非空token（或增量片段）到达"""
+        if not token:
+            return
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.chunks += 1
+
+    def finish(self, output_text: str = "", output_tokens: Optional[int] = None, error: bool = False) -> Dict[str, object]:
+        """
+        结束计时并计入全局直方图（重复调用返回首次的结果）
+
+        Args:
+            output_text: 完整输出文本（用于统计输出token数）
+            output_tokens: 已知的输出token数，None 表示按 output_text 计算
+            error: 调用是否失败
+
+        Returns:
+            dict: provider, model, ttft_ms, total_ms, generation_ms, output_tokens, tokens_per_second,
+                  chunks, gap_mean_ms, gap_max_ms, error
+        """
+        if self.result is not None:
+            return self.result
+        finished = time.monotonic()
+        if output_tokens is None:
+            output_tokens = _count_tokens(output_text)
+        ttft = self.first_token_at - self.started if self.first_token_at is not None else None
+        generation = (self.last_token_at - self.first_token_at) if self.first_token_at is not None else 0.0
+        # 输出速度按首个片段之后生成的token计算（首个片段的耗时已计入首字延迟）；
+        # 只有一个片段时没有生成区间，用总耗时估算
+        tokens_per_second = None
+        if output_tokens:
+            if self.chunks > 1 and generation > 0:
+                tokens_per_second = output_tokens * (self.chunks - 1) / self.chunks / generation
+            elif finished > self.started:
+                tokens_per_second = output_tokens / (finished - self.started)
+        self.result = {
+            "provider": self.provider,
+            "model": self.model,
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "total_ms": round((finished - self.started) * 1000, 1),
+            "generation_ms": round(generation * 1000, 1),
+            "output_tokens": output_tokens,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second is not None else None,
+            "chunks": self.chunks,
+            "gap_mean_ms": round(sum(self.gaps) / len(self.gaps) * 1000, 2) if self.gaps else None,
+            "gap_max_ms": round(max(self.gaps) * 1000, 2) if self.gaps else None,
+            "error": error,
+        }
+        get_llm_metrics().record(self.result, self.gaps)
+        return self.result
+
+
+def _count_tokens(text: str) -> int:
+    # 与上下文打包使用同一计数方式（tiktoken 不可用时按字符估算）
+    from src.context_packer import count_tokens
+    return count_tokens(text)
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.output_tokens = 0
+        self.ttft = RollingHistogram(TTFT_BUCKETS_MS)
+        self.token_gap = RollingHistogram(TOKEN_GAP_BUCKETS_MS)
+        self.tokens_per_second = RollingHistogram(TOKENS_PER_SECOND_BUCKETS)
+        self.total = RollingHistogram(TOTAL_BUCKETS_MS)
+
+
+class LLMMetrics:
+    """按 (提供商, 模型) 汇总的流式生成指标"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], _ModelStats] = {}
+
+    def record(self, result: Dict[str, object], gaps: Sequence[float] = ()) -> None:
+        """计入一次调用的结果（StreamMetrics.finish 自动调用）"""
+        key = (result.get("provider") or "unknown", result.get("model") or "unknown")
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _ModelStats()
+            stats.calls += 1
+            if result.get("error"):
+                stats.errors += 1
+            stats.output_tokens += result.get("output_tokens") or 0
+            if result.get("ttft_ms") is not None:
+                stats.ttft.observe(result["ttft_ms"])
+            if result.get("tokens_per_second") is not None:
+                stats.tokens_per_second.observe(result["tokens_per_second"])
+            stats.total.observe(result["total_ms"])
+            for gap in gaps:
+                stats.token_gap.observe(gap * 1000)
+        provider, model = key
+        LLM_REQUESTS.labels(provider, model, "stream", "error" if result.get("error") else "ok").inc()
+        LLM_OUTPUT_TOKENS.labels(provider, model).inc(result.get("output_tokens") or 0)
+        if result.get("ttft_ms") is not None:
+            LLM_TTFT_SECONDS.labels(provider, model).observe(result["ttft_ms"] / 1000)
+        if result.get("tokens_per_second") is not None:
+            LLM_TOKENS_PER_SECOND.labels(provider, model).observe(result["tokens_per_second"])
+        LLM_DURATION_SECONDS.labels(provider, model).observe(result["total_ms"] / 1000)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """
+        Returns:
+            List[dict]: 每个 (提供商, 模型) 一项，包含 calls, errors, output_tokens，
+                        以及 ttft_ms / token_gap_ms / tokens_per_second / total_ms 的直方图快照
+        """
+        with self._lock:
+            return [
+                {
+                    "provider": provider,
+                    "model": model,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "output_tokens": stats.output_tokens,
+                    "ttft_ms": stats.ttft.snapshot(),
+                    "token_gap_ms": stats.token_gap.snapshot(),
+                    "tokens_per_second": stats.tokens_per_second.snapshot(),
+                    "total_ms": stats.total.snapshot(),
+                }
+                for (provider, model), stats in sorted(self._stats.items())
+            ]
+
+
+# 全局LLM指标实例
+_llm_metrics = None
+_llm_metrics_lock = threading.Lock()
+
+def get_llm_metrics() -> LLMMetrics:
+    """获取LLM流式生成指标实例（单例模式）"""
+    global _llm_metrics
+    if _llm_metrics is None:
+        with _llm_metrics_lock:
+            if _llm_metrics is None:
+                _llm_metrics = LLMMetrics()
+    return _llm_metrics
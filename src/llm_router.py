@@ -0,0 +1,337 @@
+"""
+LLM路由模块
+按提供商统计滚动的首字延迟（TTFT）和错误率，将每个请求发送到当前最快的健康提供商，
+并支持对冲请求：主请求在截止时间内没有返回首个token时，向下一个提供商发送重复请求，先出首字者胜出
+"""
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+from config.load_key import get_config
+from src.providers import get_provider_registry
+from src.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# 路由默认参数（可在 config.json 的 "routing" 中覆盖）
+DEFAULT_ROUTING_CONFIG = {
+    "enabled": True,
+    "window_size": 50,  # 每个提供商保留的最近请求数
+    "max_error_rate": 0.5,  # 错误率超过该值视为不健康
+    "min_samples": 4,  # 计算错误率所需的最少样本数
+    "cooldown_seconds": 30,  # 不健康提供商的冷却时间，冷却结束后重新参与路由
+    "hedge_enabled": False,  # 是否启用对冲请求
+    "hedge_delay_ms": 1500,  # 主请求超过该时间没有首字则发送对冲请求
+    "error_penalty_ms": 2000,  # 排序时按错误率加到首字延迟上的惩罚（错误率100%时的毫秒数）
+}
+
+
+def get_routing_config() -> Dict[str, Any]:
+    """获取路由配置（默认值与 config.json 合并）"""
+    routing_config = dict(DEFAULT_ROUTING_CONFIG)
+    routing_config.update(get_config().get("routing", {}) or {})
+    return routing_config
+
+
+class ProviderHealth:
+    """单个提供商的滚动统计"""
+
+    def __init__(self, window_size: int):
+        self._lock = threading.Lock()
+        self.ttfts: deque = deque(maxlen=window_size)  # 最近成功请求的首字延迟（秒）
+        self.outcomes: deque = deque(maxlen=window_size)  # 最近请求是否成功
+        self.unhealthy_until = 0.0
+
+    def record_success(self, ttft: Optional[float]) -> None:
+        with self._lock:
+            if ttft is not None:
+                self.ttfts.append(ttft)
+            self.outcomes.append(True)
+
+    def record_error(self, max_error_rate: float, min_samples: int, cooldown: float) -> None:
+        with self._lock:
+            self.outcomes.append(False)
+            if len(self.outcomes) >= min_samples and self._error_rate() > max_error_rate:
+                self.unhealthy_until = time.monotonic() + cooldown
+
+    def _error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate()
+
+    @property
+    def sample_count(self) -> int:
+        """滚动窗口中的请求数（含非流式请求和失败请求）"""
+        with self._lock:
+            return len(self.outcomes)
+
+    @property
+    def ttft_estimate(self) -> Optional[float]:
+        """首字延迟估计值（滚动窗口中位数），没有样本时返回None"""
+        with self._lock:
+            if not self.ttfts:
+                return None
+            samples = sorted(self.ttfts)
+            return samples[len(samples) // 2]
+
+    def is_healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+
+class LLMRouter:
+    """
+    多提供商路由器
+
+    排序规则：健康的提供商在前；还没有任何请求样本的提供商优先被探测一次；
+    其余按 首字延迟中位数 + 错误率 × error_penalty_ms 从小到大排列，
+    只有非流式样本（没有首字延迟）的提供商排在有首字延迟的之后，得分相同时按 priority_order 排列
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._health: Dict[str, ProviderHealth] = {}
+        # 健康状态只在抓取指标时读取
+        metrics = get_metrics_registry()
+        metrics.register_callback(
+            "llm_provider_healthy", "gauge", "提供商是否健康（1 健康，0 冷却中）",
+            lambda: {(provider,): int(stats["healthy"]) for provider, stats in self.snapshot().items()},
+            ("provider",),
+        )
+        metrics.register_callback(
+            "llm_provider_error_rate", "gauge", "提供商滚动窗口错误率",
+            lambda: {(provider,): stats["error_rate"] for provider, stats in self.snapshot().items()},
+            ("provider",),
+        )
+
+    def _get_health(self, provider: str) -> ProviderHealth:
+        health = self._health.get(provider)
+        if health is None:
+            with self._lock:
+                health = self._health.get(provider)
+                if health is None:
+                    health = ProviderHealth(get_routing_config()["window_size"])
+                    self._health[provider] = health
+        return health
+
+    def record_success(self, provider: str, ttft: Optional[float] = None) -> None:
+        """记录一次成功请求及其首字延迟（秒，非流式请求传None）"""
+        self._get_health(provider).record_success(ttft)
+
+    def record_error(self, provider: str) -> None:
+        """记录一次失败请求"""
+        routing_config = get_routing_config()
+        self._get_health(provider).record_error(
+            routing_config["max_error_rate"],
+            routing_config["min_samples"],
+            routing_config["cooldown_seconds"],
+        )
+
+    def rank(self) -> List[str]:
+        """
+        按路由规则对可用提供商排序
+
+        Returns:
+            List[str]: 提供商名称列表，第一个为当前首选
+        """
+        providers = get_provider_registry().list_available()
+        routing_config = get_routing_config()
+        if not routing_config["enabled"]:
+            return providers
+        error_penalty = routing_config["error_penalty_ms"] / 1000.0
+
+        def sort_key(item: Tuple[int, str]):
+            priority, provider = item
+            health = self._get_health(provider)
+            ttft = health.ttft_estimate
+            return (
+                not health.is_healthy(),
+                health.sample_count > 0,
+                ttft is None,
+                (ttft or 0.0) + health.error_rate * error_penalty,
+                priority,
+            )
+
+        return [provider for _, provider in sorted(enumerate(providers), key=sort_key)]
+
+    def choose(self) -> Optional[str]:
+        """获取当前首选的提供商"""
+        ranked = self.rank()
+        return ranked[0] if ranked else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """获取各提供商的当前统计（用于展示和调试）"""
+        result = {}
+        for provider in get_provider_registry().list_available():
+            health = self._get_health(provider)
+            result[provider] = {
+                "ttft_ms": round(health.ttft_estimate * 1000, 1) if health.ttft_estimate is not None else None,
+                "error_rate": round(health.error_rate, 3),
+                "healthy": health.is_healthy(),
+            }
+        return result
+
+    def stream_chat(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[Tuple[str, Any]]:
+        """
+        路由并流式调用 chat.completions
+
+        首选提供商在产生首个token之前失败时，自动切换到下一个提供商；
+        启用对冲时，首选提供商超过 hedge_delay_ms 没有首字则并发请求下一个提供商，
+        先产生首字的请求胜出，另一个请求被取消
+
+        Args:
+            messages: 对话消息列表
+            **kwargs: 透传给 chat.completions.create 的其他参数
+
+        Yields:
+            Tuple[str, Any]: (provider, chunk)
+        """
+        routing_config = get_routing_config()
+        ranked = self.rank()
+        if not ranked:
+            raise RuntimeError("没有可用的LLM提供商")
+
+        events: "queue.Queue[Tuple[_StreamAttempt, str, Any]]" = queue.Queue()
+        pending = list(ranked)
+        active: List[_StreamAttempt] = []
+        winner: Optional[_StreamAttempt] = None
+        hedge_delay = routing_config["hedge_delay_ms"] / 1000.0
+        hedge_enabled = routing_config["hedge_enabled"]
+        last_error: Optional[Exception] = None
+
+        def launch() -> None:
+            attempt = _StreamAttempt(self, pending.pop(0), messages, kwargs, events)
+            active.append(attempt)
+            attempt.start()
+
+        launch()
+        try:
+            while True:
+                # 尚未决出胜者时，等待对冲截止时间；之后正常等待
+                can_hedge = winner is None and hedge_enabled and pending and len(active) < 2
+                try:
+                    attempt, kind, payload = events.get(timeout=hedge_delay if can_hedge else None)
+                except queue.Empty:
+                    logger.info(f"{active[0].provider} 超过 {routing_config['hedge_delay_ms']}ms 未返回首字，发送对冲请求到 {pending[0]}")
+                    launch()
+                    continue
+
+                if winner is not None and attempt is not winner:
+                    continue  # 已取消请求的残余事件
+
+                if kind == "chunk":
+                    if winner is None:
+                        winner = attempt
+                        for other in active:
+                            if other is not attempt:
+                                other.cancel()
+                    yield attempt.provider, payload
+                elif kind == "done":
+                    if winner is None:
+                        winner = attempt
+                    return
+                elif kind == "error":
+                    if winner is attempt:
+                        raise payload
+                    last_error = payload
+                    active.remove(attempt)
+                    if not active:
+                        if not pending:
+                            raise last_error
+                        logger.warning(f"{attempt.provider} 请求失败，切换到 {pending[0]}: {payload}")
+                        launch()
+        finally:
+            for attempt in active:
+                if attempt is not winner:
+                    attempt.cancel()
+            if winner is not None:
+                winner.cancel()
+
+
+class _StreamAttempt(threading.Thread):
+    """在后台线程中向单个提供商发起流式请求，将结果写入事件队列"""
+
+    def __init__(self, router: LLMRouter, provider: str, messages, kwargs, events: queue.Queue):
+        super().__init__(daemon=True, name=f"llm-stream-{provider}")
+        self.router = router
+        self.provider = provider
+        self.messages = messages
+        self.kwargs = kwargs
+        self.events = events
+        self.cancelled = threading.Event()
+        self.stream = None
+
+    def run(self) -> None:
+        registry = get_provider_registry()
+        spec = registry.get_provider(self.provider)
+        client = registry.get_openai_client(self.provider)
+        start = time.monotonic()
+        got_first_token = False
+        try:
+            if spec is None or client is None:
+                raise RuntimeError(f"提供商 {self.provider} 不可用")
+            self.stream = client.chat.completions.create(
+                model=spec.model_name,
+                messages=self.messages,
+                stream=True,
+                **self.kwargs,
+            )
+            for chunk in self.stream:
+                if self.cancelled.is_set():
+                    return
+                if not got_first_token:
+                    # 首个token之前的chunk（如仅包含role）不参与胜负判定
+                    if not _has_token(chunk):
+                        continue
+                    got_first_token = True
+                    self.router.record_success(self.provider, time.monotonic() - start)
+                self.events.put((self, "chunk", chunk))
+            self.events.put((self, "done", None))
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.router.record_error(self.provider)
+                self.events.put((self, "error", e))
+        finally:
+            self._close_stream()
+
+    def cancel(self) -> None:
+        """取消请求并关闭底层连接"""
+        self.cancelled.set()
+        self._close_stream()
+
+    def _close_stream(self) -> None:
+        stream = self.stream
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+def _has_token(chunk: Any) -> bool:
+    """判断流式chunk中是否包含实际输出的token（回答或思考内容）"""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return False
+    delta = getattr(choices[0], "delta", None)
+    if delta is None:
+        return False
+    return bool(getattr(delta, "content", None) or getattr(delta, "reasoning_content", None))
+
+
+# 全局路由器实例
+_llm_router = None
+
+def get_llm_router() -> LLMRouter:
+    """获取LLM路由器实例（单例模式）"""
+    global _llm_router
+    if _llm_router is None:
+        _llm_router = LLMRouter()
+    return _llm_router
@@ -0,0 +1,422 @@
+"""
+Prometheus 指标模块
+进程内指标注册表（计数器、仪表、固定桶直方图），由 RAGManager、LLM 调用、FeedbackStore 和各缓存在运行时更新，
+通过本地 HTTP 端点或定期写入的文本文件以 Prometheus 文本格式导出。
+热路径上的更新只是一次加锁的内存加法；队列深度、提供商健康度等状态由回调在抓取时读取，不在请求中维护
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config.load_key import get_config
+
+logger = logging.getLogger(__name__)
+
+# 导出默认参数（可在 config.json 的 "monitoring.metrics" 中覆盖）
+DEFAULT_METRICS_CONFIG = {
+    "enabled": False,
+    "host": "127.0.0.1",  # HTTP 端点监听地址
+    "port": 9108,  # HTTP 端点端口，0 表示不启动 HTTP 端点
+    "file_path": "",  # 非空时定期写入该文件（可配合 node_exporter 的 textfile 收集器）
+    "file_interval_seconds": 15,  # 写入文件的间隔
+}
+
+# 常用直方图桶（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def get_metrics_config() -> Dict[str, Any]:
+    """获取指标导出配置（默认值与 config.json 合并）"""
+    metrics_config = dict(DEFAULT_METRICS_CONFIG)
+    metrics_config.update((get_config().get("monitoring", {}) or {}).get("metrics", {}) or {})
+    return metrics_config
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """增加计数（amount 必须非负）"""
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf 桶
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """记录一个样本（二分查找所在桶，抓取时再累加为 Prometheus 的累计桶）"""
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any):
+        """
+        获取一组标签值对应的时间序列（首次使用时创建，之后只是一次字典查找）
+
+        Args:
+            values: 与 labelnames 顺序一致的标签值
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际传入 {key}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """无标签计数器的计数"""
+        self.labels().inc(amount)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """各组标签值的当前计数（基准测试按前后差值统计命中率）"""
+        return {key: child.value for key, child in self._items()}
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        """设置无标签仪表的值"""
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """固定桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(upper) for upper in buckets if upper != float("inf")))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """无标签直方图记录样本"""
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._items():
+            counts, total_sum = child.snapshot()
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(upper)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _CallbackMetric:
+    """抓取时由回调函数给出取值的指标（队列深度、缓存大小等已在别处维护的状态）"""
+
+    def __init__(self, name: str, kind: str, documentation: str,
+                 callback: Callable[[], Dict[Tuple[str, ...], float]], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in (self.callback() or {}).items():
+            if value is None:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            labels = _format_labels(self.labelnames, tuple(str(part) for part in key))
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表
+
+    - 同名指标只注册一次，重复注册返回已有实例（模块重新导入或页面重新运行时不会重复创建）
+    - 回调指标按名称替换，新的 RAGManager 等实例注册后旧实例随之释放
+    - render() 只读取内存中的计数和回调结果，抓取开销与时间序列数成正比
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, name: str, cls, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """注册（或获取已注册的）计数器"""
+        return self._register(name, Counter, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """注册（或获取已注册的）仪表"""
+        return self._register(name, Gauge, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        """注册（或获取已注册的）固定桶直方图"""
+        return self._register(name, Histogram, documentation, buckets, labelnames)
+
+    def register_callback(
+        self,
+        name: str,
+        kind: str,
+        documentation: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        """
+        注册抓取时求值的指标（同名回调会被替换）
+
+        Args:
+            name: 指标名称
+            kind: "gauge" 或 "counter"
+            documentation: 指标说明
+            callback: 返回 {标签值元组: 取值} 的函数，无标签时键为 ()
+            labelnames: 标签名称
+        """
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None and not isinstance(existing, _CallbackMetric):
+                raise ValueError(f"指标 {name} 已注册为 {existing.kind}")
+            self._metrics[name] = _CallbackMetric(name, kind, documentation, callback, labelnames)
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式导出全部指标"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines: List[str] = []
+        for name, metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 单个回调失败不影响其他指标
+                logger.warning(f"导出指标 {name} 失败: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+_metrics_registry = None
+_metrics_registry_lock = threading.Lock()
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取指标注册表实例（单例模式）"""
+    global _metrics_registry
+    if _metrics_registry is None:
+        with _metrics_registry_lock:
+            if _metrics_registry is None:
+                _metrics_registry = MetricsRegistry()
+    return _metrics_registry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不写访问日志
+        pass
+
+
+class MetricsExporter:
+    """
+    指标导出器
+
+    - port 非 0 时在后台线程中启动 HTTP 端点（GET /metrics）
+    - file_path 非空时后台线程每隔 file_interval_seconds 秒写入一次文件（先写临时文件再替换，读取方不会读到半个文件）
+    """
+
+    def __init__(self, registry: MetricsRegistry, config: Optional[Dict[str, Any]] = None):
+        self.registry = registry
+        self.config = config or get_metrics_config()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        port = int(self.config.get("port") or 0)
+        if port:
+            handler = type("MetricsHandler", (_MetricsHandler,), {"registry": self.registry})
+            try:
+                self.server = ThreadingHTTPServer((self.config["host"], port), handler)
+            except OSError as e:
+                # 多个进程共用同一配置时只有第一个能绑定端口
+                logger.warning(f"指标端点启动失败（{self.config['host']}:{port}）: {e}")
+            else:
+                self.server.daemon_threads = True
+                self._spawn(self.server.serve_forever, "metrics-http")
+                logger.info(f"✅ Prometheus 指标端点已启动: http://{self.config['host']}:{port}/metrics")
+        if self.config.get("file_path"):
+            self._spawn(self._write_loop, "metrics-file")
+            logger.info(f"✅ Prometheus 指标将每 {self.config['file_interval_seconds']} 秒写入 {self.config['file_path']}")
+
+    def _spawn(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, daemon=True, name=name)
+        thread.start()
+        self._threads.append(thread)
+
+    def write_file(self) -> None:
+        """立即将当前指标写入文件"""
+        path = self.config["file_path"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.registry.render())
+        os.replace(tmp_path, path)
+
+    def _write_loop(self) -> None:
+        interval = max(1.0, float(self.config["file_interval_seconds"]))
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.write_file()
+            except Exception as e:
+                logger.warning(f"写入指标文件失败: {e}")
+            self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def stop(self) -> None:
+        """停止 HTTP 端点和文件写入"""
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# 全局指标导出器实例
+_metrics_exporter = None
+_metrics_exporter_lock = threading.Lock()
+
+def start_metrics_exporter() -> Optional[MetricsExporter]:
+    """
+    按配置启动指标导出（每个进程只启动一次，重复调用返回已启动的实例）
+
+    Returns:
+        MetricsExporter: 导出器实例，未启用时返回None
+    """
+    global _metrics_exporter
+    if _metrics_exporter is None:
+        with _metrics_exporter_lock:
+            if _metrics_exporter is None:
+                metrics_config = get_metrics_config()
+                if not metrics_config.get("enabled"):
+                    return None
+                exporter = MetricsExporter(get_metrics_registry(), metrics_config)
+                exporter.start()
+                _metrics_exporter = exporter
+    return _metrics_exporter
@@ -0,0 +1,232 @@
+"""
+请求采样剖析模块
+按配置的采样率（或页面 URL 中的 ?profile=1）对单次问答请求做剖析，定位慢请求中 Python 时间的去向：
+- cprofile 模式：用 cProfile 包裹助手处理函数，结果保存为 pstats 文件（.prof，可用 snakeviz / pstats 查看）
+- sampling 模式：后台线程按固定间隔采集请求线程的调用栈，结果保存为折叠栈文件（.folded，可用 flamegraph.pl / speedscope 查看）
+文件按交互ID命名，超过数量或保留时间的旧文件自动删除。未启用或未被采样时返回空实现，请求路径上没有额外开销
+"""
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from config.load_key import get_config
+
+logger = logging.getLogger(__name__)
+
+# 剖析默认参数（可在 config.json 的 "monitoring.profiling" 中覆盖）
+DEFAULT_PROFILING_CONFIG = {
+    "enabled": False,  # 总开关，关闭时 ?profile=1 也不生效
+    "sample_rate": 0.0,  # 每个请求被剖析的概率（0 表示只剖析 ?profile=1 的请求）
+    "mode": "cprofile",  # cprofile（确定性剖析，pstats）或 sampling（调用栈采样，折叠栈）
+    "sampling_interval_ms": 5,  # sampling 模式的采样间隔
+    "output_dir": "./data/profiles",
+    "max_files": 200,  # 最多保留的剖析文件数
+    "max_age_hours": 72,  # 剖析文件的最长保留时间
+}
+
+PROFILE_FILE_PREFIX = "interaction_"
+PROFILE_SUFFIXES = (".prof", ".folded")
+
+
+def get_profiling_config() -> Dict[str, Any]:
+    """获取剖析配置（默认值与 config.json 合并）"""
+    profiling_config = dict(DEFAULT_PROFILING_CONFIG)
+    profiling_config.update((get_config().get("monitoring", {}) or {}).get("profiling", {}) or {})
+    return profiling_config
+
+
+class _NullProfile:
+    """未采样请求使用的空实现"""
+
+    active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def save(self, interaction_id: Optional[int]) -> None:
+        pass
+
+
+NULL_PROFILE = _NullProfile()
+
+
+class _StackSampler(threading.Thread):
+    """按固定间隔采集目标线程调用栈的后台线程"""
+
+    def __init__(self, target_thread_id: int, interval: float):
+        super().__init__(daemon=True, name="request-profiler")
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """
+    单次请求的剖析会话
+
+    用法：
+        request_profile = sample_request_profile(force=...)
+        with request_profile:
+            handle_industry_assistant(...)
+        request_profile.save(interaction_id)
+
+    同一会话可以多次进入（结果累加）；只剖析进入 with 块的线程，
+    路由器/对冲请求在其他线程中等待LLM返回的时间表现为本线程在队列上的等待
+    """
+
+    active = True
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.mode = config["mode"]
+        self.started = time.time()
+        self.elapsed = 0.0
+        self._entered_at = 0.0
+        self._profiler = None
+        self._sampler: Optional[_StackSampler] = None
+        self._stacks: Counter = Counter()
+        self._samples = 0
+
+    def __enter__(self):
+        self._entered_at = time.monotonic()
+        if self.mode == "sampling":
+            interval = max(0.001, self.config["sampling_interval_ms"] / 1000.0)
+            self._sampler = _StackSampler(threading.get_ident(), interval)
+            self._sampler.start()
+            return self
+        import cProfile
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+        try:
+            self._profiler.enable()
+        except ValueError as e:
+            # 当前线程已有其他剖析器（如调试器）时放弃本次剖析
+            logger.warning(f"无法启动请求剖析: {e}")
+            self._profiler = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._stacks.update(self._sampler.stacks)
+            self._samples += self._sampler.samples
+            self._sampler = None
+        elif self._profiler is not None:
+            self._profiler.disable()
+        self.elapsed += time.monotonic() - self._entered_at
+        return False
+
+    def save(self, interaction_id: Optional[int]) -> None:
+        """
+        在后台线程中写入剖析文件并清理过期文件（不阻塞页面）
+
+        Args:
+            interaction_id: 交互ID（写后队列的临时ID会先解析为实际ID）
+        """
+        if self._profiler is None and not self._stacks:
+            return
+        threading.Thread(
+            target=self._write, args=(interaction_id,), daemon=True, name="request-profile-writer"
+        ).start()
+
+    def _write(self, interaction_id: Optional[int]) -> None:
+        try:
+            if interaction_id is not None and interaction_id < 0:
+                from src.interaction_logger import resolve_interaction_id
+                interaction_id = resolve_interaction_id(interaction_id)
+            output_dir = self.config["output_dir"]
+            os.makedirs(output_dir, exist_ok=True)
+            name = (
+                f"{PROFILE_FILE_PREFIX}{interaction_id}" if interaction_id is not None
+                else f"request_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started))}"
+            )
+            if self._profiler is not None:
+                path = os.path.join(output_dir, name + ".prof")
+                self._profiler.dump_stats(path)
+            else:
+                path = os.path.join(output_dir, name + ".folded")
+                with open(path, "w", encoding="utf-8") as f:
+                    for stack, count in self._stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            logger.info(f"请求剖析已保存: {path}（耗时 {self.elapsed * 1000:.0f}ms）")
+            prune_profiles(output_dir, int(self.config["max_files"]), float(self.config["max_age_hours"]))
+        except Exception as e:
+            logger.warning(f"保存请求剖析失败: {e}")
+
+
+def sample_request_profile(force: bool = False) -> Any:
+    """
+    决定本次请求是否剖析
+
+    Args:
+        force: 是否强制剖析（页面 URL 带 ?profile=1 时），仍受总开关控制
+
+    Returns:
+        RequestProfile: 需要剖析时返回剖析会话，否则返回空实现 NULL_PROFILE
+    """
+    profiling_config = get_profiling_config()
+    if not profiling_config["enabled"]:
+        return NULL_PROFILE
+    if not force and random.random() >= float(profiling_config["sample_rate"]):
+        return NULL_PROFILE
+    return RequestProfile(profiling_config)
+
+
+def prune_profiles(output_dir: str, max_files: int, max_age_hours: float) -> int:
+    """
+    删除超过保留时间或超出数量上限的剖析文件（按修改时间从旧到新删除）
+
+    Args:
+        output_dir: 剖析文件目录
+        max_files: 最多保留的文件数
+        max_age_hours: 最长保留时间（小时）
+
+    Returns:
+        int: 删除的文件数
+    """
+    try:
+        entries = [
+            entry for entry in os.scandir(output_dir)
+            if entry.is_file() and entry.name.endswith(PROFILE_SUFFIXES)
+        ]
+    except FileNotFoundError:
+        return 0
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    cutoff = time.time() - max_age_hours * 3600
+    excess = len(entries) - max_files
+    removed = 0
+    for index, entry in enumerate(entries):
+        if index < excess or entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,243 @@
+"""
+LLM提供商注册模块
+统一解析各提供商（deepseek、openai、qwen）的配置，并按 base_url 维护进程级共享的 HTTP 连接池，
+通用助手（openai.OpenAI）与行业助手（LlamaIndex OpenAI/OpenAILike）都从这里获取客户端
+"""
+import sys
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+import httpx
+from openai import OpenAI
+
+# 添加项目根目录到路径
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from config.load_key import get_config, get_api_key, get_model_config, get_available_llm, subscribe_config
+
+logger = logging.getLogger(__name__)
+
+# HTTP连接池默认参数（可在 config.json 的 "http" 或 models.<provider>.http 中覆盖）
+DEFAULT_HTTP_CONFIG = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 30.0,
+    "connect_timeout": 10.0,
+    "read_timeout": 120.0,
+    "max_retries": 2,
+}
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """解析后的提供商配置"""
+    name: str  # 提供商名称，如 deepseek
+    model_name: str  # 模型名称，如 deepseek-chat
+    base_url: str  # API地址
+    api_key: str  # API密钥
+    temperature: float = 0.1
+    max_tokens: Optional[int] = None
+    http: Optional[Dict[str, Any]] = None  # 该提供商的连接池参数
+
+    @property
+    def is_openai_official(self) -> bool:
+        """是否为 OpenAI 官方 API（LlamaIndex 中可直接使用 OpenAI 类）"""
+        return "api.openai.com" in self.base_url.lower()
+
+
+class ProviderRegistry:
+    """
+    提供商注册表
+
+    - 每个 base_url 只创建一个 httpx.Client，连接在整个进程内复用
+    - 每个提供商只创建一个 openai.OpenAI 客户端
+    - 连接数上限、超时和重试策略对两套调用栈一致生效
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_clients: Dict[str, httpx.Client] = {}
+        self._openai_clients: Dict[str, OpenAI] = {}
+        subscribe_config(self._on_config_change)
+
+    def _on_config_change(self, config, changed_sections) -> None:
+        """
+        提供商地址、密钥或连接池参数变化时换用新客户端，下次获取时按新配置创建
+
+        旧客户端不主动关闭：已缓存的 LlamaIndex LLM、查询引擎和进行中的流式响应仍持有它们，
+        关闭会使这些请求失败；不再被引用后由垃圾回收释放连接
+        """
+        if changed_sections & {"models", "api_keys", "http"}:
+            logger.info("提供商配置已变化，后续请求使用新的HTTP连接池")
+            with self._lock:
+                self._http_clients = {}
+                self._openai_clients = {}
+
+    def _http_config(self, spec: Optional[ProviderSpec] = None) -> Dict[str, Any]:
+        """合并默认值、全局 http 配置与提供商级覆盖"""
+        http_config = dict(DEFAULT_HTTP_CONFIG)
+        http_config.update(get_config().get("http", {}) or {})
+        if spec is not None and spec.http:
+            http_config.update(spec.http)
+        return http_config
+
+    def get_provider(self, provider: str) -> Optional[ProviderSpec]:
+        """
+        获取提供商配置
+
+        Args:
+            provider: 提供商名称（如 deepseek, openai, qwen）
+
+        Returns:
+            ProviderSpec: 提供商配置，未配置或缺少API密钥时返回None
+        """
+        model_config = get_model_config(provider)
+        if not model_config:
+            return None
+        api_key = get_api_key(model_config.get("api_key_env", ""))
+        if not api_key:
+            return None
+        return ProviderSpec(
+            name=provider,
+            model_name=model_config["model_name"],
+            base_url=model_config["base_url"],
+            api_key=api_key,
+            temperature=model_config.get("temperature", 0.1),
+            max_tokens=model_config.get("max_tokens"),
+            http=model_config.get("http"),
+        )
+
+    def list_available(self) -> List[str]:
+        """
+        按优先级列出所有已配置API密钥的提供商
+        priority_order 中的提供商在前，其余已配置的提供商在后
+        """
+        config = get_config()
+        priority_order = config.get("priority_order", ["deepseek", "openai", "qwen"])
+        candidates = list(priority_order) + [
+            name for name in config.get("models", {}) if name not in priority_order
+        ]
+        return [name for name in candidates if self.get_provider(name) is not None]
+
+    def get_default_provider(self) -> Optional[ProviderSpec]:
+        """获取优先级最高的可用提供商"""
+        available = get_available_llm()
+        if available:
+            return self.get_provider(available)
+        providers = self.list_available()
+        return self.get_provider(providers[0]) if providers else None
+
+    def get_http_client(self, spec: ProviderSpec) -> httpx.Client:
+        """
+        获取提供商 base_url 对应的共享 HTTP 客户端
+
+        Args:
+            spec: 提供商配置
+
+        Returns:
+            httpx.Client: 进程内共享的连接池
+        """
+        key = spec.base_url.rstrip("/")
+        client = self._http_clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._http_clients.get(key)
+            if client is None:
+                http_config = self._http_config(spec)
+                client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=http_config["max_connections"],
+                        max_keepalive_connections=http_config["max_keepalive_connections"],
+                        keepalive_expiry=http_config["keepalive_expiry"],
+                    ),
+                    timeout=httpx.Timeout(
+                        http_config["read_timeout"],
+                        connect=http_config["connect_timeout"],
+                    ),
+                )
+                self._http_clients[key] = client
+                logger.info(f"为 {key} 创建共享HTTP连接池: max_connections={http_config['max_connections']}")
+        return client
+
+    def get_max_retries(self, spec: Optional[ProviderSpec] = None) -> int:
+        """获取重试次数（两套调用栈统一使用）"""
+        return int(self._http_config(spec)["max_retries"])
+
+    def get_timeout(self, spec: Optional[ProviderSpec] = None) -> float:
+        """获取读取超时（秒）"""
+        return float(self._http_config(spec)["read_timeout"])
+
+    def get_openai_client(self, provider: str) -> Optional[OpenAI]:
+        """
+        获取提供商的 openai.OpenAI 客户端（通用助手使用）
+
+        Args:
+            provider: 提供商名称
+
+        Returns:
+            OpenAI: 复用共享连接池的客户端，提供商不可用时返回None
+        """
+        client = self._openai_clients.get(provider)
+        if client is not None:
+            return client
+        spec = self.get_provider(provider)
+        if spec is None:
+            return None
+        http_client = self.get_http_client(spec)
+        with self._lock:
+            client = self._openai_clients.get(provider)
+            if client is None:
+                client = OpenAI(
+                    api_key=spec.api_key,
+                    base_url=spec.base_url,
+                    max_retries=self.get_max_retries(spec),
+                    http_client=http_client,
+                )
+                self._openai_clients[provider] = client
+        return client
+
+    def get_llama_llm_kwargs(self, spec: ProviderSpec) -> Dict[str, Any]:
+        """
+        获取构建 LlamaIndex OpenAI/OpenAILike 所需的公共参数（行业助手使用）
+
+        Args:
+            spec: 提供商配置
+
+        Returns:
+            Dict: 包含共享 http_client、重试与超时设置的参数字典
+        """
+        return {
+            "api_key": spec.api_key,
+            "temperature": spec.temperature,
+            "max_retries": self.get_max_retries(spec),
+            "timeout": self.get_timeout(spec),
+            "http_client": self.get_http_client(spec),
+        }
+
+    def close(self) -> None:
+        """关闭所有共享连接池（仅在进程退出等确定不再使用时调用）"""
+        with self._lock:
+            for client in self._http_clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"关闭HTTP连接池失败: {e}")
+            self._http_clients.clear()
+            self._openai_clients.clear()
+
+
+# 全局提供商注册表实例
+_provider_registry = None
+
+def get_provider_registry() -> ProviderRegistry:
+    """获取提供商注册表实例（单例模式）"""
+    global _provider_registry
+    if _provider_registry is None:
+        _provider_registry = ProviderRegistry()
+    return _provider_registry
@@ -0,0 +1,147 @@
+"""
+问题在线聚类模块
+每条交互记录写入后，用其问题向量与已有簇质心比较：余弦相似度达到阈值时并入最相近的簇并更新质心，
+否则新建一个簇。质心和计数保存在 SQLite 中，读取高频意图时只需遍历簇表，无需重新嵌入或重新聚类历史问题
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.feedback import FeedbackStore
+
+logger = logging.getLogger(__name__)
+
+# 默认相似度阈值（可在 config.json 的 "feedback.cluster_similarity_threshold" 中覆盖）
+DEFAULT_CLUSTER_SIMILARITY_THRESHOLD = 0.85
+
+
+class _ClusterSet:
+    """同一向量维度的簇质心矩阵（每行已归一化）"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[int] = []
+        self.weights: List[int] = []
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+
+    def add(self, cluster_id: int, centroid: np.ndarray, weight: int) -> int:
+        self.ids.append(cluster_id)
+        self.weights.append(weight)
+        self.centroids = np.vstack([self.centroids, centroid[None, :]])
+        return len(self.ids) - 1
+
+
+def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0 or not np.isfinite(norm):
+        return None
+    return (vector / norm).astype(np.float32)
+
+
+class QuestionClusterer:
+    """
+    问题向量的在线 leader 聚类
+
+    - 质心为簇内问题向量均值的归一化结果，按合并次数增量更新
+    - 不同维度的向量（更换嵌入模型后）分别聚类，互不比较
+    - 首次使用时从数据库加载质心，之后只在内存中比较，每批结果在一个事务中写回
+    """
+
+    def __init__(self, store: FeedbackStore, similarity_threshold: float = DEFAULT_CLUSTER_SIMILARITY_THRESHOLD):
+        self.store = store
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._sets: Optional[Dict[int, _ClusterSet]] = None
+        self._next_provisional_id = -1
+
+    def _load(self) -> Dict[int, _ClusterSet]:
+        if self._sets is None:
+            sets: Dict[int, _ClusterSet] = {}
+            for cluster_id, dim, centroid, weight in self.store.load_question_clusters():
+                vector = np.frombuffer(centroid, dtype=np.float32)
+                if vector.shape[0] != dim:
+                    logger.warning(f"问题簇 {cluster_id} 的质心维度与记录不符，已跳过")
+                    continue
+                sets.setdefault(dim, _ClusterSet(dim)).add(cluster_id, vector, weight)
+            self._sets = sets
+            logger.info(f"已加载 {sum(len(s.ids) for s in sets.values())} 个问题簇")
+        return self._sets
+
+    def assign(self, items: Sequence[Tuple[int, str, Sequence[float]]]) -> Dict[int, int]:
+        """
+        将一批交互记录分配到问题簇
+
+        Args:
+            items: (交互ID, 问题, 问题向量) 列表
+
+        Returns:
+            Dict[int, int]: 交互ID -> 簇ID
+        """
+        if not items:
+            return {}
+        with self._lock:
+            sets = self._load()
+            new_clusters: Dict[int, Tuple[int, str]] = {}  # 临时簇ID -> (维度, 代表问题)
+            touched: Dict[int, Tuple[_ClusterSet, int]] = {}  # 簇ID -> (簇集合, 行号)
+            assignments: List[Tuple[int, int]] = []
+
+            for interaction_id, question, embedding in items:
+                vector = _normalize(np.asarray(embedding, dtype=np.float32))
+                if vector is None:
+                    continue
+                cluster_set = sets.setdefault(vector.shape[0], _ClusterSet(vector.shape[0]))
+                row = -1
+                if cluster_set.ids:
+                    similarities = cluster_set.centroids @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        row = best
+                if row >= 0:
+                    # 质心按合并次数做增量平均，再归一化
+                    weight = cluster_set.weights[row]
+                    merged = _normalize(cluster_set.centroids[row] * weight + vector)
+                    if merged is not None:
+                        cluster_set.centroids[row] = merged
+                    cluster_set.weights[row] = weight + 1
+                else:
+                    cluster_id = self._next_provisional_id
+                    self._next_provisional_id -= 1
+                    row = cluster_set.add(cluster_id, vector, 1)
+                    new_clusters[cluster_id] = (cluster_set.dim, question)
+                cluster_id = cluster_set.ids[row]
+                touched[cluster_id] = (cluster_set, row)
+                assignments.append((interaction_id, cluster_id))
+
+            try:
+                cluster_ids = self.store.save_cluster_assignments(
+                    new_clusters=[
+                        (cluster_id, dim, touched[cluster_id][0].centroids[touched[cluster_id][1]].tobytes(),
+                         touched[cluster_id][0].weights[touched[cluster_id][1]], question)
+                        for cluster_id, (dim, question) in new_clusters.items()
+                    ],
+                    updated_clusters=[
+                        (cluster_id, cluster_set.centroids[row].tobytes(), cluster_set.weights[row])
+                        for cluster_id, (cluster_set, row) in touched.items()
+                        if cluster_id not in new_clusters
+                    ],
+                    assignments=assignments,
+                )
+            except Exception:
+                # 内存状态已与数据库不一致，下次使用时重新加载
+                self._sets = None
+                raise
+
+            for provisional_id, cluster_id in cluster_ids.items():
+                cluster_set, row = touched[provisional_id]
+                cluster_set.ids[row] = cluster_id
+            return {
+                interaction_id: cluster_ids.get(cluster_id, cluster_id)
+                for interaction_id, cluster_id in assignments
+            }
+
+    def reload(self) -> None:
+        """丢弃内存中的质心，下次分配时从数据库重新加载"""
+        with self._lock:
+            self._sets = None
@@ -0,0 +1,113 @@
+"""
+请求分阶段计时模块
+记录一次问答请求在各阶段（查询向量、意图检索、知识检索、提示词组装、首字延迟、流式生成、页面渲染）的耗时，
+随交互记录一起写入数据库，用于按阶段和路径统计延迟分位数
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from src.metrics import get_metrics_registry, LLM_LATENCY_BUCKETS
+
+# 请求路径
+PATH_INTENT = "intent"  # 意图空间命中，直接返回答案
+PATH_KNOWLEDGE = "knowledge"  # 知识空间检索 + LLM 生成
+PATH_GENERAL = "general"  # 通用助手，直接调用 LLM
+
+# 阶段名称（按流水线顺序，用于展示排序）
+STAGE_EMBEDDING = "embedding"
+STAGE_INTENT_RETRIEVAL = "intent_retrieval"
+STAGE_KNOWLEDGE_RETRIEVAL = "knowledge_retrieval"
+STAGE_PROMPT = "prompt"
+STAGE_LLM_FIRST_TOKEN = "llm_first_token"
+STAGE_LLM_STREAM = "llm_stream"
+STAGE_RENDER = "render"
+STAGE_TOTAL = "total"
+
+STAGE_ORDER = (
+    STAGE_EMBEDDING,
+    STAGE_INTENT_RETRIEVAL,
+    STAGE_KNOWLEDGE_RETRIEVAL,
+    STAGE_PROMPT,
+    STAGE_LLM_FIRST_TOKEN,
+    STAGE_LLM_STREAM,
+    STAGE_RENDER,
+    STAGE_TOTAL,
+)
+
+# 请求总耗时指标（Prometheus，按路径）
+REQUEST_SECONDS = get_metrics_registry().histogram(
+    "rag_request_seconds", "问答请求总耗时（秒）",
+    buckets=LLM_LATENCY_BUCKETS, labelnames=("path",))
+
+
+class RequestTimer:
+    """
+    单次请求的分阶段计时器（基于 time.monotonic，只在内存中累加，开销可忽略）
+
+    用法：
+        timer = RequestTimer()
+        with timer.stage(STAGE_INTENT_RETRIEVAL):
+            ...
+        timer.add(STAGE_RENDER, renderer.render_seconds)
+        timer.set_path(PATH_KNOWLEDGE)
+        timer.finish()
+        timings = timer.as_dict()
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """统计代码块耗时（同一阶段多次进入时累加）"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        """累加某阶段的耗时（秒）"""
+        if seconds is None or seconds < 0:
+            return
+        self._stages[name] = self._stages.get(name, 0.0) + seconds
+
+    def set_path(self, path: str) -> None:
+        """设置请求路径（intent / knowledge / general）"""
+        self.path = path
+
+    def finish(self) -> float:
+        """结束计时，返回总耗时（秒），重复调用返回首次结束时的值"""
+        if self.finished is None:
+            self.finished = time.monotonic()
+            REQUEST_SECONDS.labels(self.path or "unknown").observe(self.finished - self.started)
+        return self.finished - self.started
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        """各阶段耗时（秒）"""
+        return dict(self._stages)
+
+    def as_dict(self) -> Dict[str, object]:
+        """
+        导出计时结果
+
+        Returns:
+            dict: {"path": 路径, "stages": {阶段: 毫秒}}，stages 中包含 total
+        """
+        stages = {name: round(seconds * 1000, 2) for name, seconds in self._stages.items()}
+        stages[STAGE_TOTAL] = round(self.finish() * 1000, 2)
+        return {"path": self.path, "stages": stages}
+
+    def summary(self) -> str:
+        """单行文本摘要（用于日志）"""
+        timings = self.as_dict()
+        parts = [f"{name}={ms:.0f}ms" for name, ms in sorted(
+            timings["stages"].items(),
+            key=lambda item: STAGE_ORDER.index(item[0]) if item[0] in STAGE_ORDER else len(STAGE_ORDER),
+        )]
+        return f"path={timings['path']} " + " ".join(parts)
@@ -1,7 +1,12 @@
 import os
 import sys
 import logging
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import replace
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 # 添加项目根目录到路径
 project_root = Path(__file__).resolve().parent.parent
@@ -99,6 +104,8 @@ from llama_index.core import (
     Settings,
     PromptTemplate,
 )
+from llama_index.core.schema import QueryBundle
+from llama_index.core.callbacks import CallbackManager
 try:
     from llama_index.embeddings.dashscope import (
         DashScopeEmbedding,
@@ -162,15 +169,40 @@ def _get_openai_like():
             logging.warning(f"无法导入 OpenAILike（未知错误）: {e}")
         return None
 from src.feedback import FeedbackStore
-from config.load_key import load_config, get_api_key, get_model_config, get_available_llm, load_key
+from src.context_packer import ContextPacker
+from config.load_key import get_config, get_api_key, load_key
+from src.providers import get_provider_registry
+from src.llm_router import get_llm_router
+from src.metrics import get_metrics_registry
+from src.tracing import get_trace_handler
 try:
-    from prompt import get_industry_assistant_prompt
+    from prompt import get_prompt_registry
 except ImportError:
-    get_industry_assistant_prompt = None
+    get_prompt_registry = None
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 检索相关指标（Prometheus）
+_metrics = get_metrics_registry()
+QUERY_EMBEDDING_CACHE = _metrics.counter(
+    "rag_query_embedding_cache_total", "查询向量缓存查找次数", ("result",))
+EMBEDDING_CALLS = _metrics.counter(
+    "rag_embedding_calls_total", "查询向量嵌入接口调用次数", ("status",))
+EMBEDDING_SECONDS = _metrics.histogram(
+    "rag_embedding_seconds", "查询向量嵌入接口耗时（秒）")
+QUERY_ENGINE_CACHE = _metrics.counter(
+    "rag_query_engine_cache_total", "查询引擎缓存查找次数", ("index", "result"))
+INDEX_SIZE = _metrics.gauge(
+    "rag_index_nodes", "向量索引中的节点数（索引加载或刷新时更新）", ("index",))
+
+# 指标中的索引标签（Chroma collection 名称 / 查询引擎的索引名称 -> 标签值）
+INDEX_METRIC_LABELS = {"knowledge_space": "knowledge", "intent_space": "intent"}
+INDEX_NAME_METRIC_LABELS = {"知识空间": "knowledge", "意图空间": "intent"}
+
+# 外部传入的LLM（RAGManager(llm=...)）使用的提供商名称
+CUSTOM_LLM_PROVIDER = "custom"
+
 # LangSmith callback支持
 def _setup_langsmith_callback():
     """
@@ -180,7 +212,7 @@ def _setup_langsmith_callback():
         callback_handler: 配置好的callback handler，如果LangSmith未启用则返回None
     """
     try:
-        config = load_config()
+        config = get_config()
         monitoring_config = config.get("monitoring", {})
         langsmith_config = monitoring_config.get("langsmith", {})
         
@@ -228,35 +260,90 @@ def _setup_langsmith_callback():
         logging.warning(f"⚠️ LangSmith callback设置异常: {e}")
         return None
 
-def _apply_langsmith_settings():
+def _apply_callback_settings():
     """
-    应用LangSmith设置到LlamaIndex全局Settings
+    将LangSmith回调和本地链路追踪回调应用到LlamaIndex全局Settings
     应该在RAGManager初始化之前调用
     """
+    handlers = []
     callback_handler = _setup_langsmith_callback()
     if callback_handler:
-        # 尝试使用新的方式设置callback_manager
-        # 在新版本的LlamaIndex中，可以直接设置handler列表
-        try:
-            # 方法1: 尝试直接设置callback_manager为handler列表
-            Settings.callback_manager = [callback_handler]
-        except (TypeError, AttributeError):
-            try:
-                # 方法2: 尝试从callbacks模块导入CallbackManager
-                from llama_index.core.callbacks import CallbackManager
-                callback_manager = CallbackManager([callback_handler])
-                Settings.callback_manager = callback_manager
-            except ImportError:
-                # 方法3: 如果CallbackManager不存在，尝试直接设置handler
-                # 某些版本可能支持直接设置handler
-                try:
-                    Settings.callback_manager = callback_handler
-                except Exception as e:
-                    logging.warning(f"⚠️ 无法设置LangSmith callback_manager: {e}")
-                    logging.info("💡 LangSmith环境变量已设置，LlamaDebugHandler将自动工作")
-                    return
-        
+        handlers.append(callback_handler)
+    trace_handler = get_trace_handler()
+    if trace_handler:
+        handlers.append(trace_handler)
+    if not handlers:
+        return
+    # Settings.callback_manager 需要 CallbackManager 实例（直接赋值handler列表不会报错，但事件不会分发给handler）
+    Settings.callback_manager = CallbackManager(handlers)
+    if callback_handler:
         logging.info("✅ LangSmith callback已应用到LlamaIndex Settings")
+    if trace_handler:
+        logging.info("✅ 本地链路追踪callback已应用到LlamaIndex Settings")
+
+def _build_industry_prompt_template(industry_prompt: str, show_thinking: bool) -> PromptTemplate:
+    """
+    编译行业助手的提示词模板
+    
+    Args:
+        industry_prompt: 行业助手提示词内容，None 表示提示词文件不存在（使用默认模板）
+        show_thinking: 是否要求模型输出思考过程
+    
+    Returns:
+        PromptTemplate: 编译后的提示词模板
+    """
+    if industry_prompt is not None:
+        # 将行业助手提示词与LlamaIndex的默认模板格式结合
+        thinking_instruction = ""
+        if show_thinking:
+            thinking_instruction = """
+
+## 思考过程要求
+在回答之前，请先展示你的思考过程，包括：
+1. 如何理解用户的问题
+2. 如何从参考信息中提取关键信息
+3. 如何组织答案的逻辑结构
+
+请按以下格式输出：
+
+**思考过程：**
+[你的思考过程]
+
+**回答：**
+[你的最终回答]"""
+        
+        prompt_template_str = f"""{industry_prompt}
+
+## 参考信息
+以下是检索到的相关信息：
+---------------------
+{{context_str}}
+---------------------
+
+## 用户问题
+{{query_str}}
+{thinking_instruction}
+
+## 回答要求
+请基于以上参考信息和行业助手的原则，为用户提供专业、准确、有价值的回答。
+回答："""
+        return PromptTemplate(prompt_template_str)
+    
+    # 如果提示词文件不存在，使用默认模板
+    thinking_instruction = ""
+    if show_thinking:
+        thinking_instruction = "\n\n在回答前，请先展示思考过程，格式：\n**思考过程：**\n[思考内容]\n\n**回答：**\n[回答内容]"
+    
+    default_template = f"""你是行业助手，由凡梦文化创建的智能问答系统。
+
+请基于以下参考信息回答问题：
+---------------------
+{{context_str}}
+---------------------
+
+问题：{{query_str}}{thinking_instruction}
+回答："""
+    return PromptTemplate(default_template)
 
 class RAGManager:
     def __init__(self, 
@@ -265,16 +352,22 @@ class RAGManager:
                  persist_dir_knowledge: str = None,
                  persist_dir_intent: str = None,
                  embed_model_name: str = None,
-                 llm_model_name: str = None):
+                 llm_model_name: str = None,
+                 chroma_db_path: str = None,
+                 embed_model=None,
+                 llm=None):
         """
         初始化RAG管理器，配置模型和路径。
         如果参数为None，则从配置文件读取。
+        
+        embed_model / llm 为预先构造的模型对象（如基准测试中的本地替身），传入时不再按配置创建；
+        传入的 llm 固定使用，不经路由器切换提供商
         """
-        # 首先应用LangSmith设置（如果启用）
-        _apply_langsmith_settings()
+        # 首先应用LangSmith和本地链路追踪设置（如果启用）
+        _apply_callback_settings()
         
         # 加载配置
-        config = load_config()
+        config = get_config()
         rag_config = config.get("rag", {})
         
         # 使用配置文件的默认值或传入的参数
@@ -284,9 +377,16 @@ class RAGManager:
         self.persist_dir_intent = persist_dir_intent or rag_config.get("persist_dir_intent", "./data/storage/intent_space")
         
         # Chroma 数据库路径（如果使用 Chroma）
-        self.chroma_db_path = rag_config.get("chroma_db_path", "./data/chroma_db")
+        self.chroma_db_path = chroma_db_path or rag_config.get("chroma_db_path", "./data/chroma_db")
         self.use_chroma = CHROMA_AVAILABLE and rag_config.get("use_chroma", True)  # 默认使用 Chroma
         
+        # 上下文打包器：按token预算排序、去重和截断检索到的分块
+        self.context_packer = ContextPacker(
+            token_budget=rag_config.get("context_token_budget", 1500),
+            dedupe=rag_config.get("context_dedupe", True),
+            min_chunk_tokens=rag_config.get("context_min_chunk_tokens", 32),
+        )
+        
         # 确保必要的目录存在
         os.makedirs(self.knowledge_space_dir, exist_ok=True)
         os.makedirs(self.intent_space_dir, exist_ok=True)
@@ -321,110 +421,43 @@ class RAGManager:
         self.llm_provider = None  # 用于存储 'deepseek', 'qwen' 等
 
         # 配置全局的LLM和Embedding模型
-        # 从配置文件获取可用的LLM
-        available_llm = get_available_llm()
-        if available_llm:
-            self.llm_provider = available_llm  # 存储提供商名称
-            model_config = get_model_config(available_llm)
-            if model_config:
-                api_key = get_api_key(model_config["api_key_env"])
-                if api_key:
-                    base_url = model_config["base_url"]
-                    model_name = model_config["model_name"]
-                    # 检查是否是 OpenAI 官方 API
-                    is_openai_official = "api.openai.com" in base_url.lower()
-                    
-                    # 如果不是 OpenAI 官方 API，必须使用 OpenAILike
-                    if not is_openai_official:
-                        OpenAILike = _get_openai_like()
-                        if OpenAILike is None:
-                            error_msg = f"无法使用 {available_llm} API：需要 OpenAILike 支持自定义 base_url，但导入失败（可能是 NumPy 版本冲突）。请降级 NumPy: pip install 'numpy<2'"
-                            logging.error(error_msg)
-                            self.llm_error_msg = error_msg
-                            self.llm = None
-                        else:
-                            try:
-                                self.llm = OpenAILike(
-                                    model=model_name,
-                                    api_base=base_url,
-                                    api_key=api_key,
-                                    is_chat_model=True,
-                                    temperature=model_config.get("temperature", 0.1),
-                                )
-                                logging.info(f"使用 {available_llm} API 作为 LLM (OpenAILike)")
-                            except Exception as e:
-                                error_msg = f"OpenAILike 初始化失败: {e}"
-                                logging.error(error_msg)
-                                self.llm_error_msg = error_msg
-                                self.llm = None
-                    else:
-                        # OpenAI 官方 API，可以使用 OpenAI 类
-                        try:
-                            self.llm = OpenAI(
-                                model=model_name,
-                                api_key=api_key,
-                                base_url=base_url,
-                                temperature=model_config.get("temperature", 0.1),
-                            )
-                            logging.info(f"使用 {available_llm} API 作为 LLM (OpenAI)")
-                        except Exception as e:
-                            error_msg = f"OpenAI 初始化失败: {e}"
-                            logging.error(error_msg)
-                            self.llm_error_msg = error_msg
-                            self.llm = None
-                else:
-                    error_msg = f"未找到 {available_llm} 的API密钥"
-                    logging.warning(error_msg)
-                    self.llm_error_msg = error_msg
-                    self.llm = None
-            else:
-                error_msg = f"未找到 {available_llm} 的配置"
-                logging.warning(error_msg)
-                self.llm_error_msg = error_msg
-                self.llm = None
+        # 从提供商注册表获取可用的LLM（与通用助手共享HTTP连接池）
+        registry = get_provider_registry()
+        self.llm = llm
+        self._fixed_llm = llm is not None
+        spec = registry.get_default_provider() if llm is None else None
+        if self._fixed_llm:
+            self.llm_provider = CUSTOM_LLM_PROVIDER
+        elif spec is not None:
+            self.llm_provider = spec.name  # 存储提供商名称
+            self.llm = self._create_llm(spec)
         else:
             error_msg = "未找到可用的LLM配置，请检查配置文件"
             logging.warning(error_msg)
             self.llm_error_msg = error_msg
-            self.llm = None
         
-        # 如果仍然没有LLM，尝试使用默认配置（DashScope/Qwen）
+        # 如果仍然没有LLM，依次尝试其他已配置的提供商作为 fallback
         if self.llm is None:
-            OpenAILike = _get_openai_like()
-            if OpenAILike is not None:
-                dashscope_key = get_api_key("DASHSCOPE_API_KEY")
-                if dashscope_key:
-                    try:
-                        self.llm = OpenAILike(
-                            model=llm_model_name or "qwen-plus",
-                            api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
-                            api_key=dashscope_key,
-                            is_chat_model=True,
-                        )
-                        logging.info("使用 DashScope (Qwen) API 作为 LLM (fallback, OpenAILike)")
-                    except Exception as e:
-                        error_msg = f"OpenAILike 初始化失败: {e}"
-                        logging.warning(error_msg)
-                        self.llm_error_msg = error_msg
-                        self.llm = None
-                else:
-                    error_msg = "未找到 DashScope API Key，无法使用 fallback LLM"
-                    logging.warning(error_msg)
-                    self.llm_error_msg = error_msg
-                    self.llm = None
-            else:
-                # 如果 OpenAILike 不可用，无法使用非 OpenAI API
-                error_msg = "OpenAILike 不可用，无法使用 DeepSeek 或千问 API。请运行: pip install 'numpy<2'"
-                logging.warning(error_msg)
-                self.llm_error_msg = error_msg
-                self.llm = None
+            for provider in registry.list_available():
+                if spec is not None and provider == spec.name:
+                    continue
+                fallback_spec = registry.get_provider(provider)
+                if llm_model_name:
+                    fallback_spec = replace(fallback_spec, model_name=llm_model_name)
+                self.llm = self._create_llm(fallback_spec)
+                if self.llm is not None:
+                    self.llm_provider = provider
+                    logging.info(f"使用 {provider} API 作为 LLM (fallback)")
+                    break
         
         # 配置Embedding模型
-        self.embed_model = None
+        self.embed_model = embed_model
         embedding_config = config.get("embedding", {})
         embed_provider = embedding_config.get("provider", "dashscope")
         
-        if embed_provider == "dashscope":
+        if embed_model is not None:
+            logging.info(f"使用传入的嵌入模型: {type(embed_model).__name__}")
+        elif embed_provider == "dashscope":
             if DashScopeEmbedding is None or DashScopeTextEmbeddingModels is None:
                 error_msg = "未安装 llama-index-embeddings-dashscope 模块"
                 logging.error(error_msg)
@@ -437,6 +470,12 @@ class RAGManager:
                     if embed_api_key:
                         # 确保环境变量已设置
                         os.environ["DASHSCOPE_API_KEY"] = embed_api_key
+                        # 自定义接口地址（如本地替身服务器），为空时使用 DashScope SDK 的默认地址
+                        embed_base_url = embedding_config.get("base_url")
+                        if embed_base_url:
+                            import dashscope
+                            dashscope.base_http_api_url = embed_base_url.rstrip("/")
+                            logging.info(f"DashScope Embedding 接口地址: {embed_base_url}")
                         # 初始化DashScopeEmbedding，显式传递api_key参数
                         try:
                             self.embed_model = DashScopeEmbedding(
@@ -462,16 +501,39 @@ class RAGManager:
             logging.warning(error_msg)
             self.embed_error_msg = error_msg
         
-        # LangSmith callback已在_apply_langsmith_settings()中设置
-        # 这里只需要确保Settings正确配置
+        # 按提供商缓存的LLM，供路由器按请求选择
+        self._llms = {}
+        if self.llm is not None:
+            self._llms[self.llm_provider] = self.llm
+        
+        # LangSmith和本地链路追踪callback已在_apply_callback_settings()中设置
+        # 这里只需要确保Settings正确配置；模型创建时带的是空的callback_manager，需显式换成全局的
         
         Settings.llm = self.llm
+        if self.llm is not None:
+            self.llm.callback_manager = Settings.callback_manager
         if self.embed_model is not None:
             Settings.embed_model = self.embed_model
+            self.embed_model.callback_manager = Settings.callback_manager
         
         self.knowledge_index = None
         self.intent_index = None
+        # 查询引擎缓存：(索引名称, 索引代数, top_k, show_thinking, streaming, 提供商) -> (引擎, 提示词模板)
+        # 索引刷新时代数递增，旧引擎随之失效
+        self._index_generation = {"知识空间": 0, "意图空间": 0}
+        self._query_engines: Dict[Tuple, Tuple[Any, PromptTemplate]] = {}
+        self._query_engine_lock = threading.Lock()
+        # 查询向量缓存：同一问题在意图空间检索、知识空间检索和问题聚类中只调用一次嵌入接口
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_embedding_cache_size = rag_config.get("query_embedding_cache_size", 256)
+        self._query_embedding_lock = threading.Lock()
         self.feedback_store = FeedbackStore()
+        # 缓存大小在抓取时读取（新实例注册后替换旧实例的回调）
+        _metrics.register_callback(
+            "rag_cache_entries", "gauge", "检索缓存当前条目数",
+            lambda: {("query_embedding",): len(self._query_embeddings), ("query_engine",): len(self._query_engines)},
+            ("cache",),
+        )
         if self.embed_model is not None:
             try:
                 logging.info("开始加载或创建知识空间索引...")
@@ -488,6 +550,7 @@ class RAGManager:
                     collection_name="intent_space"
                 )
                 logging.info("✅ 意图空间索引加载完成")
+                self._update_index_metrics()
                 # [关键修复] 移除此处的刷新调用，避免在初始化时进行二次删除
                 # self.refresh_intent_index() 
             except Exception as e:
@@ -502,6 +565,154 @@ class RAGManager:
             else:
                 logging.warning("未检测到可用的嵌入模型，RAG索引已禁用。启用RAG需安装 dashscope 集成包。")
 
+    def _create_llm(self, spec):
+        """
+        根据提供商配置创建 LlamaIndex LLM，HTTP连接池由提供商注册表统一提供
+        
+        Args:
+            spec: 提供商配置（ProviderSpec）
+        
+        Returns:
+            LLM对象，创建失败时返回None（错误信息记录到 self.llm_error_msg）
+        """
+        llm_kwargs = get_provider_registry().get_llama_llm_kwargs(spec)
+        
+        # 如果不是 OpenAI 官方 API，必须使用 OpenAILike
+        if not spec.is_openai_official:
+            OpenAILike = _get_openai_like()
+            if OpenAILike is None:
+                error_msg = f"无法使用 {spec.name} API：需要 OpenAILike 支持自定义 base_url，但导入失败（可能是 NumPy 版本冲突）。请降级 NumPy: pip install 'numpy<2'"
+                logging.error(error_msg)
+                self.llm_error_msg = error_msg
+                return None
+            try:
+                llm = OpenAILike(
+                    model=spec.model_name,
+                    api_base=spec.base_url,
+                    is_chat_model=True,
+                    **llm_kwargs,
+                )
+                logging.info(f"使用 {spec.name} API 作为 LLM (OpenAILike)")
+                return llm
+            except Exception as e:
+                error_msg = f"OpenAILike 初始化失败: {e}"
+                logging.error(error_msg)
+                self.llm_error_msg = error_msg
+                return None
+        
+        # OpenAI 官方 API，可以使用 OpenAI 类
+        try:
+            llm = OpenAI(
+                model=spec.model_name,
+                base_url=spec.base_url,
+                **llm_kwargs,
+            )
+            logging.info(f"使用 {spec.name} API 作为 LLM (OpenAI)")
+            return llm
+        except Exception as e:
+            error_msg = f"OpenAI 初始化失败: {e}"
+            logging.error(error_msg)
+            self.llm_error_msg = error_msg
+            return None
+
+    def get_llm(self, provider: str = None):
+        """
+        获取指定提供商的LLM，按需创建并缓存
+        
+        Args:
+            provider: 提供商名称，None 表示默认LLM
+        
+        Returns:
+            LLM对象，提供商不可用或创建失败时返回None（不回退到默认LLM，避免把请求记到错误的提供商上）
+        """
+        if provider is None or provider == self.llm_provider:
+            return self.llm
+        llm = self._llms.get(provider)
+        if llm is None:
+            spec = get_provider_registry().get_provider(provider)
+            llm = self._create_llm(spec) if spec is not None else None
+            if llm is None:
+                return None
+            llm.callback_manager = Settings.callback_manager
+            self._llms[provider] = llm
+        return llm
+    
+    def rank_llm_providers(self) -> List[str]:
+        """
+        按路由器的滚动延迟/错误率统计对提供商排序（用于首字前失败时切换到下一个提供商）
+        
+        Returns:
+            List[str]: 可以创建LLM的提供商列表，第一个为本次请求的首选；至少包含默认提供商
+        """
+        if self.llm is None or self._fixed_llm:
+            return [self.llm_provider]
+        ranked = [provider for provider in get_llm_router().rank() if self.get_llm(provider) is not None]
+        return ranked or [self.llm_provider]
+    
+    def choose_llm_provider(self) -> str:
+        """按路由器的滚动延迟/错误率统计选择本次请求使用的提供商"""
+        return self.rank_llm_providers()[0]
+
+    def get_query_embedding(self, query: str) -> Optional[List[float]]:
+        """
+        获取问题的查询向量（LRU 缓存，相同问题不重复调用嵌入接口）
+        
+        Args:
+            query: 用户问题
+        
+        Returns:
+            List[float]: 查询向量，嵌入模型不可用或调用失败时返回None
+        """
+        if self.embed_model is None or not query:
+            return None
+        with self._query_embedding_lock:
+            embedding = self._query_embeddings.get(query)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(query)
+        if embedding is not None:
+            QUERY_EMBEDDING_CACHE.labels("hit").inc()
+            return embedding
+        QUERY_EMBEDDING_CACHE.labels("miss").inc()
+        start = time.monotonic()
+        try:
+            embedding = self.embed_model.get_query_embedding(query)
+        except Exception as e:
+            EMBEDDING_CALLS.labels("error").inc()
+            logging.warning(f"计算查询向量失败: {e}")
+            return None
+        EMBEDDING_SECONDS.observe(time.monotonic() - start)
+        EMBEDDING_CALLS.labels("ok").inc()
+        with self._query_embedding_lock:
+            self._query_embeddings[query] = embedding
+            while len(self._query_embeddings) > self._query_embedding_cache_size:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+    
+    def get_cached_query_embedding(self, query: str) -> Optional[List[float]]:
+        """
+        读取检索时已缓存的查询向量，未缓存时不调用嵌入接口（交互日志复用本次请求的向量）
+        
+        Args:
+            query: 用户问题
+        
+        Returns:
+            List[float]: 查询向量，未缓存时返回None
+        """
+        with self._query_embedding_lock:
+            return self._query_embeddings.get(query)
+    
+    def get_query_bundle(self, query: str) -> QueryBundle:
+        """
+        构造带查询向量的 QueryBundle，传给检索器/查询引擎后不再重复计算向量
+        
+        Args:
+            query: 用户问题
+        
+        Returns:
+            QueryBundle: 查询向量不可用时 embedding 为None，由检索器自行计算
+        """
+        return QueryBundle(query_str=query, embedding=self.get_query_embedding(query))
+    
     def _load_or_create_index(self, documents_dir: str, persist_dir: str = None, collection_name: str = None) -> VectorStoreIndex:
         """
         加载或创建向量索引。
@@ -720,66 +931,19 @@ class RAGManager:
         return index
 
     def _get_industry_prompt_template(self, show_thinking: bool = False) -> PromptTemplate:
-        """获取行业助手的提示词模板"""
-        if get_industry_assistant_prompt is not None:
+        """获取行业助手的提示词模板（按 show_thinking 变体缓存，提示词文件修改后自动重新编译）"""
+        if get_prompt_registry is not None:
             try:
-                industry_prompt = get_industry_assistant_prompt()
-                # 将行业助手提示词与LlamaIndex的默认模板格式结合
-                thinking_instruction = ""
-                if show_thinking:
-                    thinking_instruction = """
-
-## 思考过程要求
-在回答之前，请先展示你的思考过程，包括：
-1. 如何理解用户的问题
-2. 如何从参考信息中提取关键信息
-3. 如何组织答案的逻辑结构
-
-请按以下格式输出：
-
-**思考过程：**
-[你的思考过程]
-
-**回答：**
-[你的最终回答]"""
-                
-                prompt_template_str = f"""{industry_prompt}
-
-## 参考信息
-以下是检索到的相关信息：
----------------------
-{{context_str}}
----------------------
-
-## 用户问题
-{{query_str}}
-{thinking_instruction}
-
-## 回答要求
-请基于以上参考信息和行业助手的原则，为用户提供专业、准确、有价值的回答。
-回答："""
-                return PromptTemplate(prompt_template_str)
+                return get_prompt_registry().get_compiled(
+                    "industry_assistant", show_thinking, _build_industry_prompt_template
+                )
             except Exception as e:
                 logging.warning(f"加载行业助手提示词失败，使用默认模板: {e}")
-        
-        # 如果加载失败，使用默认模板
-        thinking_instruction = ""
-        if show_thinking:
-            thinking_instruction = "\n\n在回答前，请先展示思考过程，格式：\n**思考过程：**\n[思考内容]\n\n**回答：**\n[回答内容]"
-        
-        default_template = f"""你是行业助手，由凡梦文化创建的智能问答系统。
-
-请基于以下参考信息回答问题：
----------------------
-{{context_str}}
----------------------
-
-问题：{{query_str}}{thinking_instruction}
-回答："""
-        return PromptTemplate(default_template)
+        return _build_industry_prompt_template(None, show_thinking)
     
     def _get_query_engine(self, index, index_name: str, streaming=True, 
-                         similarity_top_k: int = 3, show_thinking: bool = False):
+                         similarity_top_k: int = 3, show_thinking: bool = False,
+                         llm_provider: str = None):
         """
         获取查询引擎的公共方法
         
@@ -789,6 +953,7 @@ class RAGManager:
             streaming: 是否使用流式输出
             similarity_top_k: 检索的文档数量
             show_thinking: 是否显示思考过程
+            llm_provider: 使用的LLM提供商（None 表示默认LLM）
         
         Returns:
             配置好的查询引擎
@@ -810,38 +975,95 @@ class RAGManager:
                 error_msg += " 请检查配置文件中的 LLM 配置和 API Key。"
             raise RuntimeError(error_msg)
         
-        query_engine = index.as_query_engine(
-            streaming=streaming, similarity_top_k=similarity_top_k
-        )
-        
-        # 应用行业助手提示词模板
+        llm = self.get_llm(llm_provider)
+        if llm is None:
+            raise RuntimeError(f"LLM提供商 {llm_provider} 不可用。{self.llm_error_msg or ''}".strip())
         prompt_template = self._get_industry_prompt_template(show_thinking=show_thinking)
-        query_engine.update_prompts(
-            {"response_synthesizer:text_qa_template": prompt_template}
+        key = (
+            index_name, self._index_generation.get(index_name, 0),
+            similarity_top_k, show_thinking, streaming,
+            llm_provider if llm is not self.llm else None,
         )
         
+        with self._query_engine_lock:
+            cached = self._query_engines.get(key)
+            if cached is not None:
+                query_engine, cached_template = cached
+                if cached_template is not prompt_template:
+                    # 提示词文件已修改，只需替换模板
+                    query_engine.update_prompts(
+                        {"response_synthesizer:text_qa_template": prompt_template}
+                    )
+                    self._query_engines[key] = (query_engine, prompt_template)
+                QUERY_ENGINE_CACHE.labels(INDEX_NAME_METRIC_LABELS.get(index_name, index_name), "hit").inc()
+                return query_engine
+            
+            QUERY_ENGINE_CACHE.labels(INDEX_NAME_METRIC_LABELS.get(index_name, index_name), "miss").inc()
+            query_engine = index.as_query_engine(
+                streaming=streaming, similarity_top_k=similarity_top_k,
+                llm=llm,
+                node_postprocessors=[self.context_packer]
+            )
+            
+            # 应用行业助手提示词模板
+            query_engine.update_prompts(
+                {"response_synthesizer:text_qa_template": prompt_template}
+            )
+            self._query_engines[key] = (query_engine, prompt_template)
+            logging.info(f"创建{index_name}查询引擎: top_k={similarity_top_k}, show_thinking={show_thinking}, streaming={streaming}")
+        
         return query_engine
     
-    def get_knowledge_query_engine(self, streaming=True, similarity_top_k: int = 3, show_thinking: bool = False):
+    def _update_index_metrics(self) -> None:
+        """读取各 Chroma collection 的节点数并更新索引大小指标（只在索引加载、刷新和重置后调用）"""
+        if self.chroma_client is None:
+            return
+        for collection_name, label in INDEX_METRIC_LABELS.items():
+            try:
+                count = self.chroma_client.get_collection(name=collection_name).count()
+            except Exception:
+                count = 0
+            INDEX_SIZE.labels(label).set(count)
+    
+    def _invalidate_query_engines(self, index_name: str = None) -> None:
+        """
+        索引刷新后使对应的查询引擎缓存失效
+        
+        Args:
+            index_name: 索引名称（知识空间/意图空间），None 表示全部
+        """
+        with self._query_engine_lock:
+            names = [index_name] if index_name else list(self._index_generation)
+            for name in names:
+                self._index_generation[name] = self._index_generation.get(name, 0) + 1
+            self._query_engines = {
+                key: value for key, value in self._query_engines.items() if key[0] not in names
+            }
+    
+    def get_knowledge_query_engine(self, streaming=True, similarity_top_k: int = 3, show_thinking: bool = False,
+                                   llm_provider: str = None):
         """获取知识空间的查询引擎"""
-        logging.info("获取知识空间查询引擎。")
+        logging.debug("获取知识空间查询引擎。")
         return self._get_query_engine(
             self.knowledge_index, 
             "知识空间", 
             streaming, 
             similarity_top_k, 
-            show_thinking
+            show_thinking,
+            llm_provider
         )
         
-    def get_intent_query_engine(self, streaming=True, similarity_top_k: int = 1, show_thinking: bool = False):
+    def get_intent_query_engine(self, streaming=True, similarity_top_k: int = 1, show_thinking: bool = False,
+                                llm_provider: str = None):
         """获取意图空间的查询引擎"""
-        logging.info("获取意图空间查询引擎。")
+        logging.debug("获取意图空间查询引擎。")
         return self._get_query_engine(
             self.intent_index, 
             "意图空间", 
             streaming, 
             similarity_top_k, 
-            show_thinking
+            show_thinking,
+            llm_provider
         )
 
     def refresh_intent_index(self) -> None:
@@ -908,6 +1130,8 @@ class RAGManager:
                 storage_context=storage_context,
                 embed_model=self.embed_model
             )
+            self._invalidate_query_engines("意图空间")
+            self._update_index_metrics()
             logging.info("意图空间索引已刷新（Chroma）")
         except Exception as e:
             error_msg = f"Chroma 刷新失败: {e}。系统要求使用向量存储，请检查 Chroma 数据库状态。"
@@ -961,6 +1185,8 @@ class RAGManager:
                 storage_context=storage_context,
                 embed_model=self.embed_model
             )
+            self._invalidate_query_engines("知识空间")
+            self._update_index_metrics()
             logging.info("知识空间索引已刷新（Chroma）")
         except Exception as e:
             error_msg = f"Chroma 刷新失败: {e}。系统要求使用向量存储，请检查 Chroma 数据库状态。"
@@ -976,6 +1202,8 @@ class RAGManager:
             try:
                 logging.warning("正在重置 Chroma 向量数据库...")
                 self.chroma_client.reset()  # 删除所有集合
+                self._invalidate_query_engines()
+                self._update_index_metrics()
                 logging.info("✅ Chroma 向量数据库已成功重置。")
                 return "Chroma 向量数据库已成功重置。"
             except Exception as e:
@@ -0,0 +1,141 @@
+"""
+流式渲染模块
+将LLM逐token输出的内容按固定帧率刷新到 Streamlit 占位符，
+token 先收集到列表缓冲区中，每隔一段时间或累积一定字符数才调用一次 placeholder.markdown，
+避免每个token都做整段字符串拼接并向浏览器推送一次增量
+"""
+import time
+from typing import List, Optional
+
+from config.load_key import get_config
+
+# 流式渲染默认参数（可在 config.json 的 "ui" 中覆盖）
+DEFAULT_STREAM_FLUSH_INTERVAL_MS = 50  # 两次刷新之间的最小间隔（毫秒）
+DEFAULT_STREAM_FLUSH_CHARS = 200  # 缓冲的字符数达到该值时立即刷新
+
+# 流式输出时显示在末尾的光标
+STREAM_CURSOR = "▌"
+
+
+def get_stream_render_config() -> tuple:
+    """
+    获取流式渲染参数
+
+    Returns:
+        tuple: (刷新间隔（秒）, 刷新字符数阈值)
+    """
+    ui_config = get_config().get("ui", {}) or {}
+    interval_ms = ui_config.get("stream_flush_interval_ms", DEFAULT_STREAM_FLUSH_INTERVAL_MS)
+    flush_chars = ui_config.get("stream_flush_chars", DEFAULT_STREAM_FLUSH_CHARS)
+    return interval_ms / 1000.0, flush_chars
+
+
+class StreamRenderer:
+    """
+    限制刷新频率的增量渲染器
+
+    用法：
+        renderer = StreamRenderer(message_placeholder)
+        for token in response_gen:
+            renderer.append(token)
+        renderer.finish()
+    """
+
+    def __init__(
+        self,
+        placeholder,
+        prefix: str = "",
+        cursor: str = STREAM_CURSOR,
+        flush_interval: Optional[float] = None,
+        flush_chars: Optional[int] = None,
+    ):
+        """
+        Args:
+            placeholder: Streamlit占位符（st.empty()），为None时只缓冲不渲染
+            prefix: 渲染时添加在内容前的固定文本（如思考过程标题）
+            cursor: 流式输出时追加在末尾的光标
+            flush_interval: 两次刷新之间的最小间隔（秒），None 表示使用配置
+            flush_chars: 缓冲字符数达到该值时立即刷新，None 表示使用配置
+        """
+        default_interval, default_chars = get_stream_render_config()
+        self.placeholder = placeholder
+        self.prefix = prefix
+        self.cursor = cursor
+        self.flush_interval = default_interval if flush_interval is None else flush_interval
+        self.flush_chars = default_chars if flush_chars is None else flush_chars
+        self._parts: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = 0.0
+        self._dirty = False
+        self.flush_count = 0
+        self.render_seconds = 0.0  # 累计花在 placeholder.markdown 上的时间
+
+    @property
+    def text(self) -> str:
+        """当前已缓冲的完整内容"""
+        if len(self._parts) > 1:
+            # 合并后只保留一段，避免重复拼接
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, token: str) -> None:
+        """追加一个token，达到刷新条件时渲染"""
+        if not token:
+            return
+        self._parts.append(token)
+        self._pending_chars += len(token)
+        self._dirty = True
+        self.flush_if_due()
+
+    def set_text(self, text: str) -> None:
+        """用完整内容替换缓冲区（上游给出的是累计内容时使用），达到刷新条件时渲染"""
+        self._pending_chars += abs(len(text) - len(self.text))
+        self._parts = [text] if text else []
+        self._dirty = True
+        self.flush_if_due()
+
+    def should_flush(self) -> bool:
+        """是否达到刷新条件（有未渲染内容，且超过刷新间隔或缓冲字符数达到阈值）"""
+        if not self._dirty:
+            return False
+        return (
+            self._pending_chars >= self.flush_chars
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def flush_if_due(self) -> None:
+        """达到刷新条件时渲染"""
+        if self.should_flush():
+            self.flush()
+
+    def flush(self, cursor: bool = True) -> None:
+        """
+        立即将缓冲内容渲染到占位符
+
+        Args:
+            cursor: 是否在末尾显示光标
+        """
+        self._last_flush = time.monotonic()
+        self._pending_chars = 0
+        self._dirty = False
+        if self.placeholder is None:
+            return
+        start = time.monotonic()
+        self.placeholder.markdown(self.prefix + self.text + (self.cursor if cursor else ""))
+        self.render_seconds += time.monotonic() - start
+        self.flush_count += 1
+
+    def finish(self, text: Optional[str] = None) -> str:
+        """
+        流式输出结束，渲染最终内容（不带光标）
+
+        Args:
+            text: 最终内容，None 表示使用缓冲内容
+
+        Returns:
+            str: 最终内容
+        """
+        if text is not None:
+            self._parts = [text] if text else []
+        self.flush(cursor=False)
+        return self.text
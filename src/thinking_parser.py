@@ -0,0 +1,144 @@
+"""
+思考过程解析模块
+将模型按 "**思考过程：** ... **回答：** ..." 格式输出的内容拆分为思考过程和回答，
+流式输出时逐token增量解析，每个token只处理一次，标记被拆分到多个token中时也能正确识别
+"""
+from typing import List, Tuple
+
+THINKING_MARKER = "**思考过程：**"
+ANSWER_MARKER = "**回答：**"
+
+# 解析状态
+_STATE_START = 0  # 尚未出现任何标记
+_STATE_THINKING = 1  # 已出现思考过程标记，尚未出现回答标记
+_STATE_ANSWER = 2  # 已出现回答标记
+
+
+def _partial_marker_suffix(text: str, markers: Tuple[str, ...]) -> int:
+    """返回 text 末尾可能是某个标记前缀的最长长度（需要暂存到下一个token再判断）"""
+    longest = 0
+    for marker in markers:
+        for size in range(min(len(marker) - 1, len(text)), longest, -1):
+            if text.endswith(marker[:size]):
+                longest = size
+                break
+    return longest
+
+
+class ThinkingParser:
+    """
+    思考过程/回答的增量解析器（状态机）
+
+    - feed(token) 返回本次新增的 ("thinking" | "answer", 文本) 片段列表
+    - 出现思考过程标记之前的内容按回答输出；出现回答标记后，其前面的内容都视为思考过程
+    - finish() 返回最终的 (thinking, answer)：没有回答标记时整段内容都是回答，与一次性分离的结果一致
+    """
+
+    def __init__(self):
+        self._state = _STATE_START
+        self._pending = ""  # 可能是标记前缀、暂未输出的文本
+        self._raw: List[str] = []  # 原始内容（未出现回答标记时作为最终回答）
+        self._thinking: List[str] = []
+        self._answer: List[str] = []
+        self._preamble: List[str] = []  # 思考过程标记之前的内容
+        self._section_started = False  # 当前段落是否已输出非空白内容（用于去掉标记后的前导空白）
+
+    @property
+    def has_answer_marker(self) -> bool:
+        """是否已出现回答标记"""
+        return self._state == _STATE_ANSWER
+
+    def _markers(self) -> Tuple[str, ...]:
+        if self._state == _STATE_START:
+            return (THINKING_MARKER, ANSWER_MARKER)
+        if self._state == _STATE_THINKING:
+            return (ANSWER_MARKER,)
+        return ()
+
+    def _emit(self, text: str, out: List[Tuple[str, str]]) -> None:
+        if not text:
+            return
+        if not self._section_started and self._state != _STATE_START:
+            text = text.lstrip()
+            if not text:
+                return
+            self._section_started = True
+        if self._state == _STATE_THINKING:
+            self._thinking.append(text)
+            out.append(("thinking", text))
+        elif self._state == _STATE_ANSWER:
+            self._answer.append(text)
+            out.append(("answer", text))
+        else:
+            self._preamble.append(text)
+            out.append(("answer", text))
+
+    def feed(self, token: str) -> List[Tuple[str, str]]:
+        """
+        处理一个token
+
+        Args:
+            token: 模型输出的文本片段
+
+        Returns:
+            List[Tuple[str, str]]: 新增片段列表，每项为 (类型, 文本)，类型为 "thinking" 或 "answer"
+        """
+        out: List[Tuple[str, str]] = []
+        if not token:
+            return out
+        self._raw.append(token)
+        buffer = self._pending + token
+        self._pending = ""
+
+        while buffer:
+            markers = self._markers()
+            if not markers:
+                self._emit(buffer, out)
+                break
+            # 找到最早出现的标记
+            hit_pos, hit_marker = -1, None
+            for marker in markers:
+                pos = buffer.find(marker)
+                if pos != -1 and (hit_pos == -1 or pos < hit_pos):
+                    hit_pos, hit_marker = pos, marker
+            if hit_marker is None:
+                keep = _partial_marker_suffix(buffer, markers)
+                self._emit(buffer[:len(buffer) - keep], out)
+                self._pending = buffer[len(buffer) - keep:]
+                break
+            self._emit(buffer[:hit_pos], out)
+            buffer = buffer[hit_pos + len(hit_marker):]
+            self._state = _STATE_THINKING if hit_marker == THINKING_MARKER else _STATE_ANSWER
+            self._section_started = False
+        return out
+
+    def finish(self) -> Tuple[str, str]:
+        """
+        结束解析
+
+        Returns:
+            Tuple[str, str]: (thinking, answer)
+        """
+        if self._pending:
+            # 结尾残留的不完整标记按普通文本处理
+            pending, self._pending = self._pending, ""
+            self._emit(pending, [])
+        if self._state != _STATE_ANSWER:
+            return "", "".join(self._raw)
+        thinking = "".join(self._preamble + self._thinking).strip()
+        return thinking, "".join(self._answer).strip()
+
+
+def separate_thinking_and_answer(content: str) -> Tuple[str, str]:
+    """
+    一次性分离完整内容中的思考过程和回答（非流式场景使用）
+
+    Args:
+        content: 完整的模型输出
+
+    Returns:
+        Tuple[str, str]: (thinking, answer)，没有回答标记时 thinking 为空字符串
+    """
+    parser = ThinkingParser()
+    parser.feed(content)
+    return parser.finish()
@@ -0,0 +1,499 @@
+"""
+本地链路追踪模块
+LangSmith 回调之外的本地方案：在 LlamaIndex 的 callback_manager 上挂一个轻量回调，记录检索、嵌入、LLM、合成等事件的
+耗时和大小（只记录条数、字符数等，不保存文本内容）。按请求做头部采样，未采样的请求回调只做一次上下文变量读取；
+完成的链路先放入内存缓冲区，由后台线程批量追加到本地 JSONL 文件，请求路径上没有网络调用和文件I/O
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import random
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import BASE_TRACE_EVENT, CBEventType, EventPayload
+
+from config.load_key import get_config
+from src.feedback import local_now
+from src.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# 链路追踪默认参数（可在 config.json 的 "monitoring.tracing" 中覆盖）
+DEFAULT_TRACING_CONFIG = {
+    "enabled": False,
+    "sample_rate": 0.1,  # 每个请求被追踪的概率（头部采样，请求开始时决定）
+    "output_dir": "./data/traces",  # 链路文件目录，每天一个 traces-YYYYMMDD.jsonl
+    "batch_size": 50,  # 缓冲的链路数达到该值时立即写入
+    "flush_interval_seconds": 5,  # 后台线程写入的最长间隔
+    "max_buffer": 1000,  # 缓冲区上限，写入跟不上时丢弃最旧的链路
+    "retention_days": 7,  # 链路文件保留天数
+}
+
+TRACE_FILE_PREFIX = "traces-"
+TRACE_FILE_SUFFIX = ".jsonl"
+
+# 错误信息的最大保留长度
+MAX_ERROR_CHARS = 200
+
+_metrics = get_metrics_registry()
+TRACES_TOTAL = _metrics.counter("tracing_traces_total", "本地链路追踪处理的链路数", ("result",))
+
+# 当前请求的链路（未采样或不在请求中时为None）
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+def get_tracing_config() -> Dict[str, Any]:
+    """获取链路追踪配置（默认值与 config.json 合并）"""
+    tracing_config = dict(DEFAULT_TRACING_CONFIG)
+    tracing_config.update((get_config().get("monitoring", {}) or {}).get("tracing", {}) or {})
+    return tracing_config
+
+
+def _text_length(value: Any) -> Optional[int]:
+    """取回复/提示词的字符数（不触碰流式生成器）"""
+    if isinstance(value, str):
+        return len(value)
+    message = getattr(value, "message", None)  # ChatResponse
+    if message is not None:
+        return len(getattr(message, "content", None) or "")
+    text = getattr(value, "text", None)  # CompletionResponse
+    if isinstance(text, str):
+        return len(text)
+    response = getattr(value, "response", None)  # Response（StreamingResponse 的 response 为None）
+    if isinstance(response, str):
+        return len(response)
+    return None
+
+
+def _payload_attributes(payload: Optional[Dict[Any, Any]]) -> Dict[str, Any]:
+    """
+    从回调事件负载中提取大小信息
+
+    Returns:
+        dict: 如 query_chars, node_count, top_score, embedding_count, embedding_dim, message_count,
+              prompt_chars, response_chars, model, error
+    """
+    if not payload:
+        return {}
+    attributes: Dict[str, Any] = {}
+    for key, value in payload.items():
+        if key == EventPayload.QUERY_STR and isinstance(value, str):
+            attributes["query_chars"] = len(value)
+        elif key == EventPayload.NODES and value is not None:
+            attributes["node_count"] = len(value)
+            scores = [node.score for node in value if getattr(node, "score", None) is not None]
+            if scores:
+                attributes["top_score"] = round(max(scores), 4)
+        elif key == EventPayload.CHUNKS and value is not None:
+            attributes["chunk_count"] = len(value)
+            attributes["chunk_chars"] = sum(len(chunk) for chunk in value if isinstance(chunk, str))
+        elif key == EventPayload.EMBEDDINGS and value:
+            attributes["embedding_count"] = len(value)
+            attributes["embedding_dim"] = len(value[0])
+        elif key == EventPayload.MESSAGES and value is not None:
+            attributes["message_count"] = len(value)
+            attributes["prompt_chars"] = sum(len(getattr(message, "content", None) or "") for message in value)
+        elif key == EventPayload.PROMPT:
+            length = _text_length(value)
+            if length is not None:
+                attributes["prompt_chars"] = length
+        elif key in (EventPayload.RESPONSE, EventPayload.COMPLETION):
+            length = _text_length(value)
+            if length is not None:
+                attributes["response_chars"] = length
+        elif key == EventPayload.SERIALIZED and isinstance(value, dict):
+            model = value.get("model") or value.get("model_name")
+            if model:
+                attributes["model"] = str(model)
+        elif key == EventPayload.MODEL_NAME and value:
+            attributes["model"] = str(value)
+        elif key == EventPayload.TEMPLATE_VARS and isinstance(value, dict):
+            attributes["template_var_count"] = len(value)
+        elif key == EventPayload.EXCEPTION and value is not None:
+            attributes["error"] = f"{type(value).__name__}: {value}"[:MAX_ERROR_CHARS]
+    return attributes
+
+
+class _NullTrace:
+    """未采样请求使用的空实现"""
+
+    sampled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_span(self, *args, **kwargs) -> None:
+        pass
+
+    def finish(self, *args, **kwargs) -> None:
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class RequestTrace:
+    """
+    单次请求的链路
+
+    用法：
+        request_trace = start_request_trace("industry")
+        with request_trace:
+            handle_industry_assistant(...)  # 期间的 LlamaIndex 事件记录为 span
+        request_trace.finish(interaction_id, path=...)
+
+    span 的 start_ms 为相对链路开始的毫秒数，parent_id 为None表示直接挂在请求下
+    """
+
+    sampled = True
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = local_now()
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.spans: List[Dict[str, Any]] = []
+        self.duration_ms: Optional[float] = None
+        self.interaction_id: Optional[int] = None
+        self._t0 = time.perf_counter()
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._tokens: List[Any] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._tokens.append(_current_trace.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._tokens.pop())
+        return False
+
+    def offset_ms(self) -> float:
+        """当前时间相对链路开始的毫秒数"""
+        return (time.perf_counter() - self._t0) * 1000
+
+    def start_span(self, span_id: str, span_type: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        """开始一个 span（由回调处理器调用）"""
+        span = {"span_id": span_id, "parent_id": parent_id, "type": span_type,
+                "start_ms": self.offset_ms(), "duration_ms": None, "attributes": attributes}
+        with self._lock:
+            self._open[span_id] = span
+            self.spans.append(span)
+
+    def end_span(self, span_id: str, attributes: Dict[str, Any]) -> None:
+        """结束一个 span（由回调处理器调用）"""
+        now = self.offset_ms()
+        with self._lock:
+            span = self._open.pop(span_id, None)
+        if span is None:
+            return
+        span["duration_ms"] = now - span["start_ms"]
+        span["attributes"].update(attributes)
+
+    def add_span(self, span_type: str, start_ms: float, duration_ms: float, attributes: Optional[Dict[str, Any]] = None,
+                 parent_id: Optional[str] = None) -> None:
+        """
+        添加一个已结束的 span（LlamaIndex 之外的调用，如通用助手的 LLM 请求）
+
+        Args:
+            span_type: span 类型
+            start_ms: 相对链路开始的毫秒数（offset_ms() 的返回值）
+            duration_ms: 耗时（毫秒）
+            attributes: 大小、模型等属性
+            parent_id: 父 span ID
+        """
+        span = {"span_id": uuid.uuid4().hex, "parent_id": parent_id, "type": span_type,
+                "start_ms": start_ms, "duration_ms": duration_ms, "attributes": dict(attributes or {})}
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, interaction_id: Optional[int] = None, **attributes: Any) -> None:
+        """
+        结束链路并交给后台线程写入（重复调用无效）
+
+        Args:
+            interaction_id: 交互ID（写后队列的临时ID在写入时解析为实际ID）
+            attributes: 附加属性（如 path、stages）
+        """
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = self.offset_ms()
+        self.interaction_id = interaction_id
+        self.attributes.update(attributes)
+        with self._lock:
+            # 流式生成中途出错等情况下未结束的 span 截止到链路结束
+            for span in self._open.values():
+                span["duration_ms"] = self.duration_ms - span["start_ms"]
+                span["attributes"]["unfinished"] = True
+            self._open.clear()
+        get_trace_recorder().submit(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为写入文件的字典（在后台线程中调用）"""
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0.0, 2),
+            "interaction_id": self.interaction_id,
+            "attributes": self.attributes,
+            "spans": [
+                dict(span, start_ms=round(span["start_ms"], 2),
+                     duration_ms=round(span["duration_ms"], 2) if span["duration_ms"] is not None else None)
+                for span in self.spans
+            ],
+        }
+
+
+def start_request_trace(name: str, force: bool = False, **attributes: Any) -> Any:
+    """
+    开始一个请求链路（头部采样：是否记录在请求开始时决定）
+
+    Args:
+        name: 链路名称（如 industry / general）
+        force: 是否忽略采样率强制记录（仍受总开关控制）
+        attributes: 链路属性
+
+    Returns:
+        RequestTrace: 需要记录时返回链路，否则返回空实现 NULL_TRACE
+    """
+    tracing_config = get_tracing_config()
+    if not tracing_config["enabled"]:
+        return NULL_TRACE
+    if not force and random.random() >= float(tracing_config["sample_rate"]):
+        TRACES_TOTAL.labels("unsampled").inc()
+        return NULL_TRACE
+    return RequestTrace(name, attributes)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """获取当前请求的链路（未采样或不在请求中时为None）"""
+    return _current_trace.get()
+
+
+class LocalTraceHandler(BaseCallbackHandler):
+    """
+    LlamaIndex 回调处理器：把当前请求链路中的事件记录为 span
+
+    不在请求链路中（如启动时构建索引）或请求未被采样时直接返回
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.start_span(
+                event_id,
+                getattr(event_type, "value", str(event_type)),
+                None if parent_id in ("", BASE_TRACE_EVENT) else parent_id,
+                _payload_attributes(payload),
+            )
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.end_span(event_id, _payload_attributes(payload))
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
+
+
+class TraceRecorder:
+    """
+    链路缓冲与批量写入
+
+    - submit() 只把链路放入有界缓冲区，达到 batch_size 时唤醒后台线程
+    - 后台线程每 flush_interval_seconds 秒（或攒够一批时）序列化并追加到当天的 JSONL 文件，并删除过期文件
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or get_tracing_config()
+        self.output_dir = config["output_dir"]
+        self.batch_size = max(1, int(config["batch_size"]))
+        self.flush_interval = float(config["flush_interval_seconds"])
+        self.retention_days = int(config["retention_days"])
+        self._buffer: deque = deque(maxlen=max(1, int(config["max_buffer"])))
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        _metrics.register_callback(
+            "tracing_buffer_depth", "gauge", "等待写入的链路数", lambda: {(): len(self._buffer)}
+        )
+
+    def submit(self, trace: RequestTrace) -> None:
+        """提交已结束的链路（缓冲区满时丢弃最旧的链路）"""
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                TRACES_TOTAL.labels("dropped").inc()
+            self._buffer.append(trace)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="trace-recorder")
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._buffer) >= self.batch_size, timeout=self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        立即写入缓冲区中的链路
+
+        Returns:
+            int: 写入的链路数
+        """
+        with self._cond:
+            batch = list(self._buffer)
+            self._buffer.clear()
+        if not batch:
+            return 0
+        with self._write_lock:
+            try:
+                self._write(batch)
+            except Exception as e:
+                TRACES_TOTAL.labels("failed").inc(len(batch))
+                logger.error(f"写入链路文件失败（{len(batch)} 条）: {e}", exc_info=True)
+                return 0
+        TRACES_TOTAL.labels("written").inc(len(batch))
+        return len(batch)
+
+    def _write(self, batch: List[RequestTrace]) -> None:
+        from src.interaction_logger import resolve_interaction_id
+        os.makedirs(self.output_dir, exist_ok=True)
+        lines_by_file: Dict[str, List[str]] = {}
+        for trace in batch:
+            if trace.interaction_id is not None and trace.interaction_id < 0:
+                trace.interaction_id = resolve_interaction_id(trace.interaction_id, timeout=1.0)
+            day = trace.started_at[:10].replace("-", "")
+            path = os.path.join(self.output_dir, f"{TRACE_FILE_PREFIX}{day}{TRACE_FILE_SUFFIX}")
+            lines_by_file.setdefault(path, []).append(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+        for path, lines in lines_by_file.items():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        self._prune()
+
+    def _prune(self) -> None:
+        cutoff = (datetime.strptime(local_now(), "%Y-%m-%d %H:%M:%S") - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for name in _trace_files(self.output_dir):
+            if name[len(TRACE_FILE_PREFIX):-len(TRACE_FILE_SUFFIX)] < cutoff:
+                try:
+                    os.remove(os.path.join(self.output_dir, name))
+                except OSError:
+                    pass
+
+
+def _trace_files(output_dir: str) -> List[str]:
+    """链路文件名列表（按日期升序）"""
+    try:
+        names = os.listdir(output_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.startswith(TRACE_FILE_PREFIX) and name.endswith(TRACE_FILE_SUFFIX))
+
+
+def load_traces(
+    output_dir: Optional[str] = None,
+    limit: int = 200,
+    name: Optional[str] = None,
+    min_duration_ms: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    读取最近的链路（链路查看页面使用）
+
+    Args:
+        output_dir: 链路文件目录，None 表示使用配置
+        limit: 最多返回的链路数
+        name: 只返回该名称的链路
+        min_duration_ms: 只返回耗时不低于该值的链路
+
+    Returns:
+        List[dict]: 链路字典列表，最新的在前
+    """
+    output_dir = output_dir or get_tracing_config()["output_dir"]
+    traces: List[Dict[str, Any]] = []
+    for file_name in reversed(_trace_files(output_dir)):
+        try:
+            with open(os.path.join(output_dir, file_name), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                continue  # 进程退出时可能留下不完整的最后一行
+            if name and trace.get("name") != name:
+                continue
+            if min_duration_ms is not None and (trace.get("duration_ms") or 0) < min_duration_ms:
+                continue
+            traces.append(trace)
+            if len(traces) >= limit:
+                return traces
+    return traces
+
+
+# 全局链路记录器与回调处理器实例
+_trace_recorder = None
+_trace_handler = None
+_tracing_lock = threading.Lock()
+
+def get_trace_recorder() -> TraceRecorder:
+    """获取链路记录器实例（单例模式）"""
+    global _trace_recorder
+    if _trace_recorder is None:
+        with _tracing_lock:
+            if _trace_recorder is None:
+                _trace_recorder = TraceRecorder()
+                atexit.register(_trace_recorder.flush)
+    return _trace_recorder
+
+
+def get_trace_handler() -> Optional[LocalTraceHandler]:
+    """
+    获取本地链路追踪回调处理器（单例模式）
+
+    Returns:
+        LocalTraceHandler: 未启用链路追踪时返回None
+    """
+    global _trace_handler
+    if not get_tracing_config()["enabled"]:
+        return None
+    if _trace_handler is None:
+        with _tracing_lock:
+            if _trace_handler is None:
+                _trace_handler = LocalTraceHandler()
+                logger.info("✅ 本地链路追踪已启用")
+    return _trace_handler
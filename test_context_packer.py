@@ -0,0 +1,58 @@
+# test_context_packer.py
+import sys
+from pathlib import Path
+
+# --- Setup Project Path ---
+project_root = Path(__file__).resolve().parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from llama_index.core.schema import TextNode, NodeWithScore, MetadataMode
+
+from src.context_packer import ContextPacker, count_tokens, get_last_pack_stats
+
+
+def _pack(packer, *chunks):
+    """chunks: (文本, 元数据, 分数)"""
+    nodes = [NodeWithScore(node=TextNode(text=text, metadata=metadata), score=score) for text, metadata, score in chunks]
+    return nodes, packer.postprocess_nodes(nodes)
+
+
+def test_single_sentence_chunk_is_truncated_to_budget():
+    """没有句末标点的大分块（如 PDF、表格抽取结果）只有一个句子，截断后不能回退为原文"""
+    text = "表格单元格内容" * 300
+    nodes, packed = _pack(ContextPacker(token_budget=100), (text, {}, 0.9))
+
+    assert len(packed) == 1
+    packed_text = packed[0].node.get_content(metadata_mode=MetadataMode.NONE)
+    assert packed_text and packed_text != text
+    assert count_tokens(packed_text) <= 100
+    assert get_last_pack_stats()["tokens_after"] <= 100
+    # 原始节点不被修改
+    assert nodes[0].node.text == text
+
+
+def test_top_chunk_kept_when_metadata_exceeds_budget():
+    """元数据本身超出预算时仍保留最相关分块的正文，context_str 不为空"""
+    metadata = {"file_name": "很长的文件名" * 40}
+    _, packed = _pack(
+        ContextPacker(token_budget=50),
+        ("第一条相关内容。第二条相关内容。", metadata, 0.9),
+        ("次要内容。", metadata, 0.5),
+    )
+
+    assert len(packed) == 1
+    assert "第一条相关内容" in packed[0].node.get_content(metadata_mode=MetadataMode.NONE)
+
+
+def test_dropped_chunk_does_not_dedupe_later_sentences():
+    """被截断后丢弃的分块中的句子不算已出现，后面分块中的相同句子仍保留"""
+    _, packed = _pack(
+        ContextPacker(token_budget=60, min_chunk_tokens=32),
+        ("甲" * 60 + "。", {}, 0.9),
+        ("共享句子。" + "乙" * 200 + "。", {}, 0.8),
+        ("共享句子。", {}, 0.7),
+    )
+
+    texts = [node.node.get_content(metadata_mode=MetadataMode.NONE) for node in packed]
+    assert "共享句子。" in texts
@@ -25,7 +25,6 @@ if _nltk_data_dir not in nltk.data.path:
 
 import streamlit.components.v1 as components
 import sys
-from pathlib import Path
 import logging
 
 # 将项目根目录添加到Python路径中
@@ -33,13 +32,15 @@ from src.utils import setup_project_path
 setup_project_path()
 
 from src.retriever import RAGManager
+from config.load_key import get_config_version
 
 # --- RAG管理器加载函数 ---
-@st.cache_resource
-def load_rag_manager(_cache_key=None):
+@st.cache_resource(max_entries=1)
+def load_rag_manager(cache_key=None):
     """
     加载RAG管理器
-    使用缓存键确保配置改变时重新加载
+    使用缓存键确保配置改变时重新加载（参数名不能以下划线开头，否则 Streamlit 不将其计入缓存键）；
+    只保留最新的一个实例，旧实例在进行中的请求结束后被释放
     """
     try:
         from llama_index.embeddings.dashscope import DashScopeEmbedding
@@ -47,12 +48,12 @@ def load_rag_manager(_cache_key=None):
         pass
     return RAGManager()
 
+# RAG管理器依赖的配置段，其他配置段（如 routing）变化时不需要重建
+RAG_MANAGER_CONFIG_SECTIONS = ("api_keys", "models", "http", "embedding", "rag", "monitoring", "default_llm", "priority_order")
+
 def get_rag_manager_cache_key():
-    """生成缓存键，基于配置文件的修改时间"""
-    config_file = Path(__file__).parent / "config" / "config.json"
-    if config_file.exists():
-        return str(config_file.stat().st_mtime)
-    return "default"
+    """生成缓存键，基于内存配置快照中相关配置段的版本号（不做文件I/O）"""
+    return str(get_config_version(*RAG_MANAGER_CONFIG_SECTIONS))
 
 # --- 页面配置 (必须是第一个st命令) ---
 st.set_page_config(
@@ -66,10 +67,14 @@ st.set_page_config(
 from config.load_key import load_key
 load_key()
 
+# --- 启动Prometheus指标导出（monitoring.metrics.enabled 为 true 时，每个进程只启动一次）---
+from src.metrics import start_metrics_exporter
+start_metrics_exporter()
+
 # --- 预加载RAG管理器 ---
 try:
     cache_key = get_rag_manager_cache_key()
-    load_rag_manager(_cache_key=cache_key)
+    load_rag_manager(cache_key=cache_key)
 except Exception as e:
     logging.warning(f"无法在首页预加载RAG管理器: {e}")
 